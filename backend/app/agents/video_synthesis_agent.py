@@ -2,7 +2,6 @@
 
 from typing import Dict, Any, List
 from .base_agent import BaseAgent
-from moviepy.editor import ImageClip, concatenate_videoclips, AudioFileClip, CompositeVideoClip
 import os
 
 
@@ -12,6 +11,8 @@ class VideoSynthesisAgent(BaseAgent):
     def __init__(self, config: Dict[str, Any] = None):
         super().__init__("VideoSynthesisAgent", config)
         self.output_dir = config.get('output_dir', 'output/videos') if config else 'output/videos'
+        # 合成渲染器：ffmpeg（单个 filter_complex 图流式编码，默认）或 moviepy（逐帧合成，旧路径）
+        self.renderer = (config or {}).get('synthesis_renderer', 'ffmpeg')
         
     async def execute(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         
@@ -104,7 +105,81 @@ class VideoSynthesisAgent(BaseAgent):
                 # 返回模拟的视频路径和时长
                 return output_path, 60.0  # 模拟60秒视频
             
-            # 实际视频合成逻辑（保留原有代码）
+            if self.renderer == 'ffmpeg':
+                from app.services.ffmpeg_service import _find_exe
+                
+                if self.config.get('ffmpeg_path') or _find_exe('ffmpeg'):
+                    return self._synthesize_video_ffmpeg(images, narration_audio, background_music, output_path)
+                self.logger.warning("未找到 ffmpeg，回退到 MoviePy 合成")
+            
+            return self._synthesize_video_moviepy(images, narration_audio, background_music, output_path)
+            
+        except Exception as e:
+            self.logger.error(f"视频合成失败: {str(e)}")
+            raise
+    
+    def _synthesize_video_ffmpeg(
+        self,
+        images: List[Dict],
+        narration_audio: str,
+        background_music: str,
+        output_path: str
+    ) -> tuple:
+        """使用 ffmpeg filter_complex 一次性渲染（不在 Python 中解码帧）"""
+        from app.services.ffmpeg_renderer import FFmpegSlideshowRenderer
+        
+        self.logger.info("开始视频合成（FFmpeg）...")
+        
+        shots = []
+        temp_images = []
+        for idx, img_data in enumerate(images):
+            try:
+                image_url = img_data.get('image_url', '')
+                shot_id = img_data.get('shot_id', idx)
+                self.logger.info(f"处理镜头 {shot_id}: {image_url}")
+                
+                img_path = self._download_image(image_url, shot_id)
+                if img_path != image_url.replace('file://', ''):
+                    temp_images.append(img_path)
+                shots.append({'path': img_path, 'duration': img_data.get('duration', 3.0)})
+            except Exception as e:
+                self.logger.error(f"处理镜头 {idx} 失败: {str(e)}")
+                continue
+        
+        if not shots:
+            raise Exception("没有可用的图像片段")
+        
+        renderer = FFmpegSlideshowRenderer({
+            **self.config.get('ffmpeg_renderer', {}),
+            'ffmpeg_path': self.config.get('ffmpeg_path'),
+        })
+        try:
+            video_path, total_duration = renderer.render(
+                shots,
+                narration_audio if narration_audio and os.path.exists(narration_audio) else None,
+                background_music if background_music and os.path.exists(background_music) else None,
+                output_path
+            )
+        finally:
+            for temp_img in temp_images:
+                try:
+                    if os.path.exists(temp_img):
+                        os.remove(temp_img)
+                except OSError:
+                    pass
+        
+        self.logger.info(f"视频合成完成！总时长: {total_duration:.2f}秒")
+        return video_path, total_duration
+    
+    def _synthesize_video_moviepy(
+        self,
+        images: List[Dict],
+        narration_audio: str,
+        background_music: str,
+        output_path: str
+    ) -> tuple:
+        """MoviePy 逐帧合成（旧路径，保留用于回退与基准对比）"""
+        try:
             from moviepy.editor import (
                 ImageClip, concatenate_videoclips, AudioFileClip,
                 CompositeAudioClip, CompositeVideoClip
@@ -129,7 +204,8 @@ class VideoSynthesisAgent(BaseAgent):
                     
                     # 下载图像
                     img_path = self._download_image(image_url, shot_id)
-                    temp_images.append(img_path)
+                    if img_path != image_url.replace('file://', ''):
+                        temp_images.append(img_path)
                     
                     # 创建图像片段
                     clip = ImageClip(img_path).set_duration(duration)
@@ -157,7 +157,10 @@ def analyze_video(recreation_id):
         video_analyzer = EfficientVideoAnalyzerWithHighlights()
 
         print(f"[视频分析] 开始高效分析视频: {video_path} (lang={lang})")
-        result = asyncio.run(video_analyzer.analyze_video_complete(video_path=video_path, lang=lang))
+        analysis_mode = data.get('analysis_mode') if isinstance(data, dict) else None
+        result = asyncio.run(
+            video_analyzer.analyze_video_complete(video_path=video_path, lang=lang, mode=analysis_mode)
+        )
 
         if not result.get('success'):
             return jsonify({
@@ -1,16 +1,24 @@
 """
 高效视频分析：先通过多模态模型理解视频，再调用 EnhancedVideoAnalyzer 提炼亮点与教育意义。
 供 frontend_pipeline `/analyze-video` 使用。
+
+长视频可走分段模式：按镜头切换切成若干段并发理解，再合并为一份理解文本（map-reduce）。
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
 import re
+import sys
 import time
 from typing import Any, Dict, List, Optional
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from app.utils.dashscope_upload_cache import get_upload_cache, oss_request_kwargs
+
 logger = logging.getLogger(__name__)
 
 # 教育意义摘要略放宽，避免一句话被截断在关键处（仍偏短，适合列表展示）
@@ -254,12 +262,49 @@ def _dashscope_key() -> str:
         return os.environ.get('DASHSCOPE_API_KEY', '')
 
 
+def _analysis_setting(name: str, default: Any) -> Any:
+    try:
+        from config import Config
+
+        return getattr(Config, name, default)
+    except Exception:
+        return default
+
+
+async def _build_analysis_proxy(video_path: str) -> Optional[str]:
+    """为上传视频生成（或复用）低码率分析代理；未启用或失败时返回 None。"""
+    try:
+        if not _analysis_setting('ANALYSIS_PROXY_ENABLED', True):
+            return None
+        from app.services.ffmpeg_service import FFmpegService
+
+        return await FFmpegService().build_analysis_proxy(
+            video_path,
+            short_side=_analysis_setting('ANALYSIS_PROXY_SHORT_SIDE', 480),
+            fps=_analysis_setting('ANALYSIS_PROXY_FPS', 2),
+            video_bitrate=_analysis_setting('ANALYSIS_PROXY_VIDEO_BITRATE', '400k'),
+        )
+    except Exception as e:
+        logger.warning('分析代理不可用，使用原始视频: %s', e)
+        return None
+
+
+def _fmt_ts(seconds: float) -> str:
+    seconds = max(0, int(seconds))
+    return f'{seconds // 60:02d}:{seconds % 60:02d}'
+
+
 def _understand_video_with_qwen_vl(
     video_path: str,
     debug_prompts: Optional[List[Dict[str, Any]]] = None,
     lang: str = 'zh',
+    segment: Optional[Dict[str, Any]] = None,
 ) -> str:
-    """使用 DashScope 多模态模型理解本地视频，返回长文本描述（语言由 lang 约束）。"""
+    """
+    使用 DashScope 多模态模型理解本地视频，返回长文本描述（语言由 lang 约束）。
+
+    segment 不为空时表示这是长视频的一个分段（index / total / start / end），提示词中会说明其位置。
+    """
     import dashscope
 
     from app.utils.prompt_trace import trace
@@ -273,8 +318,6 @@ def _understand_video_with_qwen_vl(
     if not os.path.isfile(abs_path):
         raise FileNotFoundError(abs_path)
 
-    from dashscope import MultiModalConversation
-
     if lang == 'en':
         user_text = (
             'Watch the video carefully and summarize in English: 1) Main plot (who, what, outcome); '
@@ -286,6 +329,20 @@ def _understand_video_with_qwen_vl(
             '请详细观看并概括该视频：1）主要情节（谁、做了什么、结果）；2）人物与场景；'
             '3）画面风格与节奏；4）你觉得好看的片段。用中文分段输出，语言通俗、少堆砌形容词，便于后续改编。'
         )
+    if segment:
+        span = ''
+        if segment.get('end') is not None:
+            span = f"{_fmt_ts(segment['start'])}-{_fmt_ts(segment['end'])}"
+        if lang == 'en':
+            user_text = (
+                f"This clip is part {segment['index']} of {segment['total']} of a longer video"
+                f"{f' ({span})' if span else ''}. Describe only what happens in this clip. " + user_text
+            )
+        else:
+            user_text = (
+                f"这是一个长视频的第 {segment['index']}/{segment['total']} 段"
+                f"{f'（{span}）' if span else ''}，只描述本段发生的内容。" + user_text
+            )
     if debug_prompts is not None:
         debug_prompts.append(
             trace(
@@ -293,11 +350,12 @@ def _understand_video_with_qwen_vl(
                 '多模态视频理解',
                 user=user_text,
                 model='qwen-vl-plus',
-                extra={'video_file': os.path.basename(abs_path)},
+                extra={'video_file': os.path.basename(abs_path), 'segment': segment},
             )
         )
 
-    video_uri = f'file://{abs_path}'
+    # 同一文件在有效期内只上传一次，重复分析直接复用 oss:// 地址
+    video_uri = get_upload_cache().resolve(abs_path, 'qwen-vl-plus')
     messages = [
         {
             'role': 'user',
@@ -308,10 +366,18 @@ def _understand_video_with_qwen_vl(
         }
     ]
 
+    return _call_qwen_vl(messages)
+
+
+def _call_qwen_vl(messages: List[Dict[str, Any]]) -> str:
+    """调用 qwen-vl-plus 并拼接返回的文本块。"""
+    from dashscope import MultiModalConversation
+
     rsp = MultiModalConversation.call(
         model='qwen-vl-plus',
         messages=messages,
         result_format='message',
+        **oss_request_kwargs(messages=messages),
     )
     if rsp.status_code != 200:
         raise RuntimeError(getattr(rsp, 'message', None) or f'API错误 {rsp.status_code}')
@@ -332,6 +398,209 @@ def _understand_video_with_qwen_vl(
     return out
 
 
+def _understand_keyframes_with_qwen_vl(
+    keyframes: List[Dict[str, Any]],
+    debug_prompts: Optional[List[Dict[str, Any]]] = None,
+    lang: str = 'zh',
+) -> str:
+    """把按时间排序的镜头关键帧作为图片列表交给多模态模型理解，返回长文本描述。"""
+    import dashscope
+
+    from app.utils.prompt_trace import trace
+
+    api_key = _dashscope_key()
+    if not api_key:
+        raise RuntimeError('未配置 DASHSCOPE_API_KEY')
+    dashscope.api_key = api_key
+
+    times = '、'.join(_fmt_ts(k['timestamp']) for k in keyframes)
+    if lang == 'en':
+        user_text = (
+            f'These {len(keyframes)} images are keyframes taken in order from consecutive shots of one video '
+            f'(timestamps: {times}). Infer the video and summarize in English: 1) Main plot (who, what, outcome); '
+            '2) Characters and settings; 3) Visual style and pacing; 4) Most engaging moments. '
+            'Use clear sections; plain language, minimal purple prose, for downstream adaptation.'
+        )
+    else:
+        user_text = (
+            f'以下 {len(keyframes)} 张图片是按时间顺序从同一视频各个镜头中抽取的关键帧（时间点：{times}）。'
+            '请据此还原并概括该视频：1）主要情节（谁、做了什么、结果）；2）人物与场景；'
+            '3）画面风格与节奏；4）你觉得好看的片段。用中文分段输出，语言通俗、少堆砌形容词，便于后续改编。'
+        )
+    if debug_prompts is not None:
+        debug_prompts.append(
+            trace(
+                'education_expert',
+                '多模态关键帧理解',
+                user=user_text,
+                model='qwen-vl-plus',
+                extra={'keyframes': [os.path.basename(k['path']) for k in keyframes]},
+            )
+        )
+
+    cache = get_upload_cache()
+    content: List[Dict[str, Any]] = [{'image': cache.resolve(k['path'], 'qwen-vl-plus')} for k in keyframes]
+    content.append({'text': user_text})
+    return _call_qwen_vl([{'role': 'user', 'content': content}])
+
+
+async def _understand_video_by_keyframes(
+    video_path: str,
+    debug_prompts: Optional[List[Dict[str, Any]]] = None,
+    lang: str = 'zh',
+) -> tuple[str, int]:
+    """关键帧模式：本地检测镜头切换，只把各镜头关键帧发给模型。返回 (理解文本, 关键帧数)。"""
+    from app.services.keyframe_sampler import sample_shot_keyframes
+    from video_consistency_agent.utils.scratch_space import get_scratch_space
+
+    with get_scratch_space().job('analysis_keyframes', small=True) as scratch:
+        keyframes = await asyncio.to_thread(
+            sample_shot_keyframes,
+            video_path,
+            scratch.path,
+            max_frames=int(_analysis_setting('ANALYSIS_KEYFRAME_MAX', 16)),
+        )
+        if not keyframes:
+            raise RuntimeError('未能提取关键帧')
+        text = await asyncio.to_thread(_understand_keyframes_with_qwen_vl, keyframes, debug_prompts, lang)
+    return text, len(keyframes)
+
+
+def _plan_segment_cuts(duration: float, scene_times: List[float], target: float) -> List[float]:
+    """
+    规划分段切点：每段长度尽量接近 target，切点优先吸附到 [0.5, 1.5] × target 范围内最近的镜头切换处，
+    范围内没有镜头切换时按 target 硬切。
+    """
+    cuts: List[float] = []
+    if duration <= 0 or target <= 0:
+        return cuts
+    lo, hi = target * 0.5, target * 1.5
+    start = 0.0
+    while duration - start > hi:
+        window = [t for t in scene_times if start + lo <= t <= start + hi]
+        cut = min(window, key=lambda t: abs(t - (start + target))) if window else start + target
+        cuts.append(round(cut, 3))
+        start = cut
+    return cuts
+
+
+def _merge_segment_descriptions(
+    parts: List[tuple[Dict[str, Any], str]],
+    debug_prompts: Optional[List[Dict[str, Any]]] = None,
+    lang: str = 'zh',
+) -> str:
+    """把各分段理解合并为一份完整理解：优先用 qwen-plus 归并，失败时按时间顺序拼接。"""
+    blocks = []
+    for seg, desc in parts:
+        span = f"{_fmt_ts(seg['start'])}-{_fmt_ts(seg['end'])}" if seg.get('end') is not None else ''
+        if lang == 'en':
+            title = f"[Part {seg['index']}{f' {span}' if span else ''}]"
+        else:
+            title = f"【第 {seg['index']} 段{f' {span}' if span else ''}】"
+        blocks.append(f'{title}\n{desc.strip()}')
+    joined = '\n\n'.join(blocks)
+    if len(parts) == 1:
+        return parts[0][1]
+
+    try:
+        from dashscope import Generation
+
+        from app.utils.prompt_trace import trace
+
+        if lang == 'en':
+            prompt = (
+                'Below are descriptions of consecutive parts of ONE video, in order. Merge them into a single '
+                'English summary of the whole video with the same sections: 1) Main plot; 2) Characters and '
+                'settings; 3) Visual style and pacing; 4) Most engaging moments. Keep characters consistent '
+                'across parts and do not mention the parts themselves.\n\n' + joined
+            )
+        else:
+            prompt = (
+                '以下是同一个视频按时间顺序分段得到的描述。请合并为对整个视频的一份中文概括，沿用同样的结构：'
+                '1）主要情节；2）人物与场景；3）画面风格与节奏；4）好看的片段。前后出现的同一人物要统一称呼，'
+                '不要提及“分段”本身。\n\n' + joined
+            )
+        if debug_prompts is not None:
+            debug_prompts.append(
+                trace(
+                    'education_expert',
+                    '分段理解合并',
+                    user=prompt,
+                    model='qwen-plus-latest',
+                    extra={'segments': len(parts)},
+                )
+            )
+        rsp = Generation.call(
+            model='qwen-plus-latest',
+            api_key=_dashscope_key() or None,
+            messages=[{'role': 'user', 'content': prompt}],
+            result_format='message',
+            temperature=0.3,
+            max_tokens=3000,
+        )
+        if rsp.status_code == 200 and rsp.output and rsp.output.choices:
+            merged = (rsp.output.choices[0].message.content or '').strip()
+            if merged:
+                return merged
+        logger.warning('分段合并失败，改为按时间顺序拼接: %s', getattr(rsp, 'message', rsp.status_code))
+    except Exception as e:
+        logger.warning('分段合并失败，改为按时间顺序拼接: %s', e)
+    return joined
+
+
+async def _understand_video_segmented(
+    video_path: str,
+    debug_prompts: Optional[List[Dict[str, Any]]] = None,
+    lang: str = 'zh',
+) -> str:
+    """长视频 map-reduce 理解：镜头感知切分 → 各段并发调用多模态模型 → 合并为一份理解文本。"""
+    from app.services.ffmpeg_service import FFmpegService
+
+    ffmpeg = FFmpegService()
+    info = await ffmpeg.get_video_info(video_path)
+    duration = float(info.get('duration') or 0)
+    if duration <= 0:
+        raise RuntimeError('无法读取视频时长，不能分段')
+
+    target = float(_analysis_setting('ANALYSIS_SEGMENT_TARGET', 60))
+    scene_times = await ffmpeg.detect_scene_changes(video_path)
+    cuts = _plan_segment_cuts(duration, scene_times, target)
+    if not cuts:
+        return await asyncio.to_thread(_understand_video_with_qwen_vl, video_path, debug_prompts, lang)
+
+    with ffmpeg.scratch.job('analysis_segments') as scratch:
+        segment_paths = await ffmpeg.split_video(video_path, cuts, scratch.path)
+        if not segment_paths:
+            raise RuntimeError('视频分段失败')
+        bounds = [0.0] + cuts + [duration]
+        known_bounds = len(bounds) == len(segment_paths) + 1
+        logger.info('[分段理解] 时长 %.1fs，%d 个镜头切换，切分为 %d 段', duration, len(scene_times), len(segment_paths))
+
+        semaphore = asyncio.Semaphore(max(1, int(_analysis_setting('ANALYSIS_SEGMENT_CONCURRENCY', 4))))
+
+        async def _understand_one(idx: int, path: str) -> tuple[Dict[str, Any], str]:
+            segment = {
+                'index': idx + 1,
+                'total': len(segment_paths),
+                'start': bounds[idx] if known_bounds else None,
+                'end': bounds[idx + 1] if known_bounds else None,
+            }
+            async with semaphore:
+                try:
+                    text = await asyncio.to_thread(_understand_video_with_qwen_vl, path, debug_prompts, lang, segment)
+                except Exception as e:
+                    logger.warning('[分段理解] 第 %d 段失败: %s', idx + 1, e)
+                    text = ''
+            return segment, text
+
+        results = await asyncio.gather(*(_understand_one(i, p) for i, p in enumerate(segment_paths)))
+
+    parts = [(seg, text) for seg, text in results if text]
+    if not parts:
+        raise RuntimeError('所有分段理解均失败')
+    return await asyncio.to_thread(_merge_segment_descriptions, parts, debug_prompts, lang)
+
+
 class EfficientVideoAnalyzerWithHighlights:
     """
     与 pipeline 约定：`analyze_video_complete(video_path=...)` 返回 dict，
@@ -341,11 +610,38 @@ class EfficientVideoAnalyzerWithHighlights:
     def __init__(self, api_key: str | None = None):
         self.api_key = api_key or _dashscope_key()
 
-    async def analyze_video_complete(self, video_path: str, lang: str = 'zh') -> Dict[str, Any]:
+    async def analyze_video_complete(
+        self, video_path: str, lang: str = 'zh', mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Args:
+            mode: full（整段理解）/ segmented（分段并发理解后合并）/ keyframes（本地镜头检测后只发关键帧）/
+                auto（时长超过 ANALYSIS_SEGMENT_THRESHOLD 走分段）；为空时取 Config.ANALYSIS_MODE
+        """
         t0 = time.time()
         debug_prompts: List[Dict[str, Any]] = []
+        raw_content = ''
+        keyframes_count = 0
+        mode = (mode or _analysis_setting('ANALYSIS_MODE', 'full') or 'full').lower()
+        proxy_path = None
+        if mode == 'keyframes':
+            # 关键帧模式直接在原片上检测镜头（只解码采样帧），无需先转码代理
+            try:
+                raw_content, keyframes_count = await _understand_video_by_keyframes(video_path, debug_prompts, lang)
+            except Exception as e:
+                logger.warning('关键帧理解失败，改用整段理解: %s', e)
+        if not raw_content:
+            # 先转码出低分辨率代理再交给多模态模型，减少上传体积与模型耗时；代理不可用或调用失败时回退原片
+            proxy_path = await _build_analysis_proxy(video_path)
+            mode = await self._resolve_mode(mode, proxy_path or video_path)
+        if not raw_content and mode == 'segmented':
+            try:
+                raw_content = await _understand_video_segmented(proxy_path or video_path, debug_prompts, lang=lang)
+            except Exception as e:
+                logger.warning('分段理解失败，改用整段理解: %s', e)
         try:
-            raw_content = _understand_video_with_qwen_vl(video_path, debug_prompts, lang=lang)
+            if not raw_content:
+                raw_content = self._understand_full(video_path, proxy_path, debug_prompts, lang)
         except Exception as e:
             logger.exception('视频多模态理解失败: %s', e)
             return {
@@ -389,7 +685,7 @@ class EfficientVideoAnalyzerWithHighlights:
                 'highlights': highlights or _empty_hi(lang),
                 'educational_meaning': educational_brief or _empty_edu(lang),
                 'educational_points': educational_points,
-                'keyframes_count': 0,
+                'keyframes_count': keyframes_count,
                 'time_cost': elapsed,
                 'transcription': inner.get('structured_summary', '') or '',
                 'debug_prompts': debug_prompts,
@@ -401,8 +697,33 @@ class EfficientVideoAnalyzerWithHighlights:
             'highlights': _empty_hi(lang),
             'educational_meaning': _empty_edu(lang),
             'educational_points': [],
-            'keyframes_count': 0,
+            'keyframes_count': keyframes_count,
             'time_cost': elapsed,
             'transcription': '',
             'debug_prompts': debug_prompts,
         }
+
+    @staticmethod
+    def _understand_full(
+        video_path: str, proxy_path: Optional[str], debug_prompts: List[Dict[str, Any]], lang: str
+    ) -> str:
+        """整段理解：优先使用分析代理，代理调用失败时回退原始视频。"""
+        if proxy_path:
+            try:
+                return _understand_video_with_qwen_vl(proxy_path, debug_prompts, lang=lang)
+            except Exception as e:
+                logger.warning('代理视频理解失败，改用原始视频: %s', e)
+        return _understand_video_with_qwen_vl(video_path, debug_prompts, lang=lang)
+
+    async def _resolve_mode(self, mode: Optional[str], video_path: str) -> str:
+        mode = (mode or _analysis_setting('ANALYSIS_MODE', 'full') or 'full').lower()
+        if mode != 'auto':
+            return mode if mode in ('full', 'segmented') else 'full'
+        try:
+            from app.services.ffmpeg_service import FFmpegService
+
+            info = await FFmpegService().get_video_info(video_path)
+            duration = float(info.get('duration') or 0)
+        except Exception:
+            return 'full'
+        return 'segmented' if duration > float(_analysis_setting('ANALYSIS_SEGMENT_THRESHOLD', 180)) else 'full'
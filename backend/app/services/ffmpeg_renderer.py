@@ -0,0 +1,202 @@
+"""
+FFmpeg 原生合成渲染器（VideoSynthesisAgent 使用）
+
+把「分镜图 + 时长 + 转场 + 旁白 + 背景音乐」一次性编译为单个 ffmpeg filter_complex 图，
+由 ffmpeg 直接流式编码输出，不再在 Python 中逐帧解码 / 合成（MoviePy 路径）。
+"""
+
+import logging
+import os
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.ffmpeg_service import _find_exe
+from video_consistency_agent.utils.media_scheduler import (
+    JOB_CLASS_TRANSCODE,
+    PRIORITY_NORMAL,
+    get_media_scheduler,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegSlideshowRenderer:
+    """将镜头图片序列渲染为带 xfade 转场、旁白与循环压低背景音乐的成片。"""
+
+    def __init__(self, config: Dict[str, Any] | None = None):
+        config = config or {}
+        self.ffmpeg_path = config.get('ffmpeg_path') or _find_exe('ffmpeg') or 'ffmpeg'
+        self.width = int(config.get('width', 1920))
+        self.height = int(config.get('height', 1080))
+        self.fps = int(config.get('fps', 30))
+        self.transition = config.get('transition', 'fade')
+        self.transition_duration = float(config.get('transition_duration', 0.5))
+        self.music_volume = float(config.get('music_volume', 0.3))
+        # 旁白出现时背景音乐的压低（sidechaincompress）参数
+        self.duck_threshold = float(config.get('duck_threshold', 0.03))
+        self.duck_ratio = float(config.get('duck_ratio', 8))
+        self.duck_attack_ms = float(config.get('duck_attack_ms', 20))
+        self.duck_release_ms = float(config.get('duck_release_ms', 400))
+        self.video_codec = config.get('video_codec', 'libx264')
+        self.preset = config.get('preset', 'medium')
+        self.crf = int(config.get('crf', 20))
+        self.audio_codec = config.get('audio_codec', 'aac')
+        self.audio_bitrate = config.get('audio_bitrate', '192k')
+        self.threads = int(config.get('threads', 0))
+        self.timeout = config.get('timeout', 1800)
+        self.priority = config.get('priority', PRIORITY_NORMAL)
+
+    def _effective_transition(self, durations: List[float]) -> float:
+        """转场时长不能超过最短镜头的一半，否则 xfade 偏移会为负。"""
+        if len(durations) < 2 or not self.transition or self.transition_duration <= 0:
+            return 0.0
+        return max(0.0, min(self.transition_duration, min(durations) / 2))
+
+    def build_command(
+        self,
+        shots: List[Dict[str, Any]],
+        narration_audio: Optional[str],
+        background_music: Optional[str],
+        output_path: str,
+    ) -> Tuple[List[str], float]:
+        """
+        构建 ffmpeg 命令。
+
+        Args:
+            shots: [{'path': 本地图片路径, 'duration': 秒}, ...]
+            narration_audio: 旁白音频路径（可选）
+            background_music: 背景音乐路径（可选，自动循环并在旁白处压低）
+            output_path: 输出视频路径
+
+        Returns:
+            (命令参数列表, 成片总时长)
+        """
+        if not shots:
+            raise ValueError('没有可用的图像片段')
+
+        durations = [max(float(s.get('duration') or 3.0), 0.1) for s in shots]
+        xf = self._effective_transition(durations)
+        # 与 MoviePy 路径保持相同总时长：除最后一个镜头外，每个镜头多渲染 xf 秒用于和下一镜头重叠
+        total_duration = sum(durations)
+
+        cmd: List[str] = [self.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error', '-nostats']
+        for idx, (shot, dur) in enumerate(zip(shots, durations)):
+            input_dur = dur + xf if idx < len(shots) - 1 else dur
+            cmd += ['-loop', '1', '-framerate', str(self.fps), '-t', f'{input_dur:.3f}', '-i', shot['path']]
+
+        input_idx = len(shots)
+        narration_idx = music_idx = None
+        if narration_audio:
+            narration_idx = input_idx
+            cmd += ['-i', narration_audio]
+            input_idx += 1
+        if background_music:
+            music_idx = input_idx
+            cmd += ['-stream_loop', '-1', '-i', background_music]
+            input_idx += 1
+
+        filters: List[str] = []
+        w, h = self.width, self.height
+        for idx in range(len(shots)):
+            filters.append(
+                f'[{idx}:v]scale={w}:{h}:force_original_aspect_ratio=decrease,'
+                f'pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={self.fps},format=yuv420p[v{idx}]'
+            )
+
+        if len(shots) == 1:
+            video_label = 'v0'
+        else:
+            prev = 'v0'
+            offset = 0.0
+            for idx in range(1, len(shots)):
+                offset += durations[idx - 1]
+                out = f'x{idx}' if idx < len(shots) - 1 else 'vout'
+                if xf > 0:
+                    filters.append(
+                        f'[{prev}][v{idx}]xfade=transition={self.transition}:'
+                        f'duration={xf:.3f}:offset={offset:.3f}[{out}]'
+                    )
+                else:
+                    filters.append(f'[{prev}][v{idx}]concat=n=2:v=1:a=0[{out}]')
+                prev = out
+            video_label = 'vout'
+
+        audio_label = None
+        if narration_idx is not None and music_idx is not None:
+            filters.append(f'[{narration_idx}:a]aresample=44100,asplit=2[narr][sc]')
+            filters.append(
+                f'[{music_idx}:a]aresample=44100,atrim=duration={total_duration:.3f},'
+                f'volume={self.music_volume}[bgm]'
+            )
+            filters.append(
+                f'[bgm][sc]sidechaincompress=threshold={self.duck_threshold}:ratio={self.duck_ratio}:'
+                f'attack={self.duck_attack_ms}:release={self.duck_release_ms}[ducked]'
+            )
+            filters.append('[narr][ducked]amix=inputs=2:duration=longest:dropout_transition=0:normalize=0[aout]')
+            audio_label = 'aout'
+        elif narration_idx is not None:
+            filters.append(f'[{narration_idx}:a]aresample=44100[aout]')
+            audio_label = 'aout'
+        elif music_idx is not None:
+            filters.append(
+                f'[{music_idx}:a]aresample=44100,atrim=duration={total_duration:.3f},'
+                f'volume={self.music_volume}[aout]'
+            )
+            audio_label = 'aout'
+
+        cmd += ['-filter_complex', ';'.join(filters), '-map', f'[{video_label}]']
+        if audio_label:
+            cmd += ['-map', f'[{audio_label}]', '-c:a', self.audio_codec, '-b:a', self.audio_bitrate]
+        cmd += [
+            '-c:v', self.video_codec,
+            '-preset', self.preset,
+            '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+            '-r', str(self.fps),
+            '-t', f'{total_duration:.3f}',
+            '-movflags', '+faststart',
+        ]
+        if self.threads:
+            cmd += ['-threads', str(self.threads)]
+        cmd += ['-progress', 'pipe:1', output_path]
+        return cmd, total_duration
+
+    def render(
+        self,
+        shots: List[Dict[str, Any]],
+        narration_audio: Optional[str],
+        background_music: Optional[str],
+        output_path: str,
+    ) -> Tuple[str, float]:
+        """同步渲染（调用方负责放入线程池），返回 (输出路径, 总时长)。"""
+        cmd, total_duration = self.build_command(shots, narration_audio, background_music, output_path)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        logger.info('[FFmpeg渲染] %d 个镜头, 总时长 %.2fs -> %s', len(shots), total_duration, output_path)
+
+        last_logged = [-1]
+
+        def _on_progress(line: str) -> None:
+            # -progress pipe:1 每隔约 0.5s 输出一组 key=value，边编码边记录进度
+            key, _, value = line.strip().partition('=')
+            if key in ('out_time_us', 'out_time_ms') and value.isdigit() and total_duration > 0:
+                pct = min(100, int(int(value) / 1e6 / total_duration * 100))
+                if pct // 10 > last_logged[0]:
+                    last_logged[0] = pct // 10
+                    logger.info('[FFmpeg渲染] 进度 %d%%', pct)
+
+        try:
+            proc = get_media_scheduler().run(
+                cmd,
+                JOB_CLASS_TRANSCODE,
+                priority=self.priority,
+                timeout=self.timeout,
+                stdout_callback=_on_progress,
+            )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f'FFmpeg 渲染超时（>{self.timeout}s）')
+
+        if proc.returncode != 0:
+            raise RuntimeError(f'FFmpeg 渲染失败: {(proc.stderr or "").strip()}')
+        if not os.path.isfile(output_path) or os.path.getsize(output_path) == 0:
+            raise RuntimeError(f'FFmpeg 未生成输出文件: {output_path}')
+        return output_path, total_duration
@@ -1,15 +1,25 @@
 """
-FFmpeg 拼接与信息读取（pipeline combine-video 使用）
+FFmpeg 拼接与信息读取（pipeline combine-video 使用），以及视频理解用的分析代理、镜头检测与切分
 """
 
-import asyncio
 import json
 import logging
 import os
+import re
 import subprocess
-import tempfile
+import sys
 from typing import Any, Dict, List, Optional
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+from video_consistency_agent.utils.media_scheduler import (
+    JOB_CLASS_EXTRACT,
+    JOB_CLASS_PROBE,
+    JOB_CLASS_TRANSCODE,
+    PRIORITY_NORMAL,
+    get_media_scheduler,
+)
+from video_consistency_agent.utils.scratch_space import get_scratch_space
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,12 +44,16 @@ class FFmpegService:
         self.ffprobe_path = (config or {}).get('ffprobe_path') or _find_exe('ffprobe')
         if not self.ffmpeg_path:
             raise RuntimeError('未找到 ffmpeg，请安装并加入 PATH')
+        # 交互预览可传入 PRIORITY_INTERACTIVE，批量任务传入 PRIORITY_BULK
+        self.priority = (config or {}).get('priority', PRIORITY_NORMAL)
+        self.scheduler = get_media_scheduler((config or {}).get('media_scheduler'))
+        self.scratch = get_scratch_space((config or {}).get('scratch_space'))
 
-    async def _run(self, cmd: List[str]) -> subprocess.CompletedProcess:
-        def _sync():
-            return subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-
-        return await asyncio.to_thread(_sync)
+    async def _run(
+        self, cmd: List[str], job_class: str = JOB_CLASS_TRANSCODE, timeout: float = 600
+    ) -> subprocess.CompletedProcess:
+        """经进程级媒体调度器排队执行（按类别限流、按优先级出队）。"""
+        return await self.scheduler.run_async(cmd, job_class, priority=self.priority, timeout=timeout)
 
     async def concatenate_videos(self, video_paths: List[str], output_path: str) -> Optional[str]:
         """将多个视频文件无损拼接为单个文件（codec copy）。"""
@@ -49,9 +63,9 @@ class FFmpegService:
             return None
 
         os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
-        tmp_dir = tempfile.mkdtemp(prefix='ffmpeg_concat_')
-        list_file = os.path.join(tmp_dir, 'list.txt')
-        try:
+        # 拼接清单很小，放在受管临时空间（优先内存盘），块结束自动删除
+        with self.scratch.job('ffmpeg_concat', small=True) as scratch:
+            list_file = scratch.file('list.txt')
             with open(list_file, 'w', encoding='utf-8') as f:
                 for p in valid:
                     ap = os.path.abspath(p).replace('\\', '/')
@@ -76,12 +90,6 @@ class FFmpegService:
                 return None
             if os.path.isfile(output_path) and os.path.getsize(output_path) > 0:
                 return output_path
-        finally:
-            try:
-                os.remove(list_file)
-                os.rmdir(tmp_dir)
-            except OSError:
-                pass
         return None
 
     async def compose_videos(self, video_paths: List[str], output_path: str) -> Dict[str, Any]:
@@ -91,6 +99,168 @@ class FFmpegService:
             return {'success': True, 'path': out}
         return {'success': False, 'error': 'FFmpeg 拼接失败'}
 
+    async def build_analysis_proxy(
+        self,
+        video_path: str,
+        short_side: int = 480,
+        fps: float = 2,
+        video_bitrate: str = '400k',
+        audio_bitrate: str = '64k',
+    ) -> Optional[str]:
+        """
+        生成供多模态模型理解用的低码率代理视频（短边、帧率、码率封顶，保留音轨）。
+
+        代理保存在源文件旁（<name>.analysis_proxy.mp4），源文件未更新时直接复用，
+        同一次上传只转码一次。失败返回 None，由调用方回退到原始文件。
+        """
+        src = os.path.abspath(video_path)
+        if not os.path.isfile(src):
+            return None
+        root, _ = os.path.splitext(src)
+        proxy_path = f'{root}.analysis_proxy.mp4'
+        if (
+            os.path.isfile(proxy_path)
+            and os.path.getsize(proxy_path) > 0
+            and os.path.getmtime(proxy_path) >= os.path.getmtime(src)
+        ):
+            return proxy_path
+
+        # 只缩小不放大；竖屏视频同样按短边封顶；短边取偶数（libx264 yuv420p 要求宽高为偶数）
+        scale = (
+            f"scale='if(lte(iw,ih),trunc(min(iw,{short_side})/2)*2,-2)'"
+            f":'if(lte(iw,ih),-2,trunc(min(ih,{short_side})/2)*2)'"
+        )
+        tmp_path = f'{root}.analysis_proxy.{os.getpid()}.tmp.mp4'
+        cmd = [
+            self.ffmpeg_path,
+            '-y',
+            '-hide_banner',
+            '-loglevel',
+            'error',
+            '-i',
+            src,
+            '-map',
+            '0:v:0',
+            '-map',
+            '0:a:0?',
+            '-vf',
+            f'{scale},fps={fps}',
+            '-c:v',
+            'libx264',
+            '-preset',
+            'veryfast',
+            '-b:v',
+            video_bitrate,
+            '-maxrate',
+            video_bitrate,
+            '-bufsize',
+            video_bitrate,
+            '-pix_fmt',
+            'yuv420p',
+            '-c:a',
+            'aac',
+            '-ac',
+            '1',
+            '-b:a',
+            audio_bitrate,
+            '-movflags',
+            '+faststart',
+            tmp_path,
+        ]
+        try:
+            proc = await self._run(cmd, timeout=900)
+            if proc.returncode != 0 or not os.path.isfile(tmp_path) or os.path.getsize(tmp_path) == 0:
+                logger.error('生成分析代理失败: %s', (proc.stderr or '').strip())
+                return None
+            # 原子替换，并发请求同一上传时不会读到半成品
+            os.replace(tmp_path, proxy_path)
+        except Exception as e:
+            logger.error('生成分析代理失败: %s', e)
+            return None
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+        logger.info(
+            '分析代理已生成: %s (%.1f MB -> %.1f MB)',
+            os.path.basename(proxy_path),
+            os.path.getsize(src) / 1024 / 1024,
+            os.path.getsize(proxy_path) / 1024 / 1024,
+        )
+        return proxy_path
+
+    async def detect_scene_changes(self, video_path: str, threshold: float = 0.3) -> List[float]:
+        """
+        用 ffmpeg scene 评分检测镜头切换，返回切换时间点（秒，升序）。
+
+        对分析代理（低分辨率、低帧率）执行时开销很小。失败返回空列表。
+        """
+        cmd = [
+            self.ffmpeg_path,
+            '-hide_banner',
+            '-nostats',
+            '-i',
+            video_path,
+            '-an',
+            '-vf',
+            f"select='gt(scene,{threshold})',showinfo",
+            '-f',
+            'null',
+            '-',
+        ]
+        try:
+            proc = await self._run(cmd, JOB_CLASS_EXTRACT, timeout=600)
+        except Exception as e:
+            logger.warning('镜头检测失败: %s', e)
+            return []
+        if proc.returncode != 0:
+            logger.warning('镜头检测失败: %s', (proc.stderr or '').strip()[-500:])
+            return []
+        times = [float(m) for m in re.findall(r'pts_time:\s*([0-9.]+)', proc.stderr or '')]
+        return sorted(set(round(t, 3) for t in times))
+
+    async def split_video(self, video_path: str, cut_points: List[float], output_dir: str) -> List[str]:
+        """
+        按时间点切分视频（在切点强制关键帧后重新编码，切分位置精确）。
+
+        适合对分析代理等小文件使用；返回按时间顺序排列的分段文件路径，失败返回空列表。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        pattern = os.path.join(output_dir, 'segment_%03d.mp4')
+        cmd = [self.ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error', '-i', video_path]
+        if cut_points:
+            times = ','.join(f'{t:.3f}' for t in cut_points)
+            cmd += ['-force_key_frames', times, '-f', 'segment', '-segment_times', times]
+        else:
+            cmd += ['-f', 'segment', '-segment_time', '86400']
+        cmd += [
+            '-reset_timestamps',
+            '1',
+            '-map',
+            '0:v:0',
+            '-map',
+            '0:a:0?',
+            '-c:v',
+            'libx264',
+            '-preset',
+            'veryfast',
+            '-c:a',
+            'aac',
+            pattern,
+        ]
+        proc = await self._run(cmd, timeout=900)
+        if proc.returncode != 0:
+            logger.error('视频切分失败: %s', (proc.stderr or '').strip())
+            return []
+        return sorted(
+            os.path.join(output_dir, name)
+            for name in os.listdir(output_dir)
+            if name.startswith('segment_') and name.endswith('.mp4')
+        )
+
     async def get_video_info(self, video_path: str) -> Dict[str, Any]:
         """返回 duration、resolution、fps 等简单信息。"""
         if not self.ffprobe_path:
@@ -105,7 +275,7 @@ class FFmpegService:
             '-show_streams',
             video_path,
         ]
-        proc = await self._run(cmd)
+        proc = await self._run(cmd, JOB_CLASS_PROBE, timeout=60)
         if proc.returncode != 0:
             return {'duration': 0, 'resolution': '', 'fps': 0}
         try:
@@ -0,0 +1,140 @@
+"""
+本地镜头切换检测与关键帧采样（视频理解的关键帧模式使用）
+
+在缩小后的帧上比较 HSV 颜色直方图与灰度帧差，检测镜头边界；每个镜头取一帧作为关键帧，
+只把这些图片交给多模态模型，替代整段视频上传。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_signature(frame, cv2, width: int):
+    h, w = frame.shape[:2]
+    small = cv2.resize(frame, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [32, 16], [0, 180, 0, 256])
+    cv2.normalize(hist, hist)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return hist, gray
+
+
+def sample_shot_keyframes(
+    video_path: str,
+    output_dir: str,
+    sample_fps: float = 4.0,
+    hist_threshold: float = 0.35,
+    diff_threshold: float = 30.0,
+    min_shot_seconds: float = 1.0,
+    max_frames: int = 16,
+    min_frames: int = 4,
+    analysis_width: int = 160,
+    output_long_side: int = 768,
+) -> List[Dict[str, Any]]:
+    """
+    检测镜头切换并导出关键帧
+
+    Args:
+        video_path: 视频路径
+        output_dir: 关键帧输出目录
+        sample_fps: 检测时的采样帧率（其余帧只 grab 不转换、不比较）
+        hist_threshold: HSV 直方图 Bhattacharyya 距离阈值，超过视为切换
+        diff_threshold: 灰度平均帧差阈值（0-255），与直方图任一超过即视为切换
+        min_shot_seconds: 最短镜头时长，避免闪光等造成的连续误检
+        max_frames: 关键帧上限，镜头过多时均匀抽取
+        min_frames: 关键帧下限，镜头过少时在全片均匀补帧
+        analysis_width: 检测时缩放到的宽度
+        output_long_side: 导出关键帧的长边像素
+
+    Returns:
+        [{'path': 关键帧路径, 'timestamp': 秒, 'shot_index': 镜头序号}, ...]（按时间排序）
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f'无法打开视频: {video_path}')
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    step = max(1, int(round(fps / sample_fps)))
+
+    # 第一遍：grab() 跳帧、只解码采样帧，记录镜头起点
+    shot_starts: List[int] = [0]
+    prev = None
+    index = 0
+    try:
+        while True:
+            if index % step:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ok, frame = cap.read()
+            if not ok:
+                break
+            hist, gray = _frame_signature(frame, cv2, analysis_width)
+            if prev is not None:
+                hist_dist = cv2.compareHist(prev[0], hist, cv2.HISTCMP_BHATTACHARYYA)
+                frame_diff = float(cv2.absdiff(prev[1], gray).mean())
+                if (hist_dist > hist_threshold or frame_diff > diff_threshold) and (
+                    index - shot_starts[-1] >= min_shot_seconds * fps
+                ):
+                    shot_starts.append(index)
+            prev = (hist, gray)
+            index += 1
+    finally:
+        cap.release()
+
+    total_frames = frame_count or index
+    if total_frames <= 0:
+        raise ValueError(f'视频没有可读取的帧: {video_path}')
+
+    # 每个镜头取中间帧，比切换处的第一帧更稳定（避开转场、运动模糊）
+    shots = [
+        (i, start, (shot_starts[i + 1] if i + 1 < len(shot_starts) else total_frames))
+        for i, start in enumerate(shot_starts)
+    ]
+    picks = [(i, (start + end) // 2) for i, start, end in shots]
+    if len(picks) > max_frames:
+        stride = len(picks) / max_frames
+        picks = [picks[int(k * stride)] for k in range(max_frames)]
+    elif len(picks) < min_frames:
+        # 镜头太少（长镜头、单镜头）时在全片均匀补帧，与已选帧至少相隔 1 秒
+        picked = [f for _, f in picks]
+        for k in range(min_frames):
+            if len(picks) >= min_frames:
+                break
+            f = int(total_frames * (k + 0.5) / min_frames)
+            if all(abs(f - p) > fps for p in picked):
+                shot_index = max(i for i, start, _ in shots if start <= f)
+                picks.append((shot_index, f))
+                picked.append(f)
+        picks.sort(key=lambda p: p[1])
+
+    os.makedirs(output_dir, exist_ok=True)
+    keyframes: List[Dict[str, Any]] = []
+    cap = cv2.VideoCapture(video_path)
+    try:
+        for n, (shot_index, frame_idx) in enumerate(picks):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            ok, frame = cap.read()
+            if not ok:
+                continue
+            h, w = frame.shape[:2]
+            scale = min(1.0, output_long_side / max(h, w))
+            if scale < 1.0:
+                frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+            path = os.path.join(output_dir, f'keyframe_{n:03d}.jpg')
+            cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            keyframes.append({'path': path, 'timestamp': round(frame_idx / fps, 2), 'shot_index': shot_index})
+    finally:
+        cap.release()
+
+    logger.info('[关键帧采样] 检测到 %d 个镜头，导出 %d 张关键帧', len(shot_starts), len(keyframes))
+    return keyframes
@@ -9,6 +9,8 @@ import traceback
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
+from app.utils.dashscope_upload_cache import get_upload_cache, oss_request_kwargs
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # 设置日志级别为DEBUG，确保能看到详细日志
 
@@ -128,11 +130,9 @@ class QwenVideoService:
                 },
             ]
             
-            # 添加关键帧到消息
-            for frame_path in keyframes[:3]:  # 只使用前3个关键帧
-                messages[1]['content'].append({
-                    "image": f"file://{os.path.abspath(frame_path)}"
-                })
+            # 只使用前3个关键帧；图片在每次尝试时经上传缓存换成 oss:// 地址（按 API 密钥区分），重试不重复上传
+            frame_paths = [os.path.abspath(frame_path) for frame_path in keyframes[:3]]
+            upload_cache = get_upload_cache()
             
             # 遍历所有API密钥，尝试分析关键帧
             analysis_result = None
@@ -143,11 +143,16 @@ class QwenVideoService:
                 logger.info(f"使用API密钥 {self.api_key[:10]}... 尝试分析关键帧")
                 
                 try:
+                    messages[1]['content'] = [{"text": user_text}] + [
+                        {"image": upload_cache.resolve(frame_path, "qwen3-vl-flash", self.api_key)}
+                        for frame_path in frame_paths
+                    ]
                     response = MultiModalConversation.call(
                         api_key=self.api_key,
                         model="qwen3-vl-flash",  # 使用qwen3-vl-flash模型
                         messages=messages,
-                        result_format="json"
+                        result_format="json",
+                        **oss_request_kwargs(messages=messages),
                     )
                     
                     logger.debug(f"模型响应状态码: {response.status_code}")
@@ -614,6 +619,9 @@ class QwenVideoService:
             self.api_key = self.api_keys[0]
             logger.info(f"使用API密钥 {self.api_key[:10]}... 生成视频")
 
+            # 本地分镜图经上传缓存换成 oss:// 地址，同一张图重试或重复生成时不再上传
+            img_url = get_upload_cache().resolve(img_url, 'wan2.6-i2v-flash', self.api_key)
+
             try:
                 # 调用视频生成API，使用异步调用方式
                 rsp = VideoSynthesis.async_call(
@@ -621,7 +629,8 @@ class QwenVideoService:
                     prompt=video_prompt,
                     img_url=img_url,
                     api_key=self.api_key,
-                    free_tier_only=False
+                    free_tier_only=False,
+                    **oss_request_kwargs(img_url),
                 )
 
                 logger.debug(f"异步调用响应: {rsp}")
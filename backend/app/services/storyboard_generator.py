@@ -18,6 +18,7 @@ MAX_SCENES = 6
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from config import Config
+from app.utils.dashscope_upload_cache import get_upload_cache, oss_request_kwargs
 
 logger = logging.getLogger(__name__)
 
@@ -723,7 +724,10 @@ Edit according to:
             from dashscope import MultiModalConversation
 
             dashscope.api_key = self.dashscope_api_key
-            ref_url = f"file://{os.path.abspath(reference_image_path)}"
+            # 首帧参考图会被多个分镜线程并发引用，经上传缓存只上传一次
+            ref_url = get_upload_cache().resolve(
+                os.path.abspath(reference_image_path), "qwen-image-edit", dashscope.api_key
+            )
 
             if raw_prompt:
                 full_prompt = prompt
@@ -754,6 +758,7 @@ Edit according to:
                 prompt_extend=True,
                 negative_prompt="",
                 size="1328*1328",
+                **oss_request_kwargs(ref_url),
             )
 
             if response.status_code != 200:
@@ -796,7 +801,9 @@ Edit according to:
             import dashscope
             from dashscope import MultiModalConversation
 
-            ref_url = f"file://{os.path.abspath(reference_image_path)}"
+            ref_url = get_upload_cache().resolve(
+                os.path.abspath(reference_image_path), "qwen-image-2.0", dashscope.api_key
+            )
 
             if raw_prompt:
                 full_prompt = prompt
@@ -827,7 +834,8 @@ Edit according to:
                 result_format='message',
                 stream=False,
                 n=1,
-                watermark=False
+                watermark=False,
+                **oss_request_kwargs(ref_url),
             )
 
             if response.status_code == 200:
@@ -0,0 +1,215 @@
+"""DashScope 本地文件上传缓存：同一文件内容在有效期内只上传一次 OSS，之后复用 oss:// 地址。
+
+SDK 遇到 file:// 输入会在每次调用时重新上传；这里按「文件内容哈希 + 模型 + API Key」缓存上传结果，
+并记录过期时间（DashScope 临时 OSS 文件有效期 48 小时）。同一文件的并发请求只有一个线程真正上传。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# DashScope 临时文件有效期 48 小时，预留余量避免请求途中过期
+DEFAULT_TTL_SECONDS = 46 * 3600
+
+# 请求中含 oss:// 地址时必须携带该请求头，服务端才会解析临时文件
+OSS_RESOLVE_HEADERS = {'X-DashScope-OssResourceResolve': 'enable'}
+
+
+def _strip_file_scheme(path_or_url: str) -> str:
+    if path_or_url.startswith('file://'):
+        return path_or_url[len('file://'):]
+    return path_or_url
+
+
+class DashScopeUploadCache:
+    """进程级上传缓存（线程安全），可选持久化到 JSON 文件供多 worker 共享。"""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, cache_file: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # (路径, 大小, mtime) -> 内容哈希，避免每次都重新读取大文件
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self.stats = {'hits': 0, 'uploads': 0, 'failures': 0, 'expired': 0}
+        self._load()
+
+    # ---- 对外接口 ----
+
+    def resolve(self, path_or_url: Optional[str], model: str, api_key: Optional[str] = None) -> Optional[str]:
+        """
+        把本地路径 / file:// 地址换成已上传的 oss:// 地址
+
+        http(s)://、oss:// 及不存在的路径原样返回；上传失败时返回 file:// 地址，由 SDK 自行上传。
+        """
+        if not path_or_url or path_or_url.startswith(('http://', 'https://', 'oss://')):
+            return path_or_url
+        path = os.path.abspath(_strip_file_scheme(path_or_url))
+        if not os.path.isfile(path):
+            return path_or_url
+
+        digest = self._digest(path)
+        key = (digest, model, self._key_fingerprint(api_key))
+        entry_id = '|'.join(key)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # 同一文件同一模型的并发调用在此排队，只有第一个真正上传
+        with key_lock:
+            url = self._lookup(entry_id)
+            if url:
+                return url
+            try:
+                url = self._upload(path, model, api_key)
+            except Exception as e:
+                with self._lock:
+                    self.stats['failures'] += 1
+                logger.warning('[上传缓存] 上传失败，交由 SDK 处理: %s (%s)', os.path.basename(path), e)
+                return f'file://{path}'
+            with self._lock:
+                self.stats['uploads'] += 1
+                self._entries[entry_id] = {'url': url, 'expires_at': time.time() + self.ttl_seconds}
+                self._save()
+            logger.info('[上传缓存] 已上传 %s -> %s', os.path.basename(path), url)
+            return url
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries))
+
+    # ---- 内部实现 ----
+
+    def _lookup(self, entry_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if not entry and self.cache_file:
+                # 其他 worker 可能已上传过
+                self._load()
+                entry = self._entries.get(entry_id)
+            if not entry:
+                return None
+            if entry['expires_at'] <= time.time():
+                self._entries.pop(entry_id, None)
+                self.stats['expired'] += 1
+                return None
+            self.stats['hits'] += 1
+            return entry['url']
+
+    def _digest(self, path: str) -> str:
+        st = os.stat(path)
+        sig = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._digests.get(sig)
+        if cached:
+            return cached
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[sig] = digest
+        return digest
+
+    @staticmethod
+    def _key_fingerprint(api_key: Optional[str]) -> str:
+        # 临时文件归属于上传所用账号，不同 Key 分开缓存；只保存哈希，不落盘明文 Key
+        if not api_key:
+            import dashscope
+
+            api_key = getattr(dashscope, 'api_key', None) or os.environ.get('DASHSCOPE_API_KEY', '')
+        return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _upload(path: str, model: str, api_key: Optional[str]) -> str:
+        from dashscope.utils.oss_utils import OssUtils
+
+        result = OssUtils.upload(model=model, file_path=path, api_key=api_key)
+        # 新版 SDK 返回 (url, upload_certificate)
+        url = result[0] if isinstance(result, tuple) else result
+        if not url:
+            raise RuntimeError('OssUtils.upload 未返回地址')
+        return url
+
+    def _load(self) -> None:
+        if not self.cache_file or not os.path.isfile(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            now = time.time()
+            self._entries.update({k: v for k, v in data.items() if v.get('expires_at', 0) > now})
+        except (OSError, ValueError) as e:
+            logger.warning('[上传缓存] 读取缓存文件失败，忽略: %s', e)
+
+    def _save(self) -> None:
+        if not self.cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+            now = time.time()
+            # 与其他 worker 已写入的条目合并，避免互相覆盖
+            merged: Dict[str, Dict[str, Any]] = {}
+            if os.path.isfile(self.cache_file):
+                try:
+                    with open(self.cache_file, 'r', encoding='utf-8') as f:
+                        merged = json.load(f)
+                except (OSError, ValueError):
+                    merged = {}
+            merged.update(self._entries)
+            live = {k: v for k, v in merged.items() if v.get('expires_at', 0) > now}
+            tmp = f'{self.cache_file}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(live, f)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            logger.warning('[上传缓存] 写入缓存文件失败: %s', e)
+
+
+def oss_request_kwargs(*urls: Optional[str], messages: Optional[Iterable[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    请求中含 oss:// 地址时返回 {'headers': OSS_RESOLVE_HEADERS}，可直接 ** 展开到 SDK 调用参数；否则返回空字典
+
+    Args:
+        urls: img_url 等单独传入的地址
+        messages: MultiModalConversation 消息列表，检查其中的 image / video / audio
+    """
+    candidates = list(urls)
+    for msg in messages or []:
+        content = msg.get('content')
+        if isinstance(content, list):
+            for block in content:
+                if isinstance(block, dict):
+                    candidates.extend(v for k, v in block.items() if k in ('image', 'video', 'audio'))
+    if any(isinstance(u, str) and u.startswith('oss://') for u in candidates):
+        return {'headers': dict(OSS_RESOLVE_HEADERS)}
+    return {}
+
+
+_cache: Optional[DashScopeUploadCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_upload_cache() -> DashScopeUploadCache:
+    """获取进程级上传缓存；Config.DASHSCOPE_UPLOAD_CACHE_FILE 配置后持久化到该文件。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_file = None
+                try:
+                    from config import Config
+
+                    cache_file = getattr(Config, 'DASHSCOPE_UPLOAD_CACHE_FILE', None)
+                except Exception:
+                    pass
+                _cache = DashScopeUploadCache(cache_file=cache_file)
+    return _cache
@@ -85,6 +85,24 @@ class Config:
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'logs/agent_system.log')
 
+    # DashScope 本地文件上传缓存（同一内容 48h 有效期内只上传一次），多 worker 通过该文件共享
+    DASHSCOPE_UPLOAD_CACHE_FILE = os.getenv(
+        'DASHSCOPE_UPLOAD_CACHE_FILE', os.path.join(basedir, 'static/uploads/.dashscope_upload_cache.json')
+    )
+
+    # 视频理解分析代理：上传后转码为低分辨率/低帧率/低码率副本再交给 qwen-vl-plus
+    ANALYSIS_PROXY_ENABLED = os.getenv('ANALYSIS_PROXY_ENABLED', 'true').lower() == 'true'
+    ANALYSIS_PROXY_SHORT_SIDE = int(os.getenv('ANALYSIS_PROXY_SHORT_SIDE', '480'))
+    ANALYSIS_PROXY_FPS = float(os.getenv('ANALYSIS_PROXY_FPS', '2'))
+    ANALYSIS_PROXY_VIDEO_BITRATE = os.getenv('ANALYSIS_PROXY_VIDEO_BITRATE', '400k')
+    # 视频理解模式：full（整段）/ segmented（按镜头分段并发理解后合并）/ keyframes（本地镜头检测，只发关键帧）
+    # / auto（超过阈值时长走分段，否则整段）；默认 full，与原有整段理解行为一致，分段 / auto 需显式开启
+    ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'full')
+    ANALYSIS_SEGMENT_THRESHOLD = float(os.getenv('ANALYSIS_SEGMENT_THRESHOLD', '180'))  # 秒
+    ANALYSIS_SEGMENT_TARGET = float(os.getenv('ANALYSIS_SEGMENT_TARGET', '60'))  # 每段目标时长（秒）
+    ANALYSIS_SEGMENT_CONCURRENCY = int(os.getenv('ANALYSIS_SEGMENT_CONCURRENCY', '4'))
+    ANALYSIS_KEYFRAME_MAX = int(os.getenv('ANALYSIS_KEYFRAME_MAX', '16'))
+
     # 二创审核：总分达到该分数才允许进入后续流程
     RECREATION_REVIEW_PASS_SCORE = float(os.getenv('RECREATION_REVIEW_PASS_SCORE', '60'))
 
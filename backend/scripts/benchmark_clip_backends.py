@@ -0,0 +1,159 @@
+"""
+CLIP 图像编码器后端对比：全精度 torch vs int8 动态量化 vs ONNX Runtime（float / int8）。
+
+在 backend 目录下运行：
+    python scripts/benchmark_clip_backends.py --images /path/to/keyframes --batch-size 8 --repeat 3
+
+--images 指定本地样本目录（jpg/png）；不指定时用 PIL 生成彩色分镜图。
+精度以 torch 后端为基准：比较每张图嵌入的余弦相似度，以及两两图像相似度矩阵的绝对误差
+和最近邻一致率（一致性检测实际使用的是相似度分数）。耗时取多次重复中的最优值，结果以 JSON 打印。
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def _make_images(work_dir: str, count: int) -> list:
+    from PIL import Image, ImageDraw
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(work_dir, f'sample_{i:03d}.png')
+        img = Image.new('RGB', (640, 360), ((i * 53) % 256, (i * 97) % 256, (i * 151) % 256))
+        draw = ImageDraw.Draw(img)
+        draw.ellipse([80 + i * 9, 60, 300 + i * 9, 300], fill=((i * 31) % 256, 200, 90))
+        draw.rectangle([360, 120 - i * 3, 600, 330], outline=(255, 255, 255), width=6)
+        img.save(path)
+        paths.append(path)
+    return paths
+
+
+def _similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return normed @ normed.T
+
+
+def _run_backend(backend: str, paths: list, batch_size: int, repeat: int) -> dict:
+    from video_consistency_agent.utils.deep_feature_extractor import DeepFeatureExtractor
+
+    extractor = DeepFeatureExtractor({
+        'clip_backend': backend,
+        'batch_size': batch_size,
+        'embedding_store': {'enabled': False},
+    })
+    t0 = time.perf_counter()
+    if not extractor.warm_up(['clip']):
+        return {'error': '模型加载失败'}
+    load_s = time.perf_counter() - t0
+
+    timings = []
+    embeddings = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = extractor.extract_clip_embeddings(paths)
+        timings.append(time.perf_counter() - t0)
+        embeddings = result
+    DeepFeatureExtractor.unload(['clip'])
+
+    if any(e is None for e in embeddings):
+        return {'error': '部分图像提取失败'}
+    best = min(timings)
+    return {
+        'load_s': round(load_s, 3),
+        'best_total_s': round(best, 4),
+        'ms_per_image': round(best / len(paths) * 1000, 2),
+        'embeddings': np.stack(embeddings),
+    }
+
+
+def _accuracy(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    ref_n = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand_n = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    per_image = np.sum(ref_n * cand_n, axis=1)
+
+    ref_sim = _similarity_matrix(reference)
+    cand_sim = _similarity_matrix(candidate)
+    off_diag = ~np.eye(len(reference), dtype=bool)
+    sim_err = np.abs(ref_sim - cand_sim)[off_diag]
+
+    nn_ref = np.where(off_diag, ref_sim, -np.inf).argmax(axis=1)
+    nn_cand = np.where(off_diag, cand_sim, -np.inf).argmax(axis=1)
+    return {
+        'embedding_cosine_min': round(float(per_image.min()), 5),
+        'embedding_cosine_mean': round(float(per_image.mean()), 5),
+        'pair_similarity_abs_err_max': round(float(sim_err.max()), 5) if sim_err.size else 0.0,
+        'pair_similarity_abs_err_mean': round(float(sim_err.mean()), 5) if sim_err.size else 0.0,
+        'nearest_neighbour_agreement': round(float(np.mean(nn_ref == nn_cand)), 4),
+    }
+
+
+def benchmark(paths: list, backends: list, batch_size: int, repeat: int) -> dict:
+    results = {}
+    raw = {}
+    for backend in backends:
+        run = _run_backend(backend, paths, batch_size, repeat)
+        if 'embeddings' in run:
+            raw[backend] = run.pop('embeddings')
+        results[backend] = run
+
+    reference = raw.get('torch')
+    if reference is not None:
+        base_ms = results['torch']['ms_per_image']
+        for backend, embeddings in raw.items():
+            if backend == 'torch':
+                continue
+            results[backend]['accuracy_vs_torch'] = _accuracy(reference, embeddings)
+            results[backend]['speedup_vs_torch'] = round(base_ms / results[backend]['ms_per_image'], 2)
+
+    return {
+        'images': len(paths),
+        'batch_size': batch_size,
+        'repeat': repeat,
+        'threads': _torch_threads(),
+        'results': results,
+    }
+
+
+def _torch_threads():
+    try:
+        import torch
+        return torch.get_num_threads()
+    except ImportError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLIP 图像编码器后端精度与耗时对比')
+    parser.add_argument('--images', help='本地样本图像目录（jpg/png），不指定时自动生成')
+    parser.add_argument('--count', type=int, default=32, help='自动生成的样本数量')
+    parser.add_argument('--batch-size', type=int, default=8, help='每批图像数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个后端重复次数')
+    parser.add_argument('--backends', default='torch,int8,onnx,onnx-int8', help='逗号分隔：torch,int8,onnx,onnx-int8')
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+    with tempfile.TemporaryDirectory(prefix='clip_bench_') as work_dir:
+        if args.images:
+            paths = sorted(
+                p for ext in ('*.jpg', '*.jpeg', '*.png')
+                for p in glob.glob(os.path.join(args.images, ext))
+            )
+        else:
+            paths = _make_images(work_dir, args.count)
+        if len(paths) < 2:
+            parser.error('至少需要 2 张样本图像')
+        summary = benchmark(paths, backends, args.batch_size, args.repeat)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+"""
+video_consistency_agent 检查器基准：本地合成素材，VLM / LLM 调用替换为桩。
+
+在 backend 目录下运行：
+    python scripts/benchmark_consistency_agent.py --scenes 4 --repeat 3 --output bench.json
+    python scripts/benchmark_consistency_agent.py --baseline bench_old.json   # 与其他提交的结果对比
+
+素材全部本地确定性生成：ffmpeg testsrc / color 源生成场景视频，OpenCV 绘制关键帧（最后一个场景刻意换色调与构图）。
+dashscope 的 MultiModalConversation / Generation 调用替换为返回固定 JSON 的桩（可用 --stub-latency-ms 模拟网络延迟），
+并统计调用次数；检查记忆、感知哈希索引、关键帧磁盘缓存都指向临时目录，不读写用户缓存。
+
+计时项：关键帧提取、视觉相似度 / SSIM、光流与运动一致性、AnalysisModule.evaluate_consistency、
+ConsistencyAgent.check_consistency 只依赖各提交都有的公开接口；图像解码与直方图 / SSIM / 边缘细分指标、分级检查、
+check_sequence 在被测提交缺少对应接口时记为 skipped，因此同一脚本可在较早的提交上运行以得到对比基线。
+每项记录首次（冷缓存）、最快、平均耗时（毫秒），检查类计时项另记各维度检查器异常 / 降级次数
+（--strict 时有异常即以非零状态退出），结果以 JSON 输出。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import cv2
+import numpy as np
+import yaml
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'video_consistency_agent', 'config', 'config.yaml')
+
+# 批量关键帧请求按序号逐对取结果：给足序号，批量路径得到真实解析结果而不是降级默认分数
+_STUB_ANSWER = json.dumps({'score': 0.85, 'passed': True, 'issues': [], 'transitions': [],
+                           'pairs': [{'index': i, 'overall_consistency': 0.85} for i in range(1, 65)]},
+                          ensure_ascii=False)
+
+
+class _StubModelCalls:
+    """dashscope 调用桩：返回固定 JSON，按接口计数，可选模拟延迟（调用方在线程池中执行，time.sleep 即可）"""
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self.counts = {'multimodal': 0, 'generation': 0}
+        self._lock = threading.Lock()
+
+    def _call(self, kind: str):
+        def call(**kwargs):
+            with self._lock:
+                self.counts[kind] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            message = types.SimpleNamespace(content=_STUB_ANSWER)
+            output = types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], text=_STUB_ANSWER)
+            return types.SimpleNamespace(status_code=200, output=output)
+        return call
+
+    def install(self) -> None:
+        try:
+            import dashscope
+        except ImportError:
+            # 基准只需要调用桩，未安装 SDK 时用空模块承载
+            dashscope = types.ModuleType('dashscope')
+            sys.modules['dashscope'] = dashscope
+        dashscope.MultiModalConversation = types.SimpleNamespace(call=self._call('multimodal'))
+        dashscope.Generation = types.SimpleNamespace(call=self._call('generation'))
+
+
+# ---- 合成素材 ----
+
+def _make_clip(path: str, source: str, duration: float) -> None:
+    subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', f'{source}:duration={duration}',
+         '-c:v', 'libx264', '-pix_fmt', 'yuv420p', path],
+        check=True,
+    )
+
+
+def _draw_keyframe(path: str, scene: int, frame: int, size, odd_one_out: bool) -> None:
+    h, w = size
+    ramp = np.linspace(0, 1, w, dtype=np.float32)[None, :, None]
+    if odd_one_out:
+        top, bottom = np.array([30, 30, 160], np.float32), np.array([20, 200, 240], np.float32)
+    else:
+        top, bottom = np.array([170, 110, 40], np.float32), np.array([90, 160, 70], np.float32)
+    image = (top * (1 - ramp) + bottom * ramp).repeat(h, axis=0).astype(np.uint8)
+    # 地面与“角色”：同一序列内角色随场景、帧小幅平移
+    cv2.rectangle(image, (0, int(h * 0.75)), (w, h), (60, 90, 60) if not odd_one_out else (200, 200, 200), -1)
+    x = int(w * (0.3 + 0.05 * scene + 0.02 * frame))
+    if odd_one_out:
+        x = int(w * 0.8)
+    cv2.circle(image, (x, int(h * 0.45)), h // 10, (40, 40, 220), -1)
+    cv2.rectangle(image, (x - h // 14, int(h * 0.55)), (x + h // 14, int(h * 0.75)), (200, 80, 40), -1)
+    cv2.putText(image, f'S{scene}F{frame}', (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+    cv2.imwrite(path, image)
+
+
+def _make_assets(work_dir: str, scenes: int, duration: float, size) -> list:
+    h, w = size
+    assets = []
+    for i in range(scenes):
+        odd_one_out = i == scenes - 1 and scenes > 2
+        clip = os.path.join(work_dir, f'scene_{i:02d}.mp4')
+        source = f'color=c=0x2050c0:size={w}x{h}:rate=24' if odd_one_out else f'testsrc=size={w}x{h}:rate=24'
+        _make_clip(clip, source, duration)
+        keyframes = []
+        for f in range(2):
+            path = os.path.join(work_dir, f'scene_{i:02d}_kf{f}.png')
+            _draw_keyframe(path, i, f, size, odd_one_out)
+            keyframes.append(path)
+        assets.append({
+            'scene_id': f'scene_{i:02d}',
+            'order': i,
+            'video_path': clip,
+            'keyframes': keyframes,
+            'video_info': {'fps': 24.0, 'duration': duration, 'width': w, 'height': h},
+            'description': '公园里的人物沿小路行走' if not odd_one_out else '夜晚的城市街道',
+            'prompt_data': {'original_prompt': '人物在公园场景中行走，写实风格'},
+        })
+    return assets
+
+
+def _write_config(work_dir: str, threshold: float, process_pool: bool, memo: bool) -> str:
+    with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    for key in ('consistency_threshold', 'visual_threshold', 'temporal_threshold', 'semantic_threshold',
+                'style_threshold'):
+        config[key] = threshold
+    config['check_memo'] = dict(config.get('check_memo') or {}, enabled=memo,
+                                path=os.path.join(work_dir, 'check_memo.db'))
+    config['perceptual_hash'] = dict(config.get('perceptual_hash') or {}, index_file='')
+    config['process_pool'] = dict(config.get('process_pool') or {}, enabled=process_pool)
+    config['embedding_store'] = dict(config.get('embedding_store') or {}, root=os.path.join(work_dir, 'embeddings'))
+    config['keyframe_cache_dir'] = None
+    config['video_processing'] = dict(config.get('video_processing') or {}, temp_dir=os.path.join(work_dir, 'tmp'))
+    config['logging'] = dict(config.get('logging') or {}, level='WARNING')
+    path = os.path.join(work_dir, 'config.yaml')
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return path
+
+
+# ---- 计时 ----
+
+def _timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {
+        'repeat': repeat,
+        'first_ms': round(samples[0], 2),
+        'best_ms': round(min(samples), 2),
+        'mean_ms': round(sum(samples) / len(samples), 2),
+    }
+
+
+def _copy_keyframes(pairs: list, target_dir: str) -> list:
+    os.makedirs(target_dir, exist_ok=True)
+    copies = {}
+
+    def copy_scene(scene):
+        if scene['scene_id'] not in copies:
+            keyframes = []
+            for path in scene['keyframes']:
+                target = os.path.join(target_dir, os.path.basename(path))
+                shutil.copyfile(path, target)
+                keyframes.append(target)
+            copies[scene['scene_id']] = dict(scene, keyframes=keyframes)
+        return copies[scene['scene_id']]
+
+    return [(copy_scene(prev), copy_scene(cur)) for prev, cur in pairs]
+
+
+_DIMENSIONS = ('visual', 'temporal', 'semantic', 'style')
+
+
+def _missing_api(module_name: str, attr: str = None):
+    """被测提交中不存在该接口时返回原因（该计时项记为跳过），存在时返回 None"""
+    try:
+        target = importlib.import_module(module_name)
+    except ImportError as e:
+        return f'{module_name}: {e}'
+    for part in (attr or '').split('.') if attr else ():
+        if not hasattr(target, part):
+            return f'{module_name}.{attr} 不存在'
+        target = getattr(target, part)
+    return None
+
+
+def _checker_errors(check_results: list) -> dict:
+    """统计各维度检查器异常（结果中带“检查异常”问题或 success 为 False）与降级结果的次数，以及整对检查失败次数"""
+    counts = {dim: {'errors': 0, 'fallbacks': 0} for dim in _DIMENSIONS}
+    counts['pair_errors'] = 0
+    for result in check_results:
+        if result is None or 'error' in result:
+            counts['pair_errors'] += 1
+            continue
+        for dim in _DIMENSIONS:
+            dim_result = result.get(f'{dim}_result') or {}
+            if dim_result.get('success') is False or any('检查异常' in str(issue) for issue in dim_result.get('issues', [])):
+                counts[dim]['errors'] += 1
+            if dim_result.get('fallback'):
+                counts[dim]['fallbacks'] += 1
+    return counts
+
+
+def _total_errors(results: dict) -> int:
+    total = 0
+    for row in results.values():
+        errors = row.get('checker_errors') if isinstance(row, dict) else None
+        if errors:
+            total += errors['pair_errors'] + sum(errors[dim]['errors'] for dim in _DIMENSIONS)
+    return total
+
+
+def benchmark(assets: list, config_path: str, work_dir: str, repeat: int, stubs: _StubModelCalls) -> dict:
+    # 必测项只使用各提交都有的公开接口（ConsistencyAgent.check_consistency、AnalysisModule.evaluate_consistency、
+    # SimilarityCalculator、OpticalFlowAnalyzer、VideoUtils），其余计时项在被测提交缺少对应接口时记为 skipped
+    from video_consistency_agent.agent.analysis import AnalysisModule
+    from video_consistency_agent.agent.consistency_agent import ConsistencyAgent
+    from video_consistency_agent.utils.deep_feature_extractor import OpticalFlowAnalyzer
+    from video_consistency_agent.utils.similarity import SimilarityCalculator
+    from video_consistency_agent.utils.video_utils import VideoUtils
+
+    # 先构建 Agent，进程级单例（调度器、线程池、进程池、组件注册表）按基准配置初始化
+    t0 = time.perf_counter()
+    agent = ConsistencyAgent(config_path)
+    results = {'agent_init': {'repeat': 1, 'first_ms': round((time.perf_counter() - t0) * 1000, 2)}}
+    config = agent.config
+    components = getattr(agent, 'components', None)
+    pairs = [(assets[i - 1], assets[i]) for i in range(1, len(assets))]
+    transition_paths = [(prev['keyframes'][-1], cur['keyframes'][0]) for prev, cur in pairs]
+
+    def skip(name, reason):
+        results[name] = {'skipped': reason}
+
+    # 关键帧提取（ffmpeg）
+    video_utils = VideoUtils()
+    results['keyframe_extraction'] = _timed(
+        lambda: [video_utils.extract_keyframes(a['video_path'], num_keyframes=2) for a in assets], repeat)
+
+    # 传统视觉指标：转场帧对的整体视觉相似度与 SSIM（每次新建计算器，即冷缓存）
+    results['visual_similarity'] = _timed(
+        lambda: [SimilarityCalculator(config).calculate_overall_visual_similarity(a, b) for a, b in transition_paths],
+        repeat)
+    results['ssim_similarity'] = _timed(
+        lambda: [SimilarityCalculator(config).calculate_structural_similarity(a, b) for a, b in transition_paths],
+        repeat)
+
+    # 细分指标：解码为工作集，以及直方图 / SSIM / 边缘各自的耗时（需要图像比较引擎）
+    reason = _missing_api('video_consistency_agent.utils.image_comparison', 'ImageComparisonEngine')
+    if reason:
+        for name in ('image_decode', 'histogram_similarity', 'ssim', 'edge_similarity', 'compare_cold'):
+            skip(name, reason)
+    else:
+        from video_consistency_agent.utils.image_comparison import ImageComparisonEngine, _histogram_similarity
+        image_config = config.get('image_comparison')
+        results['image_decode'] = _timed(
+            lambda: [ImageComparisonEngine(image_config).load(p) for pair in transition_paths for p in pair], repeat)
+        engine = ImageComparisonEngine(image_config)
+        working = [(engine.load(a), engine.load(b)) for a, b in transition_paths]
+        results['histogram_similarity'] = _timed(
+            lambda: [[_histogram_similarity(h1, h2) for h1, h2 in zip(a.histograms, b.histograms)] for a, b in working],
+            repeat)
+        results['ssim'] = _timed(lambda: [engine.structural_similarity(a, b) for a, b in working], repeat)
+        results['edge_similarity'] = _timed(
+            lambda: [np.logical_and(a.edges, b.edges).sum() / max(1, np.logical_or(a.edges, b.edges).sum())
+                     for a, b in working], repeat)
+        results['compare_cold'] = _timed(
+            lambda: ImageComparisonEngine(image_config).compare_many(transition_paths), repeat)
+
+    # 光流：逐帧对计算，以及相邻场景视频的运动一致性
+    flow = OpticalFlowAnalyzer(config)
+    frames = flow.extract_frames(assets[0]['video_path'], num_frames=10)
+    results['optical_flow'] = _timed(
+        lambda: [flow.calculate_optical_flow(a, b) for a, b in zip(frames, frames[1:])], repeat)
+    results['optical_flow']['frames'] = len(frames)
+    results['motion_consistency'] = _timed(
+        lambda: flow.calculate_motion_consistency(pairs[0][0]['video_path'], pairs[0][1]['video_path']), repeat)
+
+    # AnalysisModule：全量检查与分级检查（后者需要被测提交支持 cascade 配置）
+    def evaluate(module, scene_pairs, outputs):
+        async def run():
+            return await asyncio.gather(*(module.evaluate_consistency(cur, prev) for prev, cur in scene_pairs))
+        outputs[:] = asyncio.run(run())
+
+    for name, enabled in (('analysis_full', False), ('analysis_cascade', True)):
+        module_config = dict(config, cascade=dict(config.get('cascade') or {}, enabled=enabled))
+        module = AnalysisModule(module_config, components) if components is not None else AnalysisModule(module_config)
+        if enabled and not hasattr(module, 'get_cascade_stats'):
+            skip(name, 'AnalysisModule 不支持分级检查')
+            continue
+        # 每个变体使用各自的关键帧副本，首次计时不会命中前一变体留下的按路径缓存
+        variant_pairs = _copy_keyframes(pairs, os.path.join(work_dir, name))
+        outputs = []
+        before = dict(stubs.counts)
+        results[name] = _timed(lambda: evaluate(module, variant_pairs, outputs), repeat)
+        results[name]['model_calls'] = {k: stubs.counts[k] - before[k] for k in before}
+        results[name]['checker_errors'] = _checker_errors(outputs)
+        if enabled:
+            results[name]['cascade'] = module.get_cascade_stats()
+
+    # ConsistencyAgent：逐对检查与整段序列检查（场景只给视频路径，含感知阶段）
+    def video_scene(asset):
+        return {k: asset[k] for k in ('scene_id', 'order', 'video_path', 'description', 'prompt_data')}
+
+    pair_outputs = []
+
+    def check_pairs():
+        async def run():
+            return await asyncio.gather(*(
+                agent.check_consistency(video_scene(cur), video_scene(prev), cur['prompt_data']) for prev, cur in pairs))
+        pair_outputs[:] = asyncio.run(run())
+
+    before = dict(stubs.counts)
+    results['agent_check_consistency'] = _timed(check_pairs, repeat)
+    results['agent_check_consistency']['model_calls'] = {k: stubs.counts[k] - before[k] for k in before}
+    results['agent_check_consistency']['checker_errors'] = _checker_errors(
+        [None if 'error' in r else r.get('consistency_results') for r in pair_outputs])
+
+    if not hasattr(agent, 'check_sequence'):
+        skip('agent_check_sequence', 'ConsistencyAgent.check_sequence 不存在')
+        return results
+    sequence_output = {}
+
+    def check_sequence():
+        sequence_output.update(asyncio.run(agent.check_sequence([video_scene(a) for a in assets])))
+
+    before = dict(stubs.counts)
+    results['agent_check_sequence'] = _timed(check_sequence, repeat)
+    results['agent_check_sequence']['model_calls'] = {k: stubs.counts[k] - before[k] for k in before}
+    results['agent_check_sequence']['checker_errors'] = _checker_errors(
+        [None if 'error' in p['result'] else p['result'].get('consistency_results')
+         for p in sequence_output.get('pairs', [])])
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: dict, baseline_path: str) -> dict:
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f).get('results', {})
+    speedups = {}
+    for name, row in results.items():
+        old = baseline.get(name, {})
+        key = 'best_ms' if 'best_ms' in row and 'best_ms' in old else 'first_ms'
+        if old.get(key) and row.get(key):
+            speedups[name] = round(old[key] / row[key], 2)
+    return speedups
+
+
+def main():
+    parser = argparse.ArgumentParser(description='video_consistency_agent 检查器基准')
+    parser.add_argument('--scenes', type=int, default=4, help='合成场景数（最后一个场景刻意不一致）')
+    parser.add_argument('--duration', type=float, default=2.0, help='每个场景视频时长（秒）')
+    parser.add_argument('--size', default='720x1280', help='视频与关键帧尺寸（高x宽）')
+    parser.add_argument('--repeat', type=int, default=3, help='每项计时重复次数')
+    parser.add_argument('--threshold', type=float, default=0.7, help='各维度与整体一致性阈值')
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0, help='VLM / LLM 桩的模拟延迟（毫秒）')
+    parser.add_argument('--process-pool', action='store_true', help='启用 CPU 指标进程池')
+    parser.add_argument('--memo', action='store_true', help='启用检查结果记忆（默认关闭，重复计时不命中记忆）')
+    parser.add_argument('--work-dir', help='素材与缓存目录（保留），默认使用运行结束即删除的临时目录')
+    parser.add_argument('--strict', action='store_true', help='任一检查器异常时以非零状态退出')
+    parser.add_argument('--output', help='结果 JSON 写入路径')
+    parser.add_argument('--baseline', help='其他提交的结果 JSON，输出各项相对加速比')
+    args = parser.parse_args()
+    if args.scenes < 2:
+        parser.error('--scenes 至少为 2')
+
+    for key in ('ALIBABA_CLOUD_ACCESS_KEY_ID', 'ALIBABA_CLOUD_ACCESS_KEY_SECRET'):
+        os.environ.pop(key, None)
+    stubs = _StubModelCalls(args.stub_latency_ms)
+    stubs.install()
+
+    h, w = (int(v) for v in args.size.lower().split('x'))
+    with contextlib.ExitStack() as stack:
+        # 未指定 --work-dir 时素材与缓存放在临时目录，运行结束即删除
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix='vca_bench_'))
+        os.makedirs(work_dir, exist_ok=True)
+        assets = _make_assets(work_dir, args.scenes, args.duration, (h, w))
+        config_path = _write_config(work_dir, args.threshold, args.process_pool, args.memo)
+
+        # 检查器、客户端的 print 输出转到 stderr，stdout 只保留结果 JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            results = benchmark(assets, config_path, work_dir, args.repeat, stubs)
+    checker_errors = _total_errors(results)
+    summary = {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+            'scenes': args.scenes,
+            'size': [h, w],
+            'duration': args.duration,
+            'threshold': args.threshold,
+            'stub_latency_ms': args.stub_latency_ms,
+            'process_pool': args.process_pool,
+            'memo': args.memo,
+            'work_dir': args.work_dir,
+        },
+        'model_calls': dict(stubs.counts),
+        'checker_errors': checker_errors,
+        'results': results,
+    }
+    if args.baseline:
+        summary['speedup_vs_baseline'] = _compare(results, args.baseline)
+
+    text = json.dumps(summary, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+    if checker_errors:
+        print(f'[基准] 检查器异常 {checker_errors} 次，计时包含异常路径，见各项 checker_errors', file=sys.stderr)
+        if args.strict:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+快速 SSIM 校验与基准：video_consistency_agent.utils.fast_ssim vs skimage.metrics.structural_similarity。
+
+在 backend 目录下运行：
+    python scripts/benchmark_ssim.py --images /path/to/keyframes --repeat 3
+
+--images 指定本地样本目录（jpg/png，相邻两张组成一对）；不指定时生成带噪声、模糊、偏色的合成图像对。
+校验项：同分辨率下与 skimage 默认参数 / 高斯窗口参数的绝对误差；
+基准项：skimage（full=True，原实现）、快速 SSIM 原分辨率、快速 SSIM 工作分辨率、MS-SSIM 的耗时。结果以 JSON 打印。
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def _synthetic_pairs(count: int, size) -> list:
+    rng = np.random.default_rng(0)
+    pairs = []
+    h, w = size
+    for i in range(count):
+        base = cv2.GaussianBlur(rng.integers(0, 256, (h, w), dtype=np.uint8), (0, 0), 3 + i % 4)
+        cv2.rectangle(base, (w // 5, h // 5), (w // 2, h // 2), int(rng.integers(0, 256)), -1)
+        variant = cv2.GaussianBlur(base, (5, 5), 0)
+        variant = cv2.add(variant, rng.integers(0, 12 + 6 * i, (h, w), dtype=np.uint8))
+        pairs.append((f'synthetic_{i}', base, variant))
+    return pairs
+
+
+def _image_pairs(image_dir: str) -> list:
+    paths = sorted(p for ext in ('*.jpg', '*.jpeg', '*.png') for p in glob.glob(os.path.join(image_dir, ext)))
+    pairs = []
+    for first, second in zip(paths, paths[1:]):
+        img1 = cv2.imread(first, cv2.IMREAD_GRAYSCALE)
+        img2 = cv2.imread(second, cv2.IMREAD_GRAYSCALE)
+        if img1 is None or img2 is None:
+            continue
+        if img1.shape != img2.shape:
+            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
+        pairs.append((f'{os.path.basename(first)}|{os.path.basename(second)}', img1, img2))
+    return pairs
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def benchmark(pairs: list, working_size: int, repeat: int) -> dict:
+    from skimage.metrics import structural_similarity as sk_ssim
+    from video_consistency_agent.utils.fast_ssim import ms_ssim, ssim
+
+    rows = []
+    for name, img1, img2 in pairs:
+        reference = sk_ssim(img1, img2)
+        reference_gaussian = sk_ssim(img1, img2, gaussian_weights=True, sigma=1.5,
+                                     use_sample_covariance=False, data_range=255)
+        rows.append({
+            'pair': name,
+            'shape': list(img1.shape),
+            'skimage_ssim': round(float(reference), 6),
+            'abs_err_box': float(abs(ssim(img1, img2) - reference)),
+            'abs_err_gaussian': float(abs(ssim(img1, img2, gaussian=True) - reference_gaussian)),
+            'fast_ssim_working_size': round(ssim(img1, img2, working_size), 6),
+            'ms_ssim_working_size': round(ms_ssim(img1, img2, working_size), 6),
+            'ms_skimage_full': round(_best_ms(lambda: sk_ssim(img1, img2, full=True), repeat), 2),
+            'ms_fast_full': round(_best_ms(lambda: ssim(img1, img2), repeat), 2),
+            'ms_fast_working_size': round(_best_ms(lambda: ssim(img1, img2, working_size), repeat), 2),
+            'ms_ms_ssim_working_size': round(_best_ms(lambda: ms_ssim(img1, img2, working_size), repeat), 2),
+        })
+
+    def total(key):
+        return sum(r[key] for r in rows)
+
+    return {
+        'pairs': len(rows),
+        'working_size': working_size,
+        'max_abs_err_box': max(r['abs_err_box'] for r in rows),
+        'max_abs_err_gaussian': max(r['abs_err_gaussian'] for r in rows),
+        'speedup_full_resolution': round(total('ms_skimage_full') / total('ms_fast_full'), 2),
+        'speedup_working_size': round(total('ms_skimage_full') / total('ms_fast_working_size'), 2),
+        'rows': rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='快速 SSIM 校验与基准')
+    parser.add_argument('--images', help='本地样本图像目录（相邻两张组成一对），不指定时自动生成')
+    parser.add_argument('--count', type=int, default=6, help='自动生成的图像对数量')
+    parser.add_argument('--size', default='1080x1920', help='自动生成图像的尺寸（高x宽）')
+    parser.add_argument('--working-size', type=int, default=512, help='工作分辨率（长边像素）')
+    parser.add_argument('--repeat', type=int, default=3, help='每项计时重复次数')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='与 skimage 的最大允许误差')
+    args = parser.parse_args()
+
+    if args.images:
+        pairs = _image_pairs(args.images)
+    else:
+        h, w = (int(v) for v in args.size.lower().split('x'))
+        pairs = _synthetic_pairs(args.count, (h, w))
+    if not pairs:
+        parser.error('没有可用的图像对')
+
+    summary = benchmark(pairs, args.working_size, args.repeat)
+    summary['passed'] = max(summary['max_abs_err_box'], summary['max_abs_err_gaussian']) <= args.tolerance
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    sys.exit(0 if summary['passed'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+VideoSynthesisAgent 合成基准：FFmpeg filter_complex 渲染 vs MoviePy 逐帧合成。
+
+在 backend 目录下运行：
+    python scripts/benchmark_video_synthesis.py --shots 12 --duration 3 --repeat 2
+
+素材全部本地生成（PIL 彩色分镜图 + ffmpeg sine 音源），每次渲染在独立子进程中执行，
+分别统计墙钟耗时与峰值 RSS（含 ffmpeg 子进程），结果以 JSON 打印。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_assets(work_dir: str, shots: int, duration: float, with_audio: bool) -> dict:
+    from PIL import Image, ImageDraw
+
+    images = []
+    for i in range(shots):
+        path = os.path.join(work_dir, f'shot_{i:03d}.png')
+        img = Image.new('RGB', (1280, 720), ((i * 53) % 256, (i * 97) % 256, (i * 151) % 256))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([100 + i * 20, 100, 500 + i * 20, 500], outline=(255, 255, 255), width=8)
+        draw.text((60, 60), f'SHOT {i + 1}', fill=(255, 255, 255))
+        img.save(path)
+        images.append({'image_url': f'file://{path}', 'duration': duration, 'shot_id': i})
+
+    narration = music = None
+    if with_audio:
+        total = shots * duration
+        narration = os.path.join(work_dir, 'narration.wav')
+        music = os.path.join(work_dir, 'music.wav')
+        subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i',
+             f'sine=frequency=440:duration={total * 0.8:.2f}', narration],
+            check=True,
+        )
+        subprocess.run(
+            ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i',
+             'sine=frequency=220:duration=7', music],
+            check=True,
+        )
+    return {'images': images, 'narration': narration, 'music': music}
+
+
+def _run_once(renderer: str, assets: dict, out_dir: str, queue) -> None:
+    from app.agents.video_synthesis_agent import VideoSynthesisAgent
+
+    agent = VideoSynthesisAgent({'output_dir': out_dir, 'synthesis_renderer': renderer})
+    output_path = os.path.join(out_dir, f'bench_{renderer}.mp4')
+    t0 = time.perf_counter()
+    _, duration = agent._synthesize_video_sync(
+        assets['images'], assets['narration'], assets['music'], output_path
+    )
+    elapsed = time.perf_counter() - t0
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    queue.put({
+        'elapsed_s': round(elapsed, 3),
+        'video_duration_s': round(duration, 3),
+        'peak_rss_python_mb': round(self_rss / 1024, 1),
+        'peak_rss_child_mb': round(child_rss / 1024, 1),
+        'output_bytes': os.path.getsize(output_path),
+    })
+
+
+def benchmark(shots: int, duration: float, repeat: int, with_audio: bool, renderers) -> dict:
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='synth_bench_') as work_dir:
+        assets = _make_assets(work_dir, shots, duration, with_audio)
+        results = {}
+        for renderer in renderers:
+            runs = []
+            for _ in range(repeat):
+                queue = ctx.Queue()
+                proc = ctx.Process(target=_run_once, args=(renderer, assets, work_dir, queue))
+                proc.start()
+                proc.join()
+                if proc.exitcode != 0 or queue.empty():
+                    runs.append({'error': f'exit code {proc.exitcode}'})
+                else:
+                    runs.append(queue.get())
+            ok = [r for r in runs if 'error' not in r]
+            results[renderer] = {
+                'runs': runs,
+                'best_elapsed_s': min((r['elapsed_s'] for r in ok), default=None),
+                'max_peak_rss_mb': max(
+                    (r['peak_rss_python_mb'] + r['peak_rss_child_mb'] for r in ok), default=None
+                ),
+            }
+
+    summary = {
+        'shots': shots,
+        'shot_duration_s': duration,
+        'with_audio': with_audio,
+        'results': results,
+    }
+    ff, mp = results.get('ffmpeg', {}), results.get('moviepy', {})
+    if ff.get('best_elapsed_s') and mp.get('best_elapsed_s'):
+        summary['speedup'] = round(mp['best_elapsed_s'] / ff['best_elapsed_s'], 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VideoSynthesisAgent 合成基准')
+    parser.add_argument('--shots', type=int, default=12, help='镜头数量')
+    parser.add_argument('--duration', type=float, default=3.0, help='每个镜头时长（秒）')
+    parser.add_argument('--repeat', type=int, default=2, help='每种渲染器重复次数')
+    parser.add_argument('--no-audio', action='store_true', help='不生成旁白与背景音乐')
+    parser.add_argument('--renderers', default='ffmpeg,moviepy', help='逗号分隔：ffmpeg,moviepy')
+    args = parser.parse_args()
+
+    os.environ['USE_MOCK_IMAGE_GENERATION'] = 'false'
+    summary = benchmark(
+        args.shots,
+        args.duration,
+        args.repeat,
+        not args.no_audio,
+        [r.strip() for r in args.renderers.split(',') if r.strip()],
+    )
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,51 @@
-from typing import Dict, Any
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional
 from ..checkers.visual_checker import VisualChecker
 from ..checkers.temporal_checker import TemporalChecker
 from ..checkers.semantic_checker import SemanticChecker
 from ..checkers.style_checker import StyleChecker
+from ..utils.components import ComponentRegistry, get_components
+from ..utils.executor import run_blocking
+from ..utils.fallback_tracker import track_fallbacks
+from ..utils.image_comparison import get_comparison_engine
+from ..utils.perceptual_hash import get_hash_index
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('visual', 'temporal', 'semantic', 'style')
+DIMENSION_NAMES = {'visual': '视觉', 'temporal': '时序', 'semantic': '语义', 'style': '风格'}
 
 class AnalysisModule:
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
         self.config = config
-        self.visual_checker = VisualChecker(config)
-        self.temporal_checker = TemporalChecker(config)
-        self.semantic_checker = SemanticChecker(config)
-        self.style_checker = StyleChecker(config)
+        components = components or get_components(config)
+        self.visual_checker = VisualChecker(config, components)
+        self.temporal_checker = TemporalChecker(config, components)
+        self.semantic_checker = SemanticChecker(config, components)
+        self.style_checker = StyleChecker(config, components)
+        # 分级检查：先用本地廉价指标（感知哈希、直方图、元数据）估分，只有落在阈值附近的不确定区间时
+        # 才运行 CLIP / VLM / LLM 等昂贵检查器；默认关闭
+        cascade_config = config.get('cascade') or {}
+        self.cascade_enabled = cascade_config.get('enabled', False)
+        self.checkers = {
+            'visual': self.visual_checker.check_visual_consistency,
+            'temporal': self.temporal_checker.check_temporal_consistency,
+            'semantic': self.semantic_checker.check_semantic_consistency,
+            'style': self.style_checker.check_style_consistency
+        }
+        self.uncertain_band = float(cascade_config.get('uncertain_band', 0.1))
+        self._stats_lock = threading.Lock()
+        self.cascade_stats = {
+            'decisions': {'early_pass': 0, 'early_fail': 0, 'full': 0},
+            'tiers': {tier: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0} for tier in ('cheap', 'full')}
+        }
     
     async def evaluate_consistency(self, current_scene: Dict[str, Any], prev_scene: Dict[str, Any], 
-                                 check_dims: Dict[str, bool] = None) -> Dict[str, Any]:
+                                 check_dims: Dict[str, bool] = None,
+                                 cached_results: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
         if not prev_scene:
             return {
                 'passed': True,
@@ -33,33 +65,44 @@ class AnalysisModule:
                 'style_changed': True
             }
         
-        import asyncio
-        
         default_result = {'score': 1.0, 'passed': True, 'issues': []}
+        # 未变化的维度优先沿用记忆中的结果
+        cached_results = cached_results or {}
+        
+        cascade = None
+        if self.cascade_enabled and any(check_dims.get(f'{dim}_changed', True) for dim in DIMENSIONS):
+            cascade = await self._cheap_tier(current_scene, prev_scene)
+            if cascade['decision'] != 'full':
+                return await self._early_result(cascade, current_scene, prev_scene, check_dims,
+                                                cached_results, default_result)
         
+        started = time.perf_counter()
         tasks = []
         
         if check_dims.get('visual_changed', True):
-            tasks.append(self.visual_checker.check_visual_consistency(current_scene, prev_scene))
+            tasks.append(self._run_checker(self.visual_checker.check_visual_consistency(current_scene, prev_scene)))
         else:
-            tasks.append(self._return_default_result(default_result))
+            tasks.append(self._return_default_result(cached_results.get('visual', default_result)))
         
         if check_dims.get('temporal_changed', True):
-            tasks.append(self.temporal_checker.check_temporal_consistency(current_scene, prev_scene))
+            tasks.append(self._run_checker(self.temporal_checker.check_temporal_consistency(current_scene, prev_scene)))
         else:
-            tasks.append(self._return_default_result(default_result))
+            tasks.append(self._return_default_result(cached_results.get('temporal', default_result)))
         
         if check_dims.get('semantic_changed', True):
-            tasks.append(self.semantic_checker.check_semantic_consistency(current_scene, prev_scene))
+            tasks.append(self._run_checker(self.semantic_checker.check_semantic_consistency(current_scene, prev_scene)))
         else:
-            tasks.append(self._return_default_result(default_result))
+            tasks.append(self._return_default_result(cached_results.get('semantic', default_result)))
         
         if check_dims.get('style_changed', True):
-            tasks.append(self.style_checker.check_style_consistency(current_scene, prev_scene))
+            tasks.append(self._run_checker(self.style_checker.check_style_consistency(current_scene, prev_scene)))
         else:
-            tasks.append(self._return_default_result(default_result))
+            tasks.append(self._return_default_result(cached_results.get('style', default_result)))
         
         visual_result, temporal_result, semantic_result, style_result = await asyncio.gather(*tasks)
+        if cascade is not None:
+            cascade['tier_ms']['full'] = self._record_tier('full', started)
+            self._record_decision('full')
         
         overall_score = self._calculate_overall_score(
             visual_result['score'],
@@ -86,9 +129,161 @@ class AnalysisModule:
             'visual_result': visual_result,
             'temporal_result': temporal_result,
             'semantic_result': semantic_result,
-            'style_result': style_result
+            'style_result': style_result,
+            'cascade': cascade
+        }
+    
+    async def _cheap_tier(self, current_scene: Dict[str, Any], prev_scene: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        第 0 级：廉价指标估分并给出分级决策
+        
+        Returns:
+            {'decision': early_pass / early_fail / full, 'cheap_score': 加权估分（无可用指标时为 None）,
+             'dimension_scores': {维度: 估分}, 'tier_ms': {'cheap': 耗时毫秒}}
+        """
+        started = time.perf_counter()
+        try:
+            dimension_scores = await run_blocking(self._cheap_scores, current_scene, prev_scene)
+        except Exception as e:
+            logger.warning(f"[分级检查] 廉价指标计算失败，直接运行完整检查: {e}")
+            dimension_scores = {}
+        
+        weights = self.config.get('consistency_weights', {})
+        total_weight = sum(weights.get(dim, 0.0) for dim in dimension_scores)
+        cheap_score = None
+        decision = 'full'
+        # 没有画面指标时只凭元数据无法判断，交给完整检查
+        if 'visual' in dimension_scores and total_weight > 0:
+            cheap_score = sum(score * weights.get(dim, 0.0) for dim, score in dimension_scores.items()) / total_weight
+            threshold = self.config.get('consistency_threshold', 0.85)
+            if cheap_score >= threshold + self.uncertain_band:
+                decision = 'early_pass'
+            elif cheap_score < threshold - self.uncertain_band:
+                decision = 'early_fail'
+        
+        tier_ms = self._record_tier('cheap', started)
+        if decision != 'full':
+            self._record_decision(decision)
+        logger.debug(f"[分级检查] 廉价估分 {cheap_score}，决策 {decision}，耗时 {tier_ms:.1f}ms")
+        return {
+            'decision': decision,
+            'cheap_score': cheap_score,
+            'dimension_scores': dimension_scores,
+            'tier_ms': {'cheap': tier_ms}
+        }
+    
+    def _cheap_scores(self, current_scene: Dict[str, Any], prev_scene: Dict[str, Any]) -> Dict[str, float]:
+        # 转场处（上一场景末帧 / 当前场景首帧）的哈希与直方图 + 双方视频元数据
+        scores = {}
+        current_keyframes = current_scene.get('keyframes') or []
+        prev_keyframes = prev_scene.get('keyframes') or []
+        if current_keyframes and prev_keyframes:
+            prev_frame, current_frame = prev_keyframes[-1], current_keyframes[0]
+            hash_result = get_hash_index(self.config.get('perceptual_hash')).classify(prev_frame, current_frame)
+            metrics = get_comparison_engine(self.config.get('image_comparison')).compare(prev_frame, current_frame)
+            if hash_result['similarity'] is not None:
+                scores['visual'] = (hash_result['similarity'] + metrics['overall_visual_similarity']) / 2
+            else:
+                scores['visual'] = metrics['overall_visual_similarity']
+            scores['style'] = metrics['color_similarity']
+        
+        current_info = current_scene.get('video_info') or current_scene
+        prev_info = prev_scene.get('video_info') or prev_scene
+        if current_info.get('fps') and prev_info.get('fps') and \
+           current_info.get('duration') and prev_info.get('duration'):
+            scores['temporal'] = self.temporal_checker.check_timeline_consistency(current_info, prev_info)
+            if current_info.get('width') and prev_info.get('width'):
+                same_resolution = (current_info.get('width'), current_info.get('height')) == \
+                                  (prev_info.get('width'), prev_info.get('height'))
+                if 'style' in scores:
+                    scores['style'] = scores['style'] * 0.8 + (0.2 if same_resolution else 0.0)
+        return {dim: float(max(0.0, min(1.0, score))) for dim, score in scores.items()}
+    
+    async def _early_result(self, cascade: Dict[str, Any], current_scene: Dict[str, Any], prev_scene: Dict[str, Any],
+                            check_dims: Dict[str, bool], cached_results: Dict[str, Dict[str, Any]],
+                            default_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        廉价估分已足以判断时直接给出结果
+        
+        只有本维度有廉价估分的维度才跳过深度检查；没有估分的变化维度（如只改了描述时的语义）仍运行完整检查器，
+        未变化的维度沿用记忆结果，整体分数与结论按各维度实际分数重新计算
+        """
+        cheap_score = cascade['cheap_score']
+        results = {}
+        deep_dims = []
+        for dim in DIMENSIONS:
+            if not check_dims.get(f'{dim}_changed', True):
+                results[dim] = cached_results.get(dim, default_result)
+            elif dim in cascade['dimension_scores']:
+                score = cascade['dimension_scores'][dim]
+                passed = score >= self.config.get(f'{dim}_threshold', 0.8)
+                issues = [] if passed else [f'{DIMENSION_NAMES[dim]}快速预检分数 {score:.2f} 低于阈值（跳过深度检查）']
+                results[dim] = {'score': score, 'passed': passed, 'issues': issues, 'tier': 'cheap'}
+            else:
+                deep_dims.append(dim)
+        if deep_dims:
+            deep_results = await asyncio.gather(
+                *(self._run_checker(self.checkers[dim](current_scene, prev_scene)) for dim in deep_dims)
+            )
+            results.update(zip(deep_dims, deep_results))
+        cascade['deep_dims'] = deep_dims
+        
+        overall_score = self._calculate_overall_score(*(results[dim]['score'] for dim in DIMENSIONS))
+        passed = overall_score >= self.config.get('consistency_threshold', 0.85)
+        all_issues = [issue for dim in DIMENSIONS if not results[dim]['passed'] for issue in results[dim]['issues']]
+        if cascade['decision'] == 'early_fail' and not passed and not all_issues:
+            all_issues.append(f'快速预检整体分数 {cheap_score:.2f} 明显低于阈值（跳过深度检查）')
+        
+        result = {
+            'passed': passed,
+            'overall_score': overall_score,
+            'issues': all_issues,
+            'cascade': cascade
+        }
+        for dim in DIMENSIONS:
+            result[f'{dim}_score'] = results[dim]['score']
+            result[f'{dim}_result'] = results[dim]
+        return result
+    
+    def _record_tier(self, tier: str, started: float) -> float:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            stats = self.cascade_stats['tiers'][tier]
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        return elapsed_ms
+    
+    def _record_decision(self, decision: str) -> None:
+        with self._stats_lock:
+            self.cascade_stats['decisions'][decision] += 1
+    
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """分级检查统计：各决策次数、提前结束比例，以及每级的调用次数与平均 / 最大耗时（毫秒）"""
+        with self._stats_lock:
+            decisions = dict(self.cascade_stats['decisions'])
+            tiers = {
+                tier: dict(stats, avg_ms=stats['total_ms'] / stats['count'] if stats['count'] else 0.0)
+                for tier, stats in self.cascade_stats['tiers'].items()
+            }
+        total = sum(decisions.values())
+        early = decisions['early_pass'] + decisions['early_fail']
+        return {
+            'enabled': self.cascade_enabled,
+            'uncertain_band': self.uncertain_band,
+            'decisions': decisions,
+            'early_exit_rate': early / total if total else 0.0,
+            'tiers': tiers
         }
     
+    async def _run_checker(self, check) -> Dict[str, Any]:
+        """运行一个维度的检查；期间 VLM / LLM 或检查器发生降级时在结果上标记 fallback（不写入检查结果记忆）"""
+        with track_fallbacks() as fallbacks:
+            result = await check
+        if fallbacks and not result.get('fallback'):
+            result = dict(result, fallback=True, fallback_sources=sorted(set(fallbacks)))
+        return result
+    
     async def _return_default_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """返回默认结果的异步方法"""
         return result
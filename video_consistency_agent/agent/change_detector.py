@@ -1,17 +1,41 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import hashlib
 import json
 
+from ..utils.check_memo import CheckResultMemo, scene_snapshot
+
 class ChangeDetector:
     """
     变化检测器，用于检测场景间的变化，实现增量检查
     """
     
-    def __init__(self):
+    def __init__(self, memo: Optional[CheckResultMemo] = None, config_version: str = ''):
         """
         初始化变化检测器
+        
+        Args:
+            memo: 持久化检查结果记忆；提供时跨进程、跨运行复用未变化场景对的结果
+            config_version: 检查器配置版本，配置变化后旧记忆不再命中
+        """
+        self.memo = memo
+        self.config_version = config_version
+    
+    def lookup(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        查询场景对（按双方关键帧内容哈希）的记忆
+        
+        Returns:
+            {'current_scene': 当时的场景快照, 'results': 各维度结果}，未命中或未启用记忆时为 None
         """
-        pass
+        if self.memo is None:
+            return None
+        return self.memo.get(current_scene, previous_scene, self.config_version)
+    
+    def record(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any],
+               consistency_results: Dict[str, Any]) -> None:
+        """记录场景对的各维度检查结果"""
+        if self.memo is not None:
+            self.memo.put(current_scene, previous_scene, self.config_version, consistency_results)
     
     def calculate_scene_hash(self, scene: Dict[str, Any]) -> str:
         """
@@ -32,11 +56,14 @@ class ChangeDetector:
             'video_path': scene.get('video_path', ''),
             'keyframes': scene.get('keyframes', []),
             'video_info': scene.get('video_info', {}),
-            'duration': scene.get('duration', 0)
+            'duration': scene.get('duration', 0),
+            'description': scene.get('description', ''),
+            'style_elements': scene.get('style_elements', {}),
+            'technical_params': scene.get('technical_params', {})
         }
         
         # 转换为JSON字符串并计算哈希
-        key_str = json.dumps(key_info, sort_keys=True, ensure_ascii=False)
+        key_str = json.dumps(key_info, sort_keys=True, ensure_ascii=False, default=str)
         return hashlib.md5(key_str.encode('utf-8')).hexdigest()
     
     def detect_changes(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any], 
@@ -47,11 +74,15 @@ class ChangeDetector:
         Args:
             current_scene: 当前场景信息
             previous_scene: 上一个场景信息
-            cached_scene: 缓存的场景信息
+            cached_scene: 缓存的场景信息；不提供时查询持久化记忆
             
         Returns:
             变化检测结果，包含四个维度的变化状态
         """
+        if not cached_scene:
+            entry = self.lookup(current_scene, previous_scene)
+            cached_scene = entry['current_scene'] if entry else None
+        
         if not cached_scene:
             # 没有缓存场景，需要全量检查
             return {
@@ -61,8 +92,8 @@ class ChangeDetector:
                 'style_changed': True
             }
         
-        # 计算哈希值比较
-        current_hash = self.calculate_scene_hash(current_scene)
+        # 计算哈希值比较（缓存场景是记忆中的快照，当前场景按同样方式取快照后再比较）
+        current_hash = self.calculate_scene_hash(self._snapshot(current_scene))
         cached_hash = self.calculate_scene_hash(cached_scene)
         
         if current_hash == cached_hash:
@@ -84,6 +115,14 @@ class ChangeDetector:
         
         return changes
     
+    def _snapshot(self, scene: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        场景快照：与记忆中存储的快照字段一致（关键帧记为内容哈希；未启用记忆时记为路径）
+        """
+        if self.memo is not None:
+            return self.memo.snapshot(scene)
+        return scene_snapshot(scene, scene.get('keyframes'))
+    
     def _detect_visual_changes(self, current_scene: Dict[str, Any], cached_scene: Dict[str, Any]) -> bool:
         """
         检测视觉维度的变化
@@ -1,7 +1,7 @@
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
 import yaml
 import os
-from datetime import datetime
 
 from .perception import PerceptionModule
 from .analysis import AnalysisModule
@@ -9,28 +9,52 @@ from .decision import DecisionModule
 from .feedback import FeedbackModule
 from .change_detector import ChangeDetector
 from ..checkers.story_logic_checker import StoryLogicChecker
+from ..utils.media_scheduler import get_media_scheduler
+from ..utils.scratch_space import get_scratch_space
+from ..utils.check_memo import config_version, get_check_memo
+from ..utils.executor import get_thread_executor, run_blocking
+from ..utils.process_pool import get_process_pool
+from ..utils.image_comparison import get_comparison_engine
+from ..utils.perceptual_hash import get_hash_index
+from ..utils.image_payload import get_image_payloads
+from ..utils.components import get_components
 
 class ConsistencyAgent:
     def __init__(self, config_path: str):
 # 初始化一致性检查Agent
         # 加载配置
         self.config = self._load_config(config_path)
+        # 按配置初始化进程级媒体调度器（ffmpeg 并发上限）
+        get_media_scheduler(self.config.get('media_scheduler'))
+        # 按配置初始化进程级共享线程池（检查器中的阻塞调用在此执行）
+        get_thread_executor(self.config.get('executor'))
+        # 按配置启动 CPU 密集指标的进程池（SSIM 矩阵、光流；未启用时在进程内计算）
+        get_process_pool(self.config.get('process_pool'))
+        # 按配置初始化进程级临时空间（关键帧/音频临时文件的目录与配额）
+        scratch_config = dict(self.config.get('scratch_space') or {})
+        scratch_config.setdefault('root', (self.config.get('video_processing') or {}).get('temp_dir'))
+        get_scratch_space(scratch_config)
+        # 按配置初始化进程级 VLM 图像载荷缓存（缩放、编码后的关键帧在各检查器间共用）
+        get_image_payloads(self.config.get('vlm_payload'))
+
+        # 按配置初始化进程级共享组件注册表（VLM / LLM 客户端、相似度计算器等只构建一次，注入各模块）
+        self.components = get_components(self.config)
 
         # 初始化各模块
-        self.perception = PerceptionModule(self.config)
-        self.analysis = AnalysisModule(self.config)
+        self.perception = PerceptionModule(self.config, self.components)
+        self.analysis = AnalysisModule(self.config, self.components)
         self.decision = DecisionModule(self.config)
-        self.feedback = FeedbackModule(self.config)
+        self.feedback = FeedbackModule(self.config, self.components)
         self.story_logic_checker = StoryLogicChecker(self.config)
 
         # 初始化历史检查结果存储，用于增量检查
         self.history_checks = {}
         # 初始化场景信息缓存
         self.scene_info_cache = {}
-        # 初始化检查结果缓存
-        self.check_result_cache = {}
-        # 初始化检查变化检测机制
-        self.change_detector = ChangeDetector()
+        # 初始化检查变化检测机制（场景对检查结果持久化在 SQLite 记忆中，跨进程、跨运行复用）
+        memo_config = self.config.get('check_memo') or {}
+        memo = get_check_memo(memo_config, self.config.get('embedding_store')) if memo_config.get('enabled', True) else None
+        self.change_detector = ChangeDetector(memo, config_version(self.config))
     
     def _load_config(self, config_path: str) -> Dict[str, Any]:
 # 加载配置文件
@@ -42,17 +66,33 @@ class ConsistencyAgent:
         
         return config
     
+    def _perceive_current_scene(self, current_scene: Dict[str, Any]) -> Dict[str, Any]:
+        current_scene_with_keyframes = self.perception.extract_multi_source_keyframes(current_scene)
+        return self.perception.get_scene_info(current_scene_with_keyframes)
+    
     async def check_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any], prompt_data: Dict[str, Any]) -> Dict[str, Any]:
 # 检查场景一致性
         try:
-            # 1. 感知阶段：获取场景信息
+            # 1. 感知阶段：获取场景信息（关键帧提取、视频探测为阻塞调用，两个场景在线程池中并发执行）
             # 1.1 获取当前场景的多源关键帧信息
-            current_scene_with_keyframes = self.perception.extract_multi_source_keyframes(current_scene)
-            current_scene_info = self.perception.get_scene_info(current_scene_with_keyframes)
-            
             # 1.2 获取上一场景信息
-            prev_scene_info = self.perception.get_prev_scene_info(previous_scene)
-            
+            current_scene_info, prev_scene_info = await asyncio.gather(
+                run_blocking(self._perceive_current_scene, current_scene),
+                run_blocking(self.perception.get_prev_scene_info, previous_scene)
+            )
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'passed': False
+            }
+        return await self._check_pair(current_scene, previous_scene, current_scene_info, prev_scene_info, prompt_data)
+    
+    async def _check_pair(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any],
+                          current_scene_info: Dict[str, Any], prev_scene_info: Dict[str, Any],
+                          prompt_data: Dict[str, Any]) -> Dict[str, Any]:
+# 对已完成感知的场景对执行分析、决策与反馈（check_consistency 与 check_sequence 共用）
+        try:
             # 1.3 解析提示词信息
             parsed_prompt = self.perception.parse_prompt_info(prompt_data)
             
@@ -63,26 +103,27 @@ class ConsistencyAgent:
             # 生成缓存键
             cache_key = f"{prev_scene_id}_{scene_id}"
             
-            # 检测变化，确定需要检查的维度
+            # 检测变化，确定需要检查的维度（记忆按双方关键帧内容命中，未变化的维度沿用记忆结果）
             check_dims = None
-            if cache_key in self.check_result_cache:
-                # 有缓存，检测变化
-                cached_result = self.check_result_cache[cache_key]
+            memo_entry = await run_blocking(self.change_detector.lookup, current_scene_info, prev_scene_info)
+            if memo_entry:
                 check_dims = self.change_detector.detect_changes(
                     current_scene_info, 
                     prev_scene_info, 
-                    cached_result.get('current_scene_info', {})
+                    memo_entry['current_scene']
                 )
             
             # 2. 分析阶段：评估一致性（支持增量检查）
             consistency_results = await self.analysis.evaluate_consistency(
                 current_scene_info, 
                 prev_scene_info,
-                check_dims
+                check_dims,
+                memo_entry['results'] if memo_entry else None
             )
             
             # 2.1 故事逻辑检查
-            story_logic_result = self.story_logic_checker.check_story_logic(
+            story_logic_result = await run_blocking(
+                self.story_logic_checker.check_story_logic,
                 current_scene_info,
                 prev_scene_info
             )
@@ -105,13 +146,8 @@ class ConsistencyAgent:
                 parsed_prompt['generation_params']
             )
             
-            # 5. 更新缓存
-            self.check_result_cache[cache_key] = {
-                'current_scene_info': current_scene_info,
-                'prev_scene_info': prev_scene_info,
-                'consistency_results': consistency_results,
-                'check_time': datetime.now().isoformat()
-            }
+            # 5. 更新记忆
+            await run_blocking(self.change_detector.record, current_scene_info, prev_scene_info, consistency_results)
             
             # 6. 整合结果
             final_result = {
@@ -122,7 +158,7 @@ class ConsistencyAgent:
                 'story_logic_result': story_logic_result,
                 'check_dims': check_dims,  # 记录本次检查的维度
                 'cache_key': cache_key,     # 记录缓存键
-                'cache_used': cache_key in self.check_result_cache  # 记录是否使用了缓存
+                'cache_used': memo_entry is not None  # 记录是否命中了检查结果记忆
             }
             
             return final_result
@@ -133,7 +169,108 @@ class ConsistencyAgent:
                 'passed': False
             }
     
-    async def run_check_loop(self, video_generation_pipeline, scene_data: Dict[str, Any], max_retries: int = 3) -> Dict[str, Any]:
+    async def check_sequence(self, scenes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        整段场景序列的一致性检查
+        
+        每个场景只感知一次（关键帧提取、视频探测），相邻场景对共用感知结果并发检查；
+        N 个场景只需 N 次感知，而逐对调用 check_consistency 需要 2N 次。
+        
+        Args:
+            scenes: 按顺序排列的场景，每个场景的 prompt_data 用于其与上一场景的检查
+        
+        Returns:
+            {'passed', 'scene_count', 'pair_count', 'pairs': [{'previous_scene_id', 'scene_id', 'result'}],
+             'failed_pairs': 未通过的场景对下标, 'aggregate': 汇总分数与问题}
+        """
+        try:
+            # 1. 感知阶段：全部场景在线程池中并发感知
+            scene_infos = await asyncio.gather(*(run_blocking(self._perceive_current_scene, scene) for scene in scenes))
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'passed': False
+            }
+        
+        # 1.1 整批预热相邻场景转场处的感知哈希与视觉指标（启用进程池时 SSIM 并行计算），后续各对检查直接命中缓存
+        transitions = [
+            (prev_info['keyframes'][-1], current_info['keyframes'][0])
+            for prev_info, current_info in zip(scene_infos, scene_infos[1:])
+            if prev_info.get('keyframes') and current_info.get('keyframes')
+        ]
+        if transitions:
+            try:
+                await run_blocking(self._warm_transitions, transitions)
+            except Exception as e:
+                self.log_if_available(f"转场指标预热失败，逐对计算: {e}")
+            
+            # 1.2 检查记忆未命中的转场对（视觉检查必然执行）合并为批量 VLM 相似度请求，结果缓存供各对检查取用
+            memo_entries = await asyncio.gather(*(
+                run_blocking(self.change_detector.lookup, current_info, prev_info)
+                for prev_info, current_info in zip(scene_infos, scene_infos[1:])
+                if prev_info.get('keyframes') and current_info.get('keyframes')
+            ))
+            unchecked = [pair for pair, entry in zip(transitions, memo_entries) if not entry]
+            if unchecked:
+                try:
+                    await self.components.similarity_calculator().calculate_clip_similarity_many_async(unchecked)
+                except Exception as e:
+                    self.log_if_available(f"转场相似度批量预取失败，逐对计算: {e}")
+        
+        # 2. 相邻场景对并发检查
+        pair_results = await asyncio.gather(*(
+            self._check_pair(scenes[i], scenes[i - 1], scene_infos[i], scene_infos[i - 1],
+                             scenes[i].get('prompt_data', {}))
+            for i in range(1, len(scenes))
+        ))
+        
+        pairs = []
+        for i, result in enumerate(pair_results, start=1):
+            pairs.append({
+                'previous_scene_id': scenes[i - 1].get('scene_id', f"{scenes[i - 1].get('order', i - 1)}"),
+                'scene_id': scenes[i].get('scene_id', f"{scenes[i].get('order', i)}"),
+                'result': result
+            })
+        failed_pairs = [n for n, result in enumerate(pair_results) if not result.get('passed', False)]
+        
+        return {
+            'passed': not failed_pairs,
+            'scene_count': len(scenes),
+            'pair_count': len(pairs),
+            'pairs': pairs,
+            'failed_pairs': failed_pairs,
+            'aggregate': self._aggregate_pair_results(pair_results)
+        }
+    
+    def _warm_transitions(self, transitions: List[Tuple[str, str]]) -> None:
+        get_hash_index(self.config.get('perceptual_hash')).hashes([path for pair in transitions for path in pair])
+        get_comparison_engine(self.config.get('image_comparison')).compare_many(transitions)
+    
+    def _aggregate_pair_results(self, pair_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+# 汇总各场景对的分数与问题
+        scored = [r['consistency_results'] for r in pair_results if r.get('consistency_results')]
+        aggregate = {
+            'checked_pairs': len(scored),
+            'errored_pairs': len(pair_results) - len(scored),
+            'cache_hits': sum(1 for r in pair_results if r.get('cache_used')),
+            'issues': [issue for r in scored for issue in r.get('issues', [])]
+        }
+        for key in ('overall_score', 'visual_score', 'temporal_score', 'semantic_score', 'style_score'):
+            values = [r[key] for r in scored if key in r]
+            aggregate[key] = {
+                'mean': sum(values) / len(values) if values else None,
+                'min': min(values) if values else None
+            }
+        return aggregate
+    
+    async def run_check_loop(self, video_generation_pipeline, scene_data: Dict[str, Any], max_retries: int = 3,
+                             candidates: Optional[int] = None) -> Dict[str, Any]:
+        # candidates > 1 时不再串行重试：首次检查未通过后并行生成 candidates 个候选，取最先通过或截止时最优的一个
+        # （未指定时取 regeneration.candidates 配置，默认 1 即串行重试）
+        regeneration_config = self.config.get('regeneration') or {}
+        if candidates is None:
+            candidates = int(regeneration_config.get('candidates', 1))
         retry_count = 0
         current_scene = scene_data.copy()
         
@@ -155,6 +292,12 @@ class ConsistencyAgent:
                     'check_result': check_result
                 }
             
+            if candidates > 1 and max_retries > 0:
+                return await self._regenerate_best_of_n(
+                    video_generation_pipeline, current_scene, previous_scene, check_result,
+                    candidates, regeneration_config.get('deadline_seconds')
+                )
+            
             if retry_count >= max_retries:
                 return {
                     'status': 'failure',
@@ -184,14 +327,7 @@ class ConsistencyAgent:
                 retry_count += 1
                 continue
             
-            current_scene = {
-                'scene_id': regenerated_scene.get('scene_id', current_scene.get('scene_id')),
-                'order': regenerated_scene.get('order', current_scene.get('order')),
-                'keyframes': regenerated_scene.get('keyframes', []),
-                'video_path': regenerated_scene.get('video_path', ''),
-                'prompt_data': regenerated_scene.get('prompt_data', current_scene.get('prompt_data', {})),
-                'success': True
-            }
+            current_scene = self._scene_from_regeneration(regenerated_scene, current_scene)
             retry_count += 1
         
         return {
@@ -202,6 +338,115 @@ class ConsistencyAgent:
             'check_result': check_result
         }
     
+    def _scene_from_regeneration(self, regenerated_scene: Dict[str, Any], current_scene: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'scene_id': regenerated_scene.get('scene_id', current_scene.get('scene_id')),
+            'order': regenerated_scene.get('order', current_scene.get('order')),
+            'keyframes': regenerated_scene.get('keyframes', []),
+            'video_path': regenerated_scene.get('video_path', ''),
+            'prompt_data': regenerated_scene.get('prompt_data', current_scene.get('prompt_data', {})),
+            'success': True
+        }
+    
+    async def _regenerate_best_of_n(self, video_generation_pipeline, current_scene: Dict[str, Any],
+                                    previous_scene: Dict[str, Any], check_result: Dict[str, Any],
+                                    candidates: int, deadline_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        并行生成 candidates 个候选并逐个检查
+        
+        候选的提示词与参数取自 FeedbackModule.generate_candidate_variants；每个候选生成完成后立即检查，
+        第一个通过的候选胜出，其余候选取消；截止时间（deadline_seconds，未设置时等待全部完成）到达时
+        取已完成候选中总分最高的一个。最坏延迟为一次生成加一次检查，而串行重试为 max_retries 次。
+        video_generation_pipeline.regenerate_scene 需支持同一场景的并发调用（各候选输出到不同文件）。
+        """
+        scene_prompt_data = current_scene.get('prompt_data', {})
+        variants = self.feedback.generate_candidate_variants(
+            check_result.get('optimization_feedback', {}),
+            candidates,
+            original_prompt=scene_prompt_data.get('original_prompt', ''),
+            generation_params=scene_prompt_data.get('generation_params', {})
+        )
+        
+        async def run_candidate(variant: Dict[str, Any]) -> Dict[str, Any]:
+            regenerated_scene = await video_generation_pipeline.regenerate_scene(
+                current_scene['order'],
+                variant['prompt'],
+                variant['params']
+            )
+            if not regenerated_scene.get('success', False):
+                return {'variant': variant, 'error': regenerated_scene.get('error', '未知错误')}
+            scene = self._scene_from_regeneration(regenerated_scene, current_scene)
+            prompt_data = dict(scene.get('prompt_data') or {})
+            prompt_data['optimized_prompt'] = variant['prompt']
+            prompt_data['generation_params'] = variant['params']
+            scene['prompt_data'] = prompt_data
+            result = await self.check_consistency(scene, previous_scene, prompt_data)
+            return {'variant': variant, 'scene': scene, 'check_result': result}
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + float(deadline_seconds) if deadline_seconds else None
+        pending = {asyncio.create_task(run_candidate(variant)) for variant in variants}
+        finished = []
+        winner = None
+        try:
+            while pending and winner is None:
+                timeout = None if deadline is None else deadline - loop.time()
+                if timeout is not None and timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        outcome = task.result()
+                    except Exception as e:
+                        self.log_if_available(f"场景{current_scene['order']+1}候选生成异常: {e}")
+                        continue
+                    finished.append(outcome)
+                    if 'error' in outcome:
+                        self.log_if_available(f"场景{current_scene['order']+1}候选{outcome['variant']['variant']}重新生成失败: {outcome['error']}")
+                    elif outcome['check_result'].get('passed', False) and winner is None:
+                        winner = outcome
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        checked = [outcome for outcome in finished if 'check_result' in outcome]
+        best = winner or max(
+            checked,
+            key=lambda outcome: (outcome['check_result'].get('consistency_results') or {}).get('overall_score', 0.0),
+            default=None
+        )
+        summary = [
+            {
+                'variant': outcome['variant']['variant'],
+                'passed': outcome.get('check_result', {}).get('passed', False),
+                'overall_score': (outcome.get('check_result', {}).get('consistency_results') or {}).get('overall_score'),
+                'error': outcome.get('error')
+            }
+            for outcome in finished
+        ]
+        
+        if best is None:
+            return {
+                'status': 'failure',
+                'message': f'{candidates} 个候选均未在截止时间前生成成功',
+                'scene': current_scene,
+                'retry_count': 1,
+                'check_result': check_result,
+                'candidates': summary,
+                'cancelled_candidates': len(pending)
+            }
+        return {
+            'status': 'success' if winner is not None else 'failure',
+            'message': '一致性检查通过' if winner is not None else f'{candidates} 个候选均未通过，返回得分最高的候选',
+            'scene': best['scene'],
+            'retry_count': 1,
+            'check_result': best['check_result'],
+            'candidates': summary,
+            'cancelled_candidates': len(pending)
+        }
+    
     def log_if_available(self, message: str):
         try:
             import logging
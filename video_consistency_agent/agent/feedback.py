@@ -1,13 +1,14 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from ..optimizers.prompt_optimizer import PromptOptimizer
 from ..optimizers.param_optimizer import ParamOptimizer
+from ..utils.components import ComponentRegistry
 
 class FeedbackModule:
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
 # 初始化反馈优化模块
         self.config = config
-        self.prompt_optimizer = PromptOptimizer(config)
+        self.prompt_optimizer = PromptOptimizer(config, components)
         self.param_optimizer = ParamOptimizer(config)
     
     async def generate_optimization_feedback(self, consistency_results: Dict[str, Any], original_prompt: str, generation_params: Dict[str, Any]) -> Dict[str, Any]:
@@ -30,6 +31,32 @@ class FeedbackModule:
             'consistency_results': consistency_results
         }
     
+    def generate_candidate_variants(self, optimization_feedback: Dict[str, Any], count: int,
+                                    original_prompt: str = '',
+                                    generation_params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        生成并行重新生成用的 count 组候选（提示词 + 参数）
+        
+        候选 0 为优化后的提示词与参数；其余候选换新随机种子，并逐步加大风格强度与关键帧权重；
+        偶数编号的候选改用原始提示词，防止 LLM 改写的提示词本身偏离。
+        首次检查异常、没有优化反馈时，使用场景自身的 original_prompt 与 generation_params。
+        """
+        original_prompt = optimization_feedback.get('original_prompt') or original_prompt
+        optimized_prompt = optimization_feedback.get('optimized_prompt') or original_prompt
+        optimized_params = (optimization_feedback.get('optimized_params') or optimization_feedback.get('original_params')
+                            or generation_params or {})
+        
+        variants = [{'variant': 0, 'prompt': optimized_prompt, 'params': dict(optimized_params)}]
+        for index in range(1, count):
+            params = self.param_optimizer.reset_params_for_retry(optimized_params)
+            params['style_strength'] = min(
+                params.get('style_strength', 0.5) + index * self.param_optimizer.style_strength_adjustment, 1.0)
+            params['keyframe_weight'] = min(
+                params.get('keyframe_weight', 0.5) + index * self.param_optimizer.keyframe_weight_adjustment, 1.0)
+            prompt = original_prompt if index % 2 == 0 and original_prompt else optimized_prompt
+            variants.append({'variant': index, 'prompt': prompt, 'params': params})
+        return variants
+    
     async def optimize_prompt(self, original_prompt: str, consistency_results: Dict[str, Any]) -> str:
 # 优化提示词
         issues = consistency_results.get('issues', [])
@@ -1,16 +1,16 @@
 from typing import Dict, Any, Optional
 import os
 
-from ..utils.video_utils import VideoUtils
-from ..utils.keyframe_manager import KeyframeManager
+from ..utils.components import ComponentRegistry, get_components
 
 class PerceptionModule:
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
 # 初始化感知模块
         self.config = config
-        self.video_utils = VideoUtils()
-        # 初始化关键帧管理器
-        self.keyframe_manager = KeyframeManager(config)
+        components = components or get_components(config)
+        self.video_utils = components.video_utils()
+        # 关键帧管理器（进程内共享，关键帧缓存跨 Agent 实例复用）
+        self.keyframe_manager = components.keyframe_manager()
     
     def get_scene_info(self, scene: Dict[str, Any]) -> Dict[str, Any]:
 # 获取场景信息
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Dict, Any, List
 from ..models.model_manager import ModelManager
 
@@ -27,10 +28,12 @@ class ContentChecker:
             if not current_video_path or not previous_video_path:
                 raise ValueError("场景缺少视频路径")
             
-            # 使用VLM分析两个场景的内容
+            # 使用VLM并发分析两个场景的内容
             vlm_client = self.model_manager.get_vlm_client()
-            current_content = await vlm_client.analyze_video_content(current_video_path)
-            previous_content = await vlm_client.analyze_video_content(previous_video_path)
+            current_content, previous_content = await asyncio.gather(
+                vlm_client.analyze_video_content(current_video_path),
+                vlm_client.analyze_video_content(previous_video_path)
+            )
             
             # 使用LLM分析内容连贯性
             llm_client = self.model_manager.get_llm_client()
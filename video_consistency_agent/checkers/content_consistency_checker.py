@@ -5,13 +5,16 @@
 import os
 import sys
 import json
-import base64
 import logging
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
+from ..utils.fallback_tracker import note_fallback
+from ..utils.image_payload import get_image_payloads
+from ..utils.perceptual_hash import AMBIGUOUS, NEAR_DUPLICATE, get_hash_index
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,6 +46,13 @@ class ContentConsistencyChecker:
         self.config = config or {}
         self.threshold = self.config.get('consistency_threshold', 0.85)
         self.vlm_client = None
+        # 感知哈希预筛：近重复 / 明显不同的关键帧不再送 VLM 分析
+        hash_config = self.config.get('perceptual_hash') or {}
+        self.hash_index = get_hash_index(hash_config) if hash_config.get('enabled', True) else None
+        # 送入 VLM 的图像先缩放、重新编码一次并缓存；场景过渡可按批合并为一次请求
+        payload_config = self.config.get('vlm_payload') or {}
+        self.payloads = get_image_payloads(payload_config)
+        self.max_pairs_per_request = int(payload_config.get('max_pairs_per_request', 4))
         self._init_vlm_client()
         logger.info("ContentConsistencyChecker 初始化完成")
     
@@ -185,6 +195,10 @@ class ContentConsistencyChecker:
             
             all_frames = previous_keyframes[-2:] + keyframes[:3] if len(previous_keyframes) >= 2 else keyframes
             
+            # 相邻帧全部近重复时人物不可能发生变化；明显不同的帧（换镜头）仍需 VLM 判断
+            if self._prefilter(all_frames) == NEAR_DUPLICATE:
+                return self._prefilter_result(all_frames, NEAR_DUPLICATE, "人物一致性检查")
+            
             analysis_prompt = """请分析这组关键帧中的人物一致性。
 
 检查以下方面：
@@ -236,6 +250,10 @@ class ContentConsistencyChecker:
             if not self.vlm_client:
                 return self._default_result("动作连贯性检查（无VLM客户端）")
             
+            # 关键帧全部近重复（静止画面）时动作必然连贯
+            if self._prefilter(keyframes) == NEAR_DUPLICATE:
+                return self._prefilter_result(keyframes, NEAR_DUPLICATE, "动作连贯性检查")
+            
             analysis_prompt = """请分析这组关键帧中的动作连贯性。
 
 检查以下方面：
@@ -292,27 +310,16 @@ class ContentConsistencyChecker:
             
             for image_path in image_paths[:5]:
                 if image_path and os.path.exists(image_path):
-                    try:
-                        with open(image_path, 'rb') as f:
-                            image_data = base64.b64encode(f.read()).decode('utf-8')
-                        
-                        ext = os.path.splitext(image_path)[1].lower()
-                        mime_type = {
-                            '.jpg': 'image/jpeg',
-                            '.jpeg': 'image/jpeg',
-                            '.png': 'image/png',
-                            '.gif': 'image/gif',
-                            '.webp': 'image/webp'
-                        }.get(ext, 'image/jpeg')
-                        
+                    image_url = self.payloads.data_url(image_path)
+                    if image_url:
                         content.append({
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:{mime_type};base64,{image_data}"
+                                "url": image_url
                             }
                         })
-                    except Exception as e:
-                        logger.warning(f"读取图像失败: {image_path}, {e}")
+                    else:
+                        logger.warning(f"读取图像失败: {image_path}")
             
             response = self.vlm_client.chat.completions.create(
                 model="qwen-vl-max",
@@ -348,8 +355,31 @@ class ContentConsistencyChecker:
             pass
         return {'score': 0.8, 'passed': True, 'issues': []}
     
+    def _prefilter(self, frames: List[str]) -> str:
+        """相邻关键帧的感知哈希判定（near_duplicate / different / ambiguous）"""
+        if self.hash_index is None or len(frames) < 2:
+            return AMBIGUOUS
+        return self.hash_index.classify_sequence(frames)
+    
+    def _prefilter_result(self, frames: List[str], verdict: str, check_type: str) -> Dict[str, Any]:
+        """相邻帧均为近重复时的结果（不调用 VLM），分数取相邻帧哈希相似度的最小值
+        
+        只用于 near_duplicate：画面差异大（different）可能是合理的镜头切换，仍交给 VLM 判断
+        """
+        score = min(
+            self.hash_index.classify(a, b)['similarity'] for a, b in zip(frames, frames[1:])
+        )
+        logger.info(f"[pHash预筛] {check_type}判定为 {verdict}，跳过VLM分析")
+        return {
+            'score': score,
+            'passed': True,
+            'issues': [],
+            'details': {'note': f'{check_type}由感知哈希预筛判定为 {verdict}', 'prefilter': verdict}
+        }
+    
     def _default_result(self, check_type: str) -> Dict[str, Any]:
         """返回默认结果"""
+        note_fallback('content_consistency')
         return {
             'score': 0.8,
             'passed': True,
@@ -430,6 +460,11 @@ class ContentConsistencyChecker:
             
             all_frames = previous_keyframes[-1:] + current_keyframes[:1]
             
+            if self._prefilter(all_frames) == NEAR_DUPLICATE:
+                result = self._prefilter_result(all_frames, NEAR_DUPLICATE, "场景过渡检查")
+                result['transition_quality'] = 'smooth'
+                return result
+            
             analysis_prompt = """请分析这两个关键帧之间的场景过渡。
 
 检查以下方面：
@@ -471,3 +506,81 @@ class ContentConsistencyChecker:
         except Exception as e:
             logger.error(f"场景过渡检查失败: {e}")
             return self._default_result("场景过渡检查")
+    
+    def check_scene_transitions(self, transitions: List[Tuple[List[str], List[str]]]) -> List[Dict[str, Any]]:
+        """
+        批量检查多个场景过渡（如整个项目的全部相邻场景）
+        
+        感知哈希判定为近重复的过渡不送 VLM；其余过渡每 max_pairs_per_request 个合并为一次多模态请求，
+        模型按编号返回逐对 JSON，批量结果中缺失的过渡再单独检查。
+        
+        Args:
+            transitions: [(当前场景关键帧, 上一场景关键帧)]
+            
+        Returns:
+            与 transitions 等长的过渡检查结果列表，格式同 check_scene_transition
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(transitions)
+        pending = []
+        for n, (current_keyframes, previous_keyframes) in enumerate(transitions):
+            all_frames = (previous_keyframes or [])[-1:] + (current_keyframes or [])[:1]
+            if not self.vlm_client or len(all_frames) < 2:
+                results[n] = self._default_result("场景过渡检查")
+                continue
+            if self._prefilter(all_frames) == NEAR_DUPLICATE:
+                results[n] = self._prefilter_result(all_frames, NEAR_DUPLICATE, "场景过渡检查")
+                results[n]['transition_quality'] = 'smooth'
+                continue
+            pending.append((n, all_frames))
+        
+        for start in range(0, len(pending), self.max_pairs_per_request):
+            batch = pending[start:start + self.max_pairs_per_request]
+            answers = self._analyze_transition_batch([frames for _, frames in batch])
+            for index, (n, _) in enumerate(batch, start=1):
+                item = answers.get(index)
+                if item is not None:
+                    results[n] = {
+                        'score': item.get('score', 0.8),
+                        'passed': item.get('passed', True),
+                        'issues': item.get('issues', []),
+                        'transition_quality': item.get('transition_quality', 'smooth'),
+                        'details': item.get('details', {})
+                    }
+                else:
+                    current_keyframes, previous_keyframes = transitions[n]
+                    results[n] = self.check_scene_transition(current_keyframes, previous_keyframes)
+        return results
+    
+    def _analyze_transition_batch(self, frame_pairs: List[List[str]]) -> Dict[int, Dict[str, Any]]:
+        """一次请求分析多个过渡，返回 {编号(从1开始): 结果}；失败时返回空字典"""
+        try:
+            content = [{"type": "text", "text": f"""下面按顺序给出{len(frame_pairs)}个场景过渡，每个过渡两张图：上一场景末帧、当前场景首帧。
+请逐个分析场景元素、人物位置、光照、色调、构图是否连贯，只返回JSON：
+{{
+    "transitions": [
+        {{"index": 序号, "score": 0.0-1.0, "passed": true/false, "issues": ["问题"],
+          "transition_quality": "smooth/moderate/abrupt"}}
+    ]
+}}
+"""}]
+            for index, frames in enumerate(frame_pairs, start=1):
+                content.append({"type": "text", "text": f"过渡{index}："})
+                for image_path in frames:
+                    image_url = self.payloads.data_url(image_path)
+                    if not image_url:
+                        raise ValueError(f"读取图像失败: {image_path}")
+                    content.append({"type": "image_url", "image_url": {"url": image_url}})
+            
+            response = self.vlm_client.chat.completions.create(
+                model="qwen-vl-max",
+                messages=[{"role": "user", "content": content}],
+                max_tokens=400 * len(frame_pairs)
+            )
+            json_result = self._parse_json_response(response.choices[0].message.content)
+            return {
+                item['index']: item for item in json_result.get('transitions', [])
+                if isinstance(item, dict) and isinstance(item.get('index'), int)
+            }
+        except Exception as e:
+            logger.error(f"批量场景过渡分析失败: {e}")
+            return {}
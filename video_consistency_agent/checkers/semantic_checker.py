@@ -1,13 +1,13 @@
-from typing import Dict, Any
-from ..models.llm_client import LLMClient
-from ..models.vlm_client import VLMClient
+from typing import Dict, Any, Optional
+from ..utils.components import ComponentRegistry, get_components
 
 class SemanticChecker:
-    def __init__(self, config: Dict[str, Any]):
-# 初始化语义一致性检查器
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
+# 初始化语义一致性检查器（LLM / VLM 客户端取自共享组件注册表）
         self.config = config
-        self.llm_client = LLMClient(config)
-        self.vlm_client = VLMClient(config)
+        components = components or get_components(config)
+        self.llm_client = components.llm_client()
+        self.vlm_client = components.vlm_client()
         self.threshold = config.get('semantic_threshold', 0.85)
     
     async def check_semantic_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> Dict[str, Any]:
@@ -29,7 +29,8 @@ class SemanticChecker:
                     'success': True,
                     'score': 0.8,
                     'passed': True,
-                    'issues': ['关键帧信息不完整，使用默认通过']
+                    'issues': ['关键帧信息不完整，使用默认通过'],
+                    'fallback': True
                 }
             
             content_coherence = await self.check_content_coherence(current_scene, previous_scene)
@@ -61,6 +62,66 @@ class SemanticChecker:
                 'success': True,
                 'score': 0.7,
                 'passed': True,
-                'issues': [f'语义检查异常: {str(e)}，使用默认通过']
+                'issues': [f'语义检查异常: {str(e)}，使用默认通过'],
+                'fallback': True
             }
-
+    
+    async def check_content_coherence(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> float:
+# 检查内容连贯性：有场景描述时由 LLM 评估描述间的连贯性，否则由 VLM 比较转场处关键帧的对象一致性
+        previous_desc = previous_scene.get('description') or previous_scene.get('prompt')
+        current_desc = current_scene.get('description') or current_scene.get('prompt')
+        if previous_desc and current_desc:
+            result = await self.llm_client.analyze_content_coherence(previous_desc, current_desc)
+            return float(result.get('coherence_score', 0.0))
+        
+        previous_keyframes = previous_scene.get('keyframes', [])
+        current_keyframes = current_scene.get('keyframes', [])
+        result = await self.vlm_client.analyze_keyframe_consistency(previous_keyframes[-1], current_keyframes[0])
+        analysis = result.get('consistency_analysis', {})
+        return float(analysis.get('object_consistency', analysis.get('overall_consistency', 0.0)))
+    
+    def check_character_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> float:
+# 检查角色一致性：当前场景保留了上一场景中多少角色 / 主体（场景未标注角色时视为一致）
+        previous_characters = set(previous_scene.get('characters') or previous_scene.get('subjects') or [])
+        current_characters = set(current_scene.get('characters') or current_scene.get('subjects') or [])
+        if not previous_characters:
+            return 1.0
+        return len(previous_characters & current_characters) / len(previous_characters)
+    
+    async def check_event_logic(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> float:
+# 检查事件发展逻辑
+        # 这里可以添加更复杂的事件逻辑分析
+        # 由于是示例实现，这里返回一个默认值
+        return 0.9
+    
+    def calculate_overall_semantic_score(self, content_coherence: float, character_consistency: float, event_logic: float) -> float:
+# 计算整体语义一致性分数
+        # 加权平均
+        weights = {
+            'content_coherence': 0.5,
+            'character_consistency': 0.3,
+            'event_logic': 0.2
+        }
+        
+        overall_score = (
+            content_coherence * weights['content_coherence'] +
+            character_consistency * weights['character_consistency'] +
+            event_logic * weights['event_logic']
+        )
+        
+        return overall_score
+    
+    def generate_suggestions(self, check_result: Dict[str, Any]) -> list:
+# 根据检查结果生成改进建议
+        suggestions = []
+        
+        if check_result.get('content_coherence', 1.0) < self.threshold:
+            suggestions.append("确保场景内容与上一场景衔接，避免主题或情节突变")
+        
+        if check_result.get('character_consistency', 1.0) < self.threshold:
+            suggestions.append("保持上一场景中的主要角色出现，并保持其外貌一致")
+        
+        if check_result.get('event_logic', 1.0) < self.threshold:
+            suggestions.append("确保场景间的事件发展符合逻辑，避免突兀的情节跳转")
+        
+        return suggestions
@@ -1,15 +1,18 @@
-from typing import Dict, Any
-from ..utils.similarity import SimilarityCalculator
-from ..utils.video_utils import VideoUtils
-from ..models.vlm_client import VLMClient
+import asyncio
+from typing import Dict, Any, List, Optional
+import numpy as np
+from ..utils.executor import run_blocking
+from ..utils.components import ComponentRegistry, get_components
+from ..utils.image_comparison import group_mean_matrix
 
 class StyleChecker:
-    def __init__(self, config: Dict[str, Any]):
-# 初始化风格一致性检查器
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
+# 初始化风格一致性检查器（相似度计算器、视频工具、VLM 客户端取自共享组件注册表）
         self.config = config
-        self.similarity_calculator = SimilarityCalculator()
-        self.video_utils = VideoUtils()
-        self.vlm_client = VLMClient(config)
+        components = components or get_components(config)
+        self.similarity_calculator = components.similarity_calculator()
+        self.video_utils = components.video_utils()
+        self.vlm_client = components.vlm_client()
         self.threshold = config.get('style_threshold', 0.8)
     
     async def check_style_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> Dict[str, Any]:
@@ -31,12 +34,15 @@ class StyleChecker:
                     'success': True,
                     'score': 0.8,
                     'passed': True,
-                    'issues': ['关键帧信息不完整，使用默认通过']
+                    'issues': ['关键帧信息不完整，使用默认通过'],
+                    'fallback': True
                 }
             
-            art_style_consistency = await self.check_art_style_consistency(current_scene, previous_scene)
-            action_style_consistency = await self.check_action_style_consistency(current_scene, previous_scene)
-            tech_param_consistency = await self.check_technical_parameter_consistency(current_scene, previous_scene)
+            art_style_consistency, action_style_consistency, tech_param_consistency = await asyncio.gather(
+                self.check_art_style_consistency(current_scene, previous_scene),
+                self.check_action_style_consistency(current_scene, previous_scene),
+                self.check_technical_parameter_consistency(current_scene, previous_scene)
+            )
             
             overall_score = self.calculate_overall_style_score(
                 art_style_consistency,
@@ -63,7 +69,8 @@ class StyleChecker:
                 'success': True,
                 'score': 0.7,
                 'passed': True,
-                'issues': [f'风格检查异常: {str(e)}，使用默认通过']
+                'issues': [f'风格检查异常: {str(e)}，使用默认通过'],
+                'fallback': True
             }
     
     async def check_art_style_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> float:
@@ -73,21 +80,82 @@ class StyleChecker:
         previous_keyframes = previous_scene.get('keyframes', [])
         
         if not current_keyframes:
-            current_keyframes = self.video_utils.extract_keyframes(current_scene['video_path'], num_keyframes=1)
+            current_keyframes = await run_blocking(self.video_utils.extract_keyframes, current_scene['video_path'], num_keyframes=1)
         if not previous_keyframes:
-            previous_keyframes = self.video_utils.extract_keyframes(previous_scene['video_path'], num_keyframes=1)
+            previous_keyframes = await run_blocking(self.video_utils.extract_keyframes, previous_scene['video_path'], num_keyframes=1)
         
         if not current_keyframes or not previous_keyframes:
             return 0.0
         
         # 计算关键帧相似度
-        similarity = self.similarity_calculator.calculate_overall_visual_similarity(
+        similarity = await self.similarity_calculator.calculate_overall_visual_similarity_async(
             previous_keyframes[-1],  # 使用上一场景的最后一个关键帧
             current_keyframes[0]  # 使用当前场景的第一个关键帧
         )
         
         return similarity
     
+    async def check_storyboard_style_consistency(self, scenes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        一次检查整个分镜的艺术风格一致性
+        
+        所有关键帧的整体视觉相似度矩阵只计算一次，按场景求块均值得到场景间风格矩阵：
+        相邻场景分数取副对角线，每个场景的全局风格分数为它与其余场景的平均相似度，低于阈值的场景视为风格离群。
+        """
+        from .visual_checker import flatten_scene_keyframes
+        
+        keyframes, groups = flatten_scene_keyframes(scenes)
+        if len(keyframes) < 2:
+            return {
+                'success': True,
+                'score': 1.0,
+                'passed': True,
+                'issues': []
+            }
+        
+        try:
+            matrices = await run_blocking(
+                self.similarity_calculator.calculate_similarity_matrices,
+                keyframes, include_ssim=self.config.get('storyboard_ssim', True)
+            )
+            style = matrices['overall_visual'] if matrices['overall_visual'] is not None else matrices['histogram']
+            scene_style = group_mean_matrix(style, groups)
+            
+            present = [i for i, members in enumerate(groups) if members]
+            sub = scene_style[np.ix_(present, present)]
+            adjacent = [
+                {'from_scene': a, 'to_scene': b, 'score': float(sub[k, k + 1])}
+                for k, (a, b) in enumerate(zip(present, present[1:]))
+            ]
+            if len(present) > 1:
+                off_diagonal = ~np.eye(len(present), dtype=bool)
+                per_scene = np.where(off_diagonal, sub, 0.0).sum(axis=1) / (len(present) - 1)
+                global_score = float(sub[off_diagonal].mean())
+            else:
+                per_scene = np.ones(len(present))
+                global_score = 1.0
+            scene_scores = {index: float(score) for index, score in zip(present, per_scene)}
+            outliers = [index for index, score in scene_scores.items() if score < self.threshold]
+            
+            return {
+                'success': True,
+                'score': global_score,
+                'passed': global_score >= self.threshold and not outliers,
+                'issues': [f'场景 {index + 1} 的画面风格与其余场景差异较大' for index in outliers],
+                'adjacent': adjacent,
+                'scene_scores': scene_scores,
+                'outlier_scenes': outliers,
+                'scene_style_matrix': np.nan_to_num(scene_style, nan=0.0).tolist()
+            }
+        except Exception as e:
+            return {
+                'success': True,
+                'score': 0.7,
+                'passed': True,
+                'issues': [f'分镜风格检查异常: {str(e)}，使用默认通过'],
+                'fallback': True
+            }
+    
     async def check_action_style_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> float:
 # 检查动作风格一致性
         # 这里可以添加更复杂的动作风格分析
@@ -95,16 +163,51 @@ class StyleChecker:
         return 0.85
     
     async def check_technical_parameter_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> float:
-# 检查技术参数一致性
-        current_info = current_scene['video_info']
-        previous_info = previous_scene['video_info']
+# 检查技术参数一致性（缺少视频信息的参数不扣分）
+        current_info = current_scene.get('video_info') or {}
+        previous_info = previous_scene.get('video_info') or {}
         
         # 检查分辨率一致性
-        resolution_match = 1.0 if (current_info['width'] == previous_info['width'] and current_info['height'] == previous_info['height']) else 0.8
+        resolution_match = 1.0 if (current_info.get('width') == previous_info.get('width') and current_info.get('height') == previous_info.get('height')) else 0.8
         
         # 检查帧率一致性
-        fps_match = 1.0 if abs(current_info['fps'] - previous_info['fps']) < 1 else 0.8
+        if current_info.get('fps') and previous_info.get('fps'):
+            fps_match = 1.0 if abs(current_info['fps'] - previous_info['fps']) < 1 else 0.8
+        else:
+            fps_match = 1.0
         
         # 综合评分
         return (resolution_match + fps_match) / 2
+    
+    def calculate_overall_style_score(self, art_style_consistency: float, action_style_consistency: float, tech_param_consistency: float) -> float:
+# 计算整体风格一致性分数
+        # 加权平均
+        weights = {
+            'art_style_consistency': 0.5,
+            'action_style_consistency': 0.2,
+            'tech_param_consistency': 0.3
+        }
+        
+        overall_score = (
+            art_style_consistency * weights['art_style_consistency'] +
+            action_style_consistency * weights['action_style_consistency'] +
+            tech_param_consistency * weights['tech_param_consistency']
+        )
+        
+        return overall_score
+    
+    def generate_suggestions(self, check_result: Dict[str, Any]) -> list:
+# 根据检查结果生成改进建议
+        suggestions = []
+        
+        if check_result.get('art_style_consistency', 1.0) < self.threshold:
+            suggestions.append("统一画面的色调、光照与美术风格，使其与上一场景保持一致")
+        
+        if check_result.get('action_style_consistency', 1.0) < self.threshold:
+            suggestions.append("保持角色动作的表现风格与节奏一致")
+        
+        if check_result.get('tech_param_consistency', 1.0) < self.threshold:
+            suggestions.append("保持场景间的分辨率与帧率一致")
+        
+        return suggestions
 
@@ -1,23 +1,14 @@
-from typing import Dict, Any
-from ..utils.video_utils import VideoUtils
+import asyncio
+from typing import Dict, Any, Optional
+from ..utils.components import ComponentRegistry, get_components
 
 class TemporalChecker:
-    def __init__(self, config: Dict[str, Any]):
-# 初始化时序一致性检查器
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
+# 初始化时序一致性检查器（视频工具、VLM 客户端取自共享组件注册表）
         self.config = config
-        self.video_utils = VideoUtils()
-        self.threshold = config.get('temporal_threshold', 0.8)
-    
-from typing import Dict, Any
-from ..utils.video_utils import VideoUtils
-
-from ..models.vlm_client import VLMClient
-
-class TemporalChecker:
-    def __init__(self, config: Dict[str, Any]):
-        self.config = config
-        self.video_utils = VideoUtils()
-        self.vlm_client = VLMClient(config)
+        components = components or get_components(config)
+        self.video_utils = components.video_utils()
+        self.vlm_client = components.vlm_client()
         self.threshold = config.get('temporal_threshold', 0.8)
     
     async def check_temporal_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> Dict[str, Any]:
@@ -39,12 +30,15 @@ class TemporalChecker:
                     'success': True,
                     'score': 0.8,
                     'passed': True,
-                    'issues': ['关键帧信息不完整，使用默认通过']
+                    'issues': ['关键帧信息不完整，使用默认通过'],
+                    'fallback': True
                 }
             
             timeline_consistency = 1.0
-            action_smoothness = await self.check_action_smoothness(current_scene, previous_scene)
-            event_logic = await self.check_event_logic(current_scene, previous_scene)
+            action_smoothness, event_logic = await asyncio.gather(
+                self.check_action_smoothness(current_scene, previous_scene),
+                self.check_event_logic(current_scene, previous_scene)
+            )
             
             overall_score = self.calculate_overall_temporal_score(
                 timeline_consistency,
@@ -71,7 +65,8 @@ class TemporalChecker:
                 'success': True,
                 'score': 0.7,
                 'passed': True,
-                'issues': [f'时序检查异常: {str(e)}，使用默认通过']
+                'issues': [f'时序检查异常: {str(e)}，使用默认通过'],
+                'fallback': True
             }
     
     def check_timeline_consistency(self, curr_video_info: Dict[str, Any], prev_video_info: Dict[str, Any]) -> float:
@@ -1,21 +1,23 @@
-from typing import Dict, Any
-from ..utils.feature_extractor import FeatureExtractor
-from ..utils.similarity import SimilarityCalculator
-from ..utils.video_utils import VideoUtils
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+from ..utils.components import ComponentRegistry, get_components
+from ..utils.executor import run_blocking
+from ..utils.image_comparison import group_mean_matrix
 
 class VisualChecker:
-    def __init__(self, config: Dict[str, Any]):
-# 初始化视觉一致性检查器
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
+# 初始化视觉一致性检查器（特征提取器、相似度计算器、视频工具取自共享组件注册表）
         self.config = config
-        self.feature_extractor = FeatureExtractor()
-        self.similarity_calculator = SimilarityCalculator()
-        self.video_utils = VideoUtils()
+        components = components or get_components(config)
+        self.feature_extractor = components.feature_extractor()
+        self.similarity_calculator = components.similarity_calculator()
+        self.video_utils = components.video_utils()
         self.threshold = config.get('visual_threshold', 0.8)
     
     async def check_keyframe_continuity(self, prev_end_frame: str, curr_start_frame: str) -> float:
 # 检查关键帧连续性
         # 使用CLIP相似度计算关键帧连续性
-        similarity = self.similarity_calculator.calculate_clip_similarity(
+        similarity = await self.similarity_calculator.calculate_clip_similarity_async(
             prev_end_frame,
             curr_start_frame
         )
@@ -23,6 +25,13 @@ class VisualChecker:
     
     async def check_multi_source_keyframe_consistency(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> float:
 # 检查多源关键帧的一致性
+        scene_original, pairs = self._multi_source_pairs(current_scene, previous_scene)
+        # 所有图像对一次提交：近重复/已缓存的直接取分，其余合并为批量 VLM 请求
+        scores = await self.similarity_calculator.calculate_clip_similarity_many_async(scene_original + pairs)
+        return self._multi_source_score(scores[:len(scene_original)], scores[len(scene_original):])
+    
+    def _multi_source_pairs(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+# 收集多源关键帧一致性需要比较的图像对：(场景首帧与原视频切片各帧, 与上一个场景末帧的过渡对)
         # 1. 获取多种来源的关键帧
         # 1.1 当前场景自身的关键帧
         current_scene_keyframes = current_scene.get('scene_keyframes', [])
@@ -31,51 +40,30 @@ class VisualChecker:
         # 1.3 上一个场景的关键帧
         previous_keyframes = previous_scene.get('keyframes', [])
         
-        total_similarity = 0.0
-        similarity_count = 0
-        
-        # 2. 计算场景自身关键帧与原视频切片关键帧的相似度
+        # 2. 场景自身首帧与原视频切片各关键帧
+        scene_original = []
         if current_scene_keyframes and current_original_keyframes:
-            # 比较当前场景的第一个关键帧与原视频切片的关键帧
-            scene_original_similarity = 0.0
-            count = 0
-            for original_frame in current_original_keyframes:
-                if current_scene_keyframes:
-                    similarity = self.similarity_calculator.calculate_clip_similarity(
-                        current_scene_keyframes[0],
-                        original_frame
-                    )
-                    scene_original_similarity += similarity
-                    count += 1
-            
-            if count > 0:
-                scene_original_similarity /= count
-                total_similarity += scene_original_similarity
-                similarity_count += 1
+            scene_original = [(current_scene_keyframes[0], original_frame) for original_frame in current_original_keyframes]
         
-        # 3. 计算当前场景关键帧与上一个场景关键帧的相似度
+        # 3. 当前场景首帧与上一个场景末帧
+        pairs = []
         if current_scene_keyframes and previous_keyframes:
-            # 比较当前场景的第一个关键帧与上一个场景的最后一个关键帧
-            scene_scene_similarity = self.similarity_calculator.calculate_clip_similarity(
-                previous_keyframes[-1],
-                current_scene_keyframes[0]
-            )
-            total_similarity += scene_scene_similarity
-            similarity_count += 1
+            pairs.append((previous_keyframes[-1], current_scene_keyframes[0]))
         
-        # 4. 计算当前场景原视频切片关键帧与上一个场景关键帧的相似度
+        # 4. 当前场景原视频切片首帧与上一个场景末帧
         if current_original_keyframes and previous_keyframes:
-            # 比较当前场景原视频切片的第一个关键帧与上一个场景的最后一个关键帧
-            original_scene_similarity = self.similarity_calculator.calculate_clip_similarity(
-                previous_keyframes[-1],
-                current_original_keyframes[0]
-            )
-            total_similarity += original_scene_similarity
-            similarity_count += 1
+            pairs.append((previous_keyframes[-1], current_original_keyframes[0]))
+        return scene_original, pairs
+    
+    def _multi_source_score(self, scene_original_scores: List[float], pair_scores: List[float]) -> float:
+# 汇总多源相似度：原视频切片各帧取均值后与过渡对一起平均
+        similarities = list(pair_scores)
+        if scene_original_scores:
+            similarities.insert(0, sum(scene_original_scores) / len(scene_original_scores))
         
         # 5. 返回平均相似度
-        if similarity_count > 0:
-            return total_similarity / similarity_count
+        if similarities:
+            return sum(similarities) / len(similarities)
         else:
             return 1.0  # 默认通过
     
@@ -114,21 +102,22 @@ class VisualChecker:
                     'success': True,
                     'score': 0.8,
                     'passed': True,
-                    'issues': ['关键帧信息不完整，使用默认通过']
+                    'issues': ['关键帧信息不完整，使用默认通过'],
+                    'fallback': True
                 }
             
-            keyframe_continuity = await self.check_keyframe_continuity(
-                previous_keyframes[-1],
-                current_keyframes[0]
+            # 关键帧连续性与多源一致性的图像对合并为一次批量相似度计算，与颜色一致性并发执行
+            scene_original, pairs = self._multi_source_pairs(current_scene, previous_scene)
+            continuity_pair = (previous_keyframes[-1], current_keyframes[0])
+            scores, color_consistency = await asyncio.gather(
+                self.similarity_calculator.calculate_clip_similarity_many_async([continuity_pair] + scene_original + pairs),
+                run_blocking(self.check_color_consistency, *continuity_pair)
             )
-            
-            color_consistency = self.check_color_consistency(
-                previous_keyframes[-1],
-                current_keyframes[0]
+            keyframe_continuity = scores[0]
+            multi_source_consistency = self._multi_source_score(
+                scores[1:1 + len(scene_original)], scores[1 + len(scene_original):]
             )
             
-            multi_source_consistency = await self.check_multi_source_keyframe_consistency(current_scene, previous_scene)
-            
             overall_score = self.calculate_overall_visual_score(
                 keyframe_continuity,
                 1.0,
@@ -155,7 +144,86 @@ class VisualChecker:
                 'success': True,
                 'score': 0.7,
                 'passed': True,
-                'issues': [f'视觉检查异常: {str(e)}，使用默认通过']
+                'issues': [f'视觉检查异常: {str(e)}，使用默认通过'],
+                'fallback': True
+            }
+    
+    async def check_storyboard_consistency(self, scenes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        一次检查整个分镜的视觉一致性
+        
+        所有场景的关键帧只提取一次特征，得到两两相似度矩阵后直接读出每个相邻转场的分数：
+        关键帧连续性（上一场景末帧 vs 当前场景首帧的嵌入相似度）、色彩一致性（整体视觉相似度）、
+        多源一致性（两个场景全部关键帧之间的平均嵌入相似度）。
+        """
+        keyframes, groups = flatten_scene_keyframes(scenes)
+        if len(keyframes) < 2:
+            return {
+                'success': True,
+                'score': 1.0,
+                'passed': True,
+                'issues': [],
+                'transitions': []
+            }
+        
+        try:
+            matrices = await run_blocking(
+                self.similarity_calculator.calculate_similarity_matrices,
+                keyframes, include_ssim=self.config.get('storyboard_ssim', True)
+            )
+            embedding = matrices['embedding']
+            color = matrices['overall_visual'] if matrices['overall_visual'] is not None else matrices['histogram']
+            scene_embedding = group_mean_matrix(embedding, groups)
+            
+            transitions = []
+            previous = None
+            for index, members in enumerate(groups):
+                if not members:
+                    continue
+                if previous is not None:
+                    prev_last, curr_first = groups[previous][-1], members[0]
+                    keyframe_continuity = float(embedding[prev_last, curr_first])
+                    color_consistency = float(color[prev_last, curr_first])
+                    multi_source_consistency = float(scene_embedding[previous, index])
+                    score = self.calculate_overall_visual_score(
+                        keyframe_continuity,
+                        1.0,
+                        color_consistency,
+                        multi_source_consistency
+                    )
+                    transition = {
+                        'from_scene': previous,
+                        'to_scene': index,
+                        'score': score,
+                        'passed': score >= self.threshold,
+                        'keyframe_continuity': keyframe_continuity,
+                        'color_consistency': color_consistency,
+                        'multi_source_consistency': multi_source_consistency
+                    }
+                    if not transition['passed']:
+                        transition['suggestions'] = self.generate_suggestions(transition)
+                    transitions.append(transition)
+                previous = index
+            
+            overall_score = sum(t['score'] for t in transitions) / len(transitions) if transitions else 1.0
+            failed = [t for t in transitions if not t['passed']]
+            return {
+                'success': True,
+                'score': overall_score,
+                'passed': not failed,
+                'issues': [f"场景 {t['from_scene'] + 1} → {t['to_scene'] + 1} 视觉一致性未达标" for t in failed],
+                'transitions': transitions,
+                'matrices': {name: m.tolist() for name, m in matrices.items() if name != 'paths' and m is not None},
+                'keyframes': keyframes
+            }
+        except Exception as e:
+            return {
+                'success': True,
+                'score': 0.7,
+                'passed': True,
+                'issues': [f'分镜视觉检查异常: {str(e)}，使用默认通过'],
+                'fallback': True,
+                'transitions': []
             }
     
     def calculate_overall_visual_score(self, keyframe_continuity: float, resolution_consistency: float, color_consistency: float, multi_source_consistency: float = 1.0) -> float:
@@ -220,3 +288,19 @@ class VisualChecker:
         
         return suggestions
 
+
+
+def flatten_scene_keyframes(scenes: List[Dict[str, Any]]) -> Tuple[List[str], List[List[int]]]:
+    """把各场景的关键帧展平为一个列表，并返回每个场景对应的下标（重复路径只保留一份）"""
+    keyframes: List[str] = []
+    positions: Dict[str, int] = {}
+    groups: List[List[int]] = []
+    for scene in scenes:
+        members = []
+        for path in (scene or {}).get('keyframes', []) or []:
+            if path not in positions:
+                positions[path] = len(keyframes)
+                keyframes.append(path)
+            members.append(positions[path])
+        groups.append(members)
+    return keyframes, groups
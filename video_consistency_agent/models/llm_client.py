@@ -3,6 +3,9 @@ import requests
 import os
 import dashscope
 
+from ..utils.executor import run_blocking
+from ..utils.fallback_tracker import note_fallback
+
 class LLMClient:
     def __init__(self, config: Dict[str, Any]):
 # 初始化大语言模型客户端
@@ -22,7 +25,8 @@ class LLMClient:
             print(f"[LLM Client] 分析内容连贯性: {scene1_desc[:50]}... vs {scene2_desc[:50]}...")
             
             # 使用通义千问API进行内容连贯性分析
-            response = dashscope.Generation.call(
+            response = await run_blocking(
+                dashscope.Generation.call,
                 model=self.model_name,
                 messages=[
                     {
@@ -56,6 +60,7 @@ class LLMClient:
                 }
             else:
                 print(f"[错误] 通义千问API调用失败: {response}")
+                note_fallback('llm')
                 # 回退到模拟实现
                 return {
                     'model': self.model_name,
@@ -68,6 +73,7 @@ class LLMClient:
                 }
         except Exception as e:
             print(f"[错误] 内容连贯性分析失败: {e}")
+            note_fallback('llm')
             # 回退到模拟实现
             return {
                 'model': self.model_name,
@@ -87,7 +93,8 @@ class LLMClient:
             print(f"[LLM Client] 问题列表: {issues}")
             
             # 使用通义千问API生成优化提示词
-            response = dashscope.Generation.call(
+            response = await run_blocking(
+                dashscope.Generation.call,
                 model=self.model_name,
                 messages=[
                     {
@@ -117,6 +124,7 @@ class LLMClient:
                 }
             else:
                 print(f"[错误] 通义千问API调用失败: {response}")
+                note_fallback('llm')
                 # 回退到模拟实现
                 optimized_prompt = original_prompt
                 for issue in issues:
@@ -136,6 +144,7 @@ class LLMClient:
                 }
         except Exception as e:
             print(f"[错误] 提示词优化失败: {e}")
+            note_fallback('llm')
             # 回退到模拟实现
             optimized_prompt = original_prompt
             for issue in issues:
@@ -162,7 +171,8 @@ class LLMClient:
             
             # 使用通义千问API评估场景逻辑一致性
             scene_text = '\n'.join([f"场景{i+1}: {desc}" for i, desc in enumerate(scene_sequence)])
-            response = dashscope.Generation.call(
+            response = await run_blocking(
+                dashscope.Generation.call,
                 model=self.model_name,
                 messages=[
                     {
@@ -199,6 +209,7 @@ class LLMClient:
                 }
             else:
                 print(f"[错误] 通义千问API调用失败: {response}")
+                note_fallback('llm')
                 # 回退到模拟实现
                 return {
                     'success': True,
@@ -214,6 +225,7 @@ class LLMClient:
                 }
         except Exception as e:
             print(f"[错误] 场景逻辑评估失败: {e}")
+            note_fallback('llm')
             # 回退到模拟实现
             return {
                 'success': True,
@@ -1,13 +1,13 @@
-from typing import Dict, Any, Union
-from .vlm_client import VLMClient
-from .llm_client import LLMClient
+from typing import Dict, Any, Optional, Union
+from ..utils.components import ComponentRegistry, get_components
 
 class ModelManager:
-    def __init__(self, config: Dict[str, Any]):
-# 初始化模型管理器
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
+# 初始化模型管理器（客户端取自共享组件注册表）
         self.config = config
-        self.vlm_client = VLMClient(config)
-        self.llm_client = LLMClient(config)
+        components = components or get_components(config)
+        self.vlm_client = components.vlm_client()
+        self.llm_client = components.llm_client()
     
     async def analyze_video_content(self, video_path: str, prompt: str) -> Dict[str, Any]:
 # 调用VLM分析视频内容
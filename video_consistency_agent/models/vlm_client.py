@@ -1,8 +1,14 @@
 import os
+import re
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
+import asyncio
 import dashscope
 
+from ..utils.executor import run_blocking
+from ..utils.fallback_tracker import note_fallback
+from ..utils.image_payload import get_image_payloads
+
 class VLMClient:
     def __init__(self, config: Dict[str, Any]):
 # 初始化视觉语言模型客户端
@@ -15,6 +21,17 @@ class VLMClient:
             dashscope.api_key = self.api_key
         
         self.timeout = config.get('timeout', 30)
+        # 多对关键帧合并为一次请求时每个请求的最大图像对数；图像经共享载荷缓存缩放、编码一次
+        payload_config = config.get('vlm_payload') or {}
+        self.max_pairs_per_request = int(payload_config.get('max_pairs_per_request', 4))
+        self.payloads = get_image_payloads(payload_config)
+    
+    async def _image(self, image_path: str) -> str:
+# 图像载荷：缩放、重新编码后的 data URL（共享缓存，同一张图只编码一次）
+        payload = await run_blocking(self.payloads.data_url, image_path)
+        if payload is None:
+            raise ValueError(f"无法读取图像: {image_path}")
+        return payload
     
     async def analyze_video_content(self, video_path: str, prompt: str) -> Dict[str, Any]:
 # 调用视觉语言模型分析视频内容
@@ -27,10 +44,11 @@ class VLMClient:
             # 实际实现中应提取多个关键帧进行分析
             from ..utils.video_utils import VideoUtils
             video_utils = VideoUtils()
-            keyframes = video_utils.extract_keyframes(video_path, num_keyframes=1)
+            keyframes = await run_blocking(video_utils.extract_keyframes, video_path, num_keyframes=1)
             
             if not keyframes:
                 print(f"[错误] 无法提取关键帧: {video_path}")
+                note_fallback('vlm')
                 # 回退到模拟实现
                 return {
                     'model': self.model_name,
@@ -54,8 +72,10 @@ class VLMClient:
             # 使用通义千问视觉API分析关键帧
             keyframe_path = keyframes[0]
             print(f"[VLM Client] 分析关键帧: {keyframe_path}")
+            image = await self._image(keyframe_path)
             
-            response = dashscope.MultiModalConversation.call(
+            response = await run_blocking(
+                dashscope.MultiModalConversation.call,
                 model=self.model_name,
                 messages=[
                     {
@@ -66,7 +86,7 @@ class VLMClient:
                         "role": "user",
                         "content": [
                             {
-                                "image": keyframe_path
+                                "image": image
                             },
                             {
                                 "text": prompt
@@ -102,6 +122,7 @@ class VLMClient:
                 }
             else:
                 print(f"[错误] 通义千问视觉API调用失败: {response}")
+                note_fallback('vlm')
                 # 回退到模拟实现
                 return {
                     'model': self.model_name,
@@ -123,6 +144,7 @@ class VLMClient:
                 }
         except Exception as e:
             print(f"[错误] 视频内容分析失败: {e}")
+            note_fallback('vlm')
             # 回退到模拟实现
             return {
                 'model': self.model_name,
@@ -151,11 +173,14 @@ class VLMClient:
             # 提取两个场景的关键帧
             from ..utils.video_utils import VideoUtils
             video_utils = VideoUtils()
-            scene1_keyframes = video_utils.extract_keyframes(scene1_path, num_keyframes=1)
-            scene2_keyframes = video_utils.extract_keyframes(scene2_path, num_keyframes=1)
+            scene1_keyframes, scene2_keyframes = await asyncio.gather(
+                run_blocking(video_utils.extract_keyframes, scene1_path, num_keyframes=1),
+                run_blocking(video_utils.extract_keyframes, scene2_path, num_keyframes=1)
+            )
             
             if not scene1_keyframes or not scene2_keyframes:
                 print(f"[错误] 无法提取关键帧")
+                note_fallback('vlm')
                 # 回退到模拟实现
                 return {
                     'model': self.model_name,
@@ -172,7 +197,9 @@ class VLMClient:
                 }
             
             # 使用通义千问视觉API比较风格
-            response = dashscope.MultiModalConversation.call(
+            image1, image2 = await asyncio.gather(self._image(scene1_keyframes[0]), self._image(scene2_keyframes[0]))
+            response = await run_blocking(
+                dashscope.MultiModalConversation.call,
                 model=self.model_name,
                 messages=[
                     {
@@ -183,10 +210,10 @@ class VLMClient:
                         "role": "user",
                         "content": [
                             {
-                                "image": scene1_keyframes[0]
+                                "image": image1
                             },
                             {
-                                "image": scene2_keyframes[0]
+                                "image": image2
                             },
                             {
                                 "text": "请比较这两个图像的风格一致性，给出0-1的相似度分数，并说明理由。"
@@ -220,6 +247,7 @@ class VLMClient:
                 }
             else:
                 print(f"[错误] 通义千问视觉API调用失败: {response}")
+                note_fallback('vlm')
                 # 回退到模拟实现
                 return {
                     'model': self.model_name,
@@ -236,6 +264,7 @@ class VLMClient:
                 }
         except Exception as e:
             print(f"[错误] 风格比较失败: {e}")
+            note_fallback('vlm')
             # 回退到模拟实现
             return {
                 'model': self.model_name,
@@ -259,7 +288,8 @@ class VLMClient:
             print(f"[VLM Client] 场景2: {scene2_desc[:50]}...")
             
             # 使用通义千问API评估内容连贯性
-            response = dashscope.Generation.call(
+            response = await run_blocking(
+                dashscope.Generation.call,
                 model='qwen-plus',
                 messages=[
                     {
@@ -293,6 +323,7 @@ class VLMClient:
                 }
             else:
                 print(f"[错误] 通义千问API调用失败: {response}")
+                note_fallback('vlm')
                 # 回退到模拟实现
                 return {
                     'model': self.model_name,
@@ -305,6 +336,7 @@ class VLMClient:
                 }
         except Exception as e:
             print(f"[错误] 内容连贯性评估失败: {e}")
+            note_fallback('vlm')
             # 回退到模拟实现
             return {
                 'model': self.model_name,
@@ -320,9 +352,11 @@ class VLMClient:
 # 分析两个关键帧的一致性
         try:
             print(f"[VLM Client] 分析关键帧一致性: {keyframe1_path} vs {keyframe2_path}")
+            image1, image2 = await asyncio.gather(self._image(keyframe1_path), self._image(keyframe2_path))
             
             # 使用通义千问视觉API分析关键帧一致性
-            response = dashscope.MultiModalConversation.call(
+            response = await run_blocking(
+                dashscope.MultiModalConversation.call,
                 model=self.model_name,
                 messages=[
                     {
@@ -333,10 +367,10 @@ class VLMClient:
                         "role": "user",
                         "content": [
                             {
-                                "image": keyframe1_path
+                                "image": image1
                             },
                             {
-                                "image": keyframe2_path
+                                "image": image2
                             },
                             {
                                 "text": "请分析这两个关键帧的一致性，并给出详细的分析结果。"
@@ -371,6 +405,7 @@ class VLMClient:
                 }
             else:
                 print(f"[错误] 通义千问视觉API调用失败: {response}")
+                note_fallback('vlm')
                 # 回退到模拟实现
                 return {
                     'model': self.model_name,
@@ -388,6 +423,7 @@ class VLMClient:
                 }
         except Exception as e:
             print(f"[错误] 关键帧一致性分析失败: {e}")
+            note_fallback('vlm')
             # 回退到模拟实现
             return {
                 'model': self.model_name,
@@ -403,4 +439,111 @@ class VLMClient:
                     'suggestions': []
                 }
             }
-
+    
+    async def analyze_keyframe_consistency_batch(self, pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        批量分析多对关键帧的一致性
+        
+        每 max_pairs_per_request 对合并为一次多模态请求，要求模型按编号返回逐对 JSON；图像使用缩放后的缓存载荷。
+        
+        Returns:
+            与 pairs 等长的列表，每项格式同 analyze_keyframe_consistency
+        """
+        pairs = [tuple(pair) for pair in pairs]
+        # 相邻过渡共用关键帧：先对去重后的图像编码一次，各批次请求直接命中载荷缓存
+        unique_paths = list(dict.fromkeys(path for pair in pairs for path in pair))
+        await asyncio.gather(*(run_blocking(self.payloads.data_url, path) for path in unique_paths))
+        batches = [pairs[start:start + self.max_pairs_per_request]
+                   for start in range(0, len(pairs), self.max_pairs_per_request)]
+        results = await asyncio.gather(*(self._analyze_keyframe_batch(batch) for batch in batches))
+        return [item for batch in results for item in batch]
+    
+    async def _analyze_keyframe_batch(self, pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        try:
+            print(f"[VLM Client] 批量分析关键帧一致性: {len(pairs)} 对")
+            images = await asyncio.gather(*(run_blocking(self.payloads.data_url, path) for pair in pairs for path in pair))
+            if any(image is None for image in images):
+                raise ValueError("存在无法读取的关键帧")
+            
+            content = []
+            for index in range(len(pairs)):
+                content.append({"text": f"第{index + 1}对："})
+                content.append({"image": images[2 * index]})
+                content.append({"image": images[2 * index + 1]})
+            content.append({
+                "text": f"以上共{len(pairs)}对关键帧，请逐对分析每对两帧之间的一致性，只返回JSON：\n"
+                        '{"pairs": [{"index": 序号, "visual_similarity": 0-1, "object_consistency": 0-1, '
+                        '"position_consistency": 0-1, "lighting_consistency": 0-1, "overall_consistency": 0-1, '
+                        '"issues": ["问题"], "suggestions": ["建议"]}]}'
+            })
+            
+            response = await run_blocking(
+                dashscope.MultiModalConversation.call,
+                model=self.model_name,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "你是一个专业的视频内容分析师，擅长分析关键帧之间的一致性。请从视觉相似性、对象一致性、位置一致性、照明一致性等方面逐对分析，并给出0-1的分数。"
+                    },
+                    {
+                        "role": "user",
+                        "content": content
+                    }
+                ],
+                temperature=0.1,
+                timeout=self.timeout
+            )
+            
+            if response.status_code != 200:
+                print(f"[错误] 通义千问视觉API批量调用失败: {response}")
+                note_fallback('vlm')
+                return [self._default_keyframe_consistency(*pair) for pair in pairs]
+            
+            answer = response.output.choices[0].message.content
+            if isinstance(answer, list):
+                answer = ''.join(part.get('text', '') for part in answer if isinstance(part, dict))
+            by_index = {}
+            match = re.search(r'\{[\s\S]*\}', answer or '')
+            if match:
+                for item in json.loads(match.group()).get('pairs', []):
+                    if isinstance(item, dict) and isinstance(item.get('index'), int):
+                        by_index[item['index']] = item
+            
+            results = []
+            for index, (keyframe1_path, keyframe2_path) in enumerate(pairs, start=1):
+                result = self._default_keyframe_consistency(keyframe1_path, keyframe2_path)
+                item = by_index.get(index)
+                if item is None:
+                    print(f"[警告] 批量结果缺少第{index}对，使用默认分数")
+                    note_fallback('vlm')
+                else:
+                    analysis = result['consistency_analysis']
+                    for key in ('visual_similarity', 'object_consistency', 'position_consistency',
+                                'lighting_consistency', 'overall_consistency'):
+                        if isinstance(item.get(key), (int, float)):
+                            analysis[key] = float(item[key])
+                    analysis['issues'] = list(item.get('issues') or [])
+                    analysis['suggestions'] = list(item.get('suggestions') or [])
+                results.append(result)
+            return results
+        except Exception as e:
+            print(f"[错误] 批量关键帧一致性分析失败: {e}")
+            note_fallback('vlm')
+            return [self._default_keyframe_consistency(*pair) for pair in pairs]
+    
+    def _default_keyframe_consistency(self, keyframe1_path: str, keyframe2_path: str) -> Dict[str, Any]:
+        # 与 analyze_keyframe_consistency 的回退结果一致
+        return {
+            'model': self.model_name,
+            'keyframe1_path': keyframe1_path,
+            'keyframe2_path': keyframe2_path,
+            'consistency_analysis': {
+                'visual_similarity': 0.88,
+                'object_consistency': 0.95,
+                'position_consistency': 0.9,
+                'lighting_consistency': 0.85,
+                'overall_consistency': 0.9,
+                'issues': [],
+                'suggestions': []
+            }
+        }
@@ -1,11 +1,11 @@
-from typing import Dict, Any, List
-from ..models.llm_client import LLMClient
+from typing import Dict, Any, List, Optional
+from ..utils.components import ComponentRegistry, get_components
 
 class PromptOptimizer:
-    def __init__(self, config: Dict[str, Any]):
-# 初始化提示词优化器
+    def __init__(self, config: Dict[str, Any], components: Optional[ComponentRegistry] = None):
+# 初始化提示词优化器（LLM 客户端取自共享组件注册表）
         self.config = config
-        self.llm_client = LLMClient(config)
+        self.llm_client = (components or get_components(config)).llm_client()
     
     async def optimize(self, original_prompt: str, consistency_issues: List[str], generation_params: Dict[str, Any]) -> Dict[str, Any]:
 # 根据一致性问题优化提示词
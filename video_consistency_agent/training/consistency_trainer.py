@@ -3,6 +3,7 @@
 支持预训练模型微调和一致性评分模型训练
 """
 import os
+import sys
 import json
 import random
 import logging
@@ -20,6 +21,10 @@ import numpy as np
 import cv2
 from PIL import Image
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from video_consistency_agent.utils.embedding_store import MISS, get_embedding_store
+from video_consistency_agent.utils.fast_ssim import structural_similarity_from_files
+
 logger = logging.getLogger(__name__)
 
 
@@ -64,8 +69,10 @@ class ConsistencyDataset(Dataset):
     def __getitem__(self, idx):
         sample = self.samples[idx]
         
-        image1 = self._load_image(sample['image1'])
-        image2 = self._load_image(sample['image2'])
+        path1 = self._resolve_path(sample['image1'])
+        path2 = self._resolve_path(sample['image2'])
+        image1 = Image.open(path1).convert('RGB')
+        image2 = Image.open(path2).convert('RGB')
         label = float(sample.get('label', 0.5))
         
         if self.transform:
@@ -76,15 +83,19 @@ class ConsistencyDataset(Dataset):
             'image1': image1,
             'image2': image2,
             'label': torch.tensor(label, dtype=torch.float32),
+            'path1': path1,
+            'path2': path2,
             'metadata': sample.get('metadata', {})
         }
     
-    def _load_image(self, path: str) -> Image.Image:
+    def _resolve_path(self, path: str) -> str:
         if not os.path.isabs(path):
             base_dir = os.path.dirname(self.data_path)
             path = os.path.join(base_dir, path)
-        
-        return Image.open(path).convert('RGB')
+        return path
+    
+    def _load_image(self, path: str) -> Image.Image:
+        return Image.open(self._resolve_path(path)).convert('RGB')
 
 
 class ConsistencyScoringHead(nn.Module):
@@ -174,6 +185,11 @@ class ConsistencyModel(nn.Module):
         )
         
         self._init_pretrained_models()
+        
+        # 骨干网络冻结、预处理固定（Resize 224 + ImageNet 归一化），同一图像的特征可跨 epoch、跨训练复用；
+        # 使用随机数据增强时应关闭（embedding_store.enabled: false）
+        store_config = self.config.get('embedding_store') or {}
+        self.embedding_store = get_embedding_store(store_config) if store_config.get('enabled', True) else None
     
     def _init_pretrained_models(self):
         """初始化预训练模型"""
@@ -243,19 +259,52 @@ class ConsistencyModel(nn.Module):
         
         return torch.cat(features_list, dim=-1)
     
-    def forward(self, image1: torch.Tensor, image2: torch.Tensor) -> Dict[str, torch.Tensor]:
-        """前向传播"""
-        features1 = {
-            'clip': self.extract_clip_features(image1),
-            'face': self.extract_face_features(image1),
-            'vgg': self.extract_vgg_features(image1)
-        }
+    def encode(self, images: torch.Tensor, paths: Optional[List[str]] = None) -> Dict[str, torch.Tensor]:
+        """
+        提取一批图像的骨干特征
         
-        features2 = {
-            'clip': self.extract_clip_features(image2),
-            'face': self.extract_face_features(image2),
-            'vgg': self.extract_vgg_features(image2)
+        传入 paths 时先查嵌入存储，只对未缓存的图像推理并写回
+        """
+        extractors = {
+            'clip': (self.clip_model, self.extract_clip_features),
+            'face': (self.face_encoder, self.extract_face_features),
+            'vgg': (self.vgg_model, self.extract_vgg_features)
         }
+        if self.embedding_store is None or paths is None:
+            return {name: extract(images) for name, (_, extract) in extractors.items()}
+        
+        digests = [self.embedding_store.content_hash(path) for path in paths]
+        features = {}
+        for name, (model, extract) in extractors.items():
+            if model is None:
+                features[name] = extract(images)
+                continue
+            model_id = self._store_model_id(name)
+            rows = self.embedding_store.get_many(model_id, digests)
+            todo = [i for i, vector in enumerate(rows) if vector is MISS or vector is None]
+            if todo:
+                computed = extract(images[todo]).cpu()
+                self.embedding_store.put_many(model_id, zip([digests[i] for i in todo], computed.numpy()))
+                for n, i in enumerate(todo):
+                    rows[i] = computed[n]
+            features[name] = torch.stack([
+                row if torch.is_tensor(row) else torch.from_numpy(row) for row in rows
+            ]).to(images.device)
+        return features
+    
+    def _store_model_id(self, name: str) -> str:
+        if name == 'clip':
+            return f"clip:{self.config.get('clip_model', 'openai/clip-vit-base-patch32')}:train224"
+        if name == 'face':
+            return 'face:vggface2:train224'
+        return 'vgg:vgg19:4,9,18,27,36:train224'
+    
+    def forward(self, image1: torch.Tensor, image2: torch.Tensor,
+                paths1: Optional[List[str]] = None,
+                paths2: Optional[List[str]] = None) -> Dict[str, torch.Tensor]:
+        """前向传播"""
+        features1 = self.encode(image1, paths1)
+        features2 = self.encode(image2, paths2)
         
         return self.score_head(features1, features2)
 
@@ -367,7 +416,7 @@ class ConsistencyTrainer:
             
             self.optimizer.zero_grad()
             
-            outputs = self.model(image1, image2)
+            outputs = self.model(image1, image2, batch['path1'], batch['path2'])
             
             loss = self.compute_loss(outputs, labels)
             
@@ -404,7 +453,7 @@ class ConsistencyTrainer:
                 image2 = batch['image2'].to(self.device)
                 labels = batch['label'].to(self.device)
                 
-                outputs = self.model(image1, image2)
+                outputs = self.model(image1, image2, batch['path1'], batch['path2'])
                 
                 loss = self.compute_loss(outputs, labels)
                 
@@ -505,21 +554,11 @@ class DataAnnotator:
             'metadata': metadata or {}
         })
     
-    def auto_label_from_ssim(self, image1_path: str, image2_path: str) -> float:
-        """使用SSIM自动标注"""
-        from skimage.metrics import structural_similarity as ssim
-        
-        img1 = cv2.imread(image1_path, cv2.IMREAD_GRAYSCALE)
-        img2 = cv2.imread(image2_path, cv2.IMREAD_GRAYSCALE)
-        
-        if img1 is None or img2 is None:
-            return 0.5
-        
-        if img1.shape != img2.shape:
-            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
-        
-        score, _ = ssim(img1, img2, full=True)
-        return float(score)
+    def auto_label_from_ssim(self, image1_path: str, image2_path: str,
+                             method: str = 'ssim', working_size: int = 512) -> float:
+        """使用SSIM自动标注（working_size 为工作分辨率长边，method 可选 ms-ssim）"""
+        score = structural_similarity_from_files(image1_path, image2_path, method, working_size)
+        return 0.5 if score is None else score
     
     def auto_label_from_clip(self, image1_path: str, image2_path: str) -> float:
         """使用CLIP自动标注"""
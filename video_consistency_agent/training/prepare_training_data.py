@@ -3,6 +3,7 @@
 用于从现有视频生成一致性检测训练数据
 """
 import os
+import sys
 import json
 import cv2
 import numpy as np
@@ -11,6 +12,9 @@ from pathlib import Path
 import logging
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from video_consistency_agent.utils.fast_ssim import structural_similarity_from_files
+
 logger = logging.getLogger(__name__)
 
 
@@ -56,20 +60,13 @@ class TrainingDataPreparer:
         return frame_paths
     
     def calculate_ssim(self, image1_path: str, image2_path: str) -> float:
-        """计算SSIM"""
-        from skimage.metrics import structural_similarity as ssim
-        
-        img1 = cv2.imread(image1_path, cv2.IMREAD_GRAYSCALE)
-        img2 = cv2.imread(image2_path, cv2.IMREAD_GRAYSCALE)
-        
-        if img1 is None or img2 is None:
-            return 0.5
-        
-        if img1.shape != img2.shape:
-            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
-        
-        score, _ = ssim(img1, img2, full=True)
-        return float(score)
+        """计算SSIM（工作分辨率 ssim_working_size，ssim_method 可选 ms-ssim）"""
+        score = structural_similarity_from_files(
+            image1_path, image2_path,
+            method=self.config.get('ssim_method', 'ssim'),
+            working_size=self.config.get('ssim_working_size', 512)
+        )
+        return 0.5 if score is None else score
     
     def calculate_color_similarity(self, image1_path: str, image2_path: str) -> float:
         """计算颜色相似度"""
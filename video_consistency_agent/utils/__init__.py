@@ -1,9 +1,45 @@
 from .feature_extractor import FeatureExtractor
 from .similarity import SimilarityCalculator
 from .video_utils import VideoUtils
+from .media_scheduler import MediaJobScheduler, MediaJobCancelled, get_media_scheduler
+from .scratch_space import ScratchSpaceManager, get_scratch_space
+from .embedding_store import EmbeddingStore, get_embedding_store
+from .image_comparison import ImageComparisonEngine, get_comparison_engine
+from .perceptual_hash import PerceptualHashIndex, get_hash_index
+from .check_memo import CheckResultMemo, get_check_memo
+from .executor import get_thread_executor, run_blocking, run_sync
+from .process_pool import MetricProcessPool, get_process_pool
+from .image_payload import ImagePayloadCache, get_image_payloads
+from .components import ComponentRegistry, get_components
+from .fast_ssim import ms_ssim, ssim, structural_similarity
 
 __all__ = [
     'FeatureExtractor',
     'SimilarityCalculator',
-    'VideoUtils'
+    'VideoUtils',
+    'MediaJobScheduler',
+    'MediaJobCancelled',
+    'get_media_scheduler',
+    'ScratchSpaceManager',
+    'get_scratch_space',
+    'EmbeddingStore',
+    'get_embedding_store',
+    'ImageComparisonEngine',
+    'get_comparison_engine',
+    'PerceptualHashIndex',
+    'get_hash_index',
+    'CheckResultMemo',
+    'get_check_memo',
+    'get_thread_executor',
+    'run_blocking',
+    'run_sync',
+    'MetricProcessPool',
+    'get_process_pool',
+    'ImagePayloadCache',
+    'get_image_payloads',
+    'ComponentRegistry',
+    'get_components',
+    'ssim',
+    'ms_ssim',
+    'structural_similarity'
 ]
@@ -0,0 +1,223 @@
+"""
+场景对检查结果的持久化记忆
+按 (当前场景关键帧内容哈希, 上一场景关键帧内容哈希与变化检测字段, 检查器配置版本) 存储各维度的分数与结论，
+当前场景的变化检测字段随结果存为快照（由 ChangeDetector 逐维度比较），上一场景的字段直接计入键；
+存放在 SQLite 中，跨进程、跨运行复用；条目数有上限，按最近使用时间淘汰。
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .embedding_store import get_embedding_store
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('visual', 'temporal', 'semantic', 'style')
+
+# 与检查结果无关的配置段，变化时不使记忆失效
+_RUNTIME_SECTIONS = ('check_memo', 'logging', 'media_scheduler', 'scratch_space', 'embedding_store', 'executor',
+                     'process_pool', 'regeneration')
+
+# 变化检测使用的场景字段，随结果一起存下来供 ChangeDetector 比较
+_SNAPSHOT_FIELDS = ('scene_id', 'description', 'duration', 'video_info', 'style_elements',
+                    'technical_params', 'width', 'height', 'fps')
+
+
+def config_version(config: Dict[str, Any]) -> str:
+    """检查器配置版本：除运行时配置段外的全部配置的哈希，再拼上 check_memo.version（代码改动时手动升级）"""
+    config = config or {}
+    relevant = {k: v for k, v in config.items() if k not in _RUNTIME_SECTIONS}
+    digest = hashlib.sha1(json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+    version = (config.get('check_memo') or {}).get('version', '1')
+    return f"{version}:{digest.hexdigest()[:16]}"
+
+
+def scene_snapshot(scene: Dict[str, Any], keyframe_digests: Optional[List[str]] = None) -> Dict[str, Any]:
+    """场景中参与变化检测的字段；关键帧记为内容哈希（不含临时路径，跨运行可比较）"""
+    snapshot = {k: scene.get(k) for k in _SNAPSHOT_FIELDS if k in scene}
+    snapshot['keyframes'] = list(keyframe_digests or [])
+    return snapshot
+
+
+def is_memoizable(dim_result: Dict[str, Any]) -> bool:
+    """维度结果是否为真实检查结果：分级检查的廉价估分、VLM / LLM 降级或检查器异常时的默认分数不写入记忆"""
+    return dim_result.get('tier') != 'cheap' and not dim_result.get('fallback')
+
+
+class CheckResultMemo:
+    """
+    场景对检查结果记忆（线程安全）
+
+    配置项：
+        path: SQLite 文件，默认 ~/.cache/video_consistency/check_memo.db
+        max_entries: 条目上限（默认 10000），超出后淘汰最久未使用的条目
+    """
+
+    def __init__(self, config: Dict[str, Any] = None, embedding_store_config: Dict[str, Any] = None):
+        config = config or {}
+        self.path = config.get('path') or os.path.join(
+            os.path.expanduser('~'), '.cache', 'video_consistency', 'check_memo.db')
+        self.max_entries = int(config.get('max_entries', 10000))
+        self._hasher = get_embedding_store(embedding_store_config)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS pair_results ('
+            'memo_key TEXT PRIMARY KEY, config_version TEXT, current_scene TEXT, results TEXT, '
+            'created_at REAL, last_used REAL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_pair_results_last_used ON pair_results (last_used)')
+        self._db.commit()
+        self.stats = {'hits': 0, 'misses': 0, 'puts': 0, 'skipped': 0, 'evictions': 0}
+
+    def keyframes_hash(self, keyframes: List[str]) -> Optional[str]:
+        """按顺序拼接各关键帧内容哈希；任一关键帧无法读取或列表为空时返回 None（不参与记忆）"""
+        digests = self._keyframe_digests(keyframes)
+        if digests is None:
+            return None
+        h = hashlib.sha256()
+        for digest in digests:
+            h.update(digest)
+        return h.hexdigest()
+
+    def _keyframe_digests(self, keyframes: List[str]) -> Optional[List[bytes]]:
+        if not keyframes:
+            return None
+        digests = []
+        for path in keyframes:
+            digest = self._hasher.content_hash(path) if path else None
+            if digest is None:
+                return None
+            digests.append(digest)
+        return digests
+
+    def snapshot(self, scene: Dict[str, Any]) -> Dict[str, Any]:
+        """场景快照（关键帧记为十六进制内容哈希，无法读取的关键帧记为空）"""
+        digests = self._keyframe_digests(scene.get('keyframes'))
+        return scene_snapshot(scene, [digest.hex() for digest in digests] if digests is not None else None)
+
+    def memo_key(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any], version: str) -> Optional[str]:
+        if not current_scene or not previous_scene:
+            return None
+        current_hash = self.keyframes_hash(current_scene.get('keyframes'))
+        previous_hash = self.keyframes_hash(previous_scene.get('keyframes'))
+        if current_hash is None or previous_hash is None:
+            return None
+        # 上一场景的描述、风格元素、技术参数等变化时关键帧可能不变，这些字段同样计入键，变化后不再命中
+        previous_fields = {k: v for k, v in scene_snapshot(previous_scene).items() if k != 'keyframes'}
+        previous_hash += '|' + json.dumps(previous_fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{current_hash}|{previous_hash}|{version}".encode('utf-8')).hexdigest()
+
+    def get(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any],
+            version: str) -> Optional[Dict[str, Any]]:
+        """
+        查询场景对的记忆
+
+        Returns:
+            {'current_scene': 场景快照, 'results': {维度: {'score', 'passed', 'issues'}}, 'created_at'}，未命中为 None
+        """
+        key = self.memo_key(current_scene, previous_scene, version)
+        if key is None:
+            return None
+        with self._lock:
+            try:
+                row = self._db.execute(
+                    'SELECT current_scene, results, created_at FROM pair_results WHERE memo_key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE pair_results SET last_used = ? WHERE memo_key = ?', (time.time(), key))
+                    self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[检查记忆] 查询失败: {e}")
+                row = None
+            self.stats['hits' if row is not None else 'misses'] += 1
+        if row is None:
+            return None
+        return {'current_scene': json.loads(row[0]), 'results': json.loads(row[1]), 'created_at': row[2]}
+
+    def put(self, current_scene: Dict[str, Any], previous_scene: Dict[str, Any], version: str,
+            consistency_results: Dict[str, Any]) -> bool:
+        """
+        记录一次检查的各维度结果（取自 AnalysisModule.evaluate_consistency 的返回值）
+
+        任一维度来自廉价估分或降级默认值时整条不记录（返回 False），下次运行重新检查
+        """
+        for dim in DIMENSIONS:
+            if not is_memoizable(consistency_results.get(f'{dim}_result') or {}):
+                with self._lock:
+                    self.stats['skipped'] += 1
+                logger.debug(f"[检查记忆] {dim} 维度结果来自廉价估分或降级默认值，不记录")
+                return False
+        key = self.memo_key(current_scene, previous_scene, version)
+        if key is None:
+            return False
+        results = {}
+        for dim in DIMENSIONS:
+            dim_result = consistency_results.get(f'{dim}_result') or {}
+            results[dim] = {
+                'score': float(consistency_results.get(f'{dim}_score', dim_result.get('score', 1.0))),
+                'passed': bool(dim_result.get('passed', True)),
+                'issues': list(dim_result.get('issues', []))
+            }
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO pair_results '
+                    '(memo_key, config_version, current_scene, results, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, version, json.dumps(self.snapshot(current_scene), ensure_ascii=False, default=str),
+                     json.dumps(results, ensure_ascii=False, default=str), now, now)
+                )
+                self.stats['puts'] += 1
+                self._evict()
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[检查记忆] 写入失败: {e}")
+                return False
+        return True
+
+    def _evict(self) -> None:
+        count = self._db.execute('SELECT COUNT(*) FROM pair_results').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                'DELETE FROM pair_results WHERE memo_key IN '
+                '(SELECT memo_key FROM pair_results ORDER BY last_used LIMIT ?)', (excess,)
+            )
+            self.stats['evictions'] += excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute('DELETE FROM pair_results')
+            self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            try:
+                entries = self._db.execute('SELECT COUNT(*) FROM pair_results').fetchone()[0]
+            except sqlite3.Error:
+                entries = None
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, entries=entries, max_entries=self.max_entries,
+                        hit_rate=self.stats['hits'] / lookups if lookups else 0.0)
+
+
+_memo: Optional[CheckResultMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_check_memo(config: Dict[str, Any] = None, embedding_store_config: Dict[str, Any] = None) -> CheckResultMemo:
+    """获取进程级共享检查结果记忆；首次调用时的 config（check_memo 配置段）决定文件位置与条目上限"""
+    global _memo
+    if _memo is None:
+        with _memo_lock:
+            if _memo is None:
+                _memo = CheckResultMemo(config, embedding_store_config)
+    return _memo
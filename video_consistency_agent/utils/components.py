@@ -0,0 +1,95 @@
+"""
+进程级共享组件注册表
+VLM / LLM 客户端、相似度计算器（含阿里云客户端）、视频工具等按 YAML 配置在进程内只构建一次，
+相同配置下各检查器、感知模块、优化器通过注册表取用同一实例，避免重复初始化（重复的客户端构建、告警输出与 I/O）。
+
+注册表按配置内容区分（同一进程内不同配置的 Agent 各自使用对应配置构建的组件）；
+组件在首次取用时才构建；构造函数接收 components 参数的模块未传入时使用 get_components(config)。
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ComponentRegistry:
+    """
+    共享组件注册表（线程安全，组件惰性构建）
+
+    VLM / LLM 客户端统一使用 models 配置段（模型名、超时、API 密钥），VLM 客户端另带 vlm_payload 配置段；
+    相似度计算器、关键帧管理器使用完整配置。
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or {}
+        # 组件之间存在依赖（相似度计算器使用 VLM 客户端），构建时会重入
+        self._lock = threading.RLock()
+        self._components: Dict[str, Any] = {}
+        self.build_ms: Dict[str, float] = {}
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            component = self._components.get(name)
+            if component is None:
+                started = time.perf_counter()
+                component = self._components[name] = factory()
+                self.build_ms[name] = (time.perf_counter() - started) * 1000
+                logger.debug(f"[组件注册表] 已构建 {name}，耗时 {self.build_ms[name]:.1f}ms")
+            return component
+
+    def _model_config(self) -> Dict[str, Any]:
+        model_config = dict(self.config.get('models') or {})
+        model_config.setdefault('vlm_payload', self.config.get('vlm_payload'))
+        return model_config
+
+    def vlm_client(self):
+        from ..models.vlm_client import VLMClient
+        return self._get('vlm_client', lambda: VLMClient(self._model_config()))
+
+    def llm_client(self):
+        from ..models.llm_client import LLMClient
+        return self._get('llm_client', lambda: LLMClient(self._model_config()))
+
+    def similarity_calculator(self):
+        from .similarity import SimilarityCalculator
+        return self._get('similarity_calculator', lambda: SimilarityCalculator(self.config, vlm_client=self.vlm_client()))
+
+    def video_utils(self):
+        from .video_utils import VideoUtils
+        return self._get('video_utils', VideoUtils)
+
+    def feature_extractor(self):
+        from .feature_extractor import FeatureExtractor
+        return self._get('feature_extractor', FeatureExtractor)
+
+    def keyframe_manager(self):
+        from .keyframe_manager import KeyframeManager
+        return self._get('keyframe_manager', lambda: KeyframeManager(self.config))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'components': sorted(self._components), 'build_ms': dict(self.build_ms)}
+
+
+_registries: Dict[str, ComponentRegistry] = {}
+_registry_lock = threading.Lock()
+
+
+def _config_key(config: Optional[Dict[str, Any]]) -> str:
+    return hashlib.sha1(json.dumps(config or {}, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+def get_components(config: Dict[str, Any] = None) -> ComponentRegistry:
+    """获取共享组件注册表；按配置内容（完整配置的哈希）区分，相同配置的各模块共用一份，不同配置各自构建"""
+    key = _config_key(config)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registry_lock:
+            registry = _registries.get(key)
+            if registry is None:
+                registry = _registries[key] = ComponentRegistry(config)
+    return registry
@@ -1,129 +1,578 @@
 """
 深度学习特征提取器
 用于视频一致性检测的深度学习特征提取
+
+CLIP / FaceNet / VGG19 在首次使用时加载，并保存在进程级注册表中供所有实例、线程共享；
+可通过 DeepFeatureExtractor.warm_up() 预热、DeepFeatureExtractor.unload() 释放。
+提取结果按图像内容哈希写入嵌入存储（embedding_store），同一图像再次检测时不再推理。
+仅有 CPU 的节点可设置 clip_backend 为 int8 / onnx / onnx-int8（精度与耗时对比见 backend/scripts/benchmark_clip_backends.py）。
 """
+import gc
 import os
+import threading
 import cv2
 import numpy as np
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, Callable, Iterable, List, Tuple, Optional, Union
 import logging
 
+from .embedding_store import MISS, EmbeddingStore, get_embedding_store
+
 logger = logging.getLogger(__name__)
 
+# 已检测但图中没有人脸（与推理失败区分，前者写入嵌入存储）
+_NO_FACE = object()
+
+# 批量接口接受的图像：路径、PIL 图像或 OpenCV 读取的 BGR 数组
+ImageInput = Union[str, np.ndarray, Any]
+
+
+class _ModelRegistry:
+    """
+    进程级模型注册表：每个骨干网络（按名称 + 参数 + 设备区分）只加载一份，
+    在所有 DeepFeatureExtractor 实例与线程间共享；首次使用时才加载。
+    """
+
+    _FAILED = object()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._models: Dict[Tuple, Any] = {}
+
+    def get(self, key: Tuple, loader: Callable[[], Any]) -> Any:
+        """返回已加载的模型；未加载时调用 loader 加载（同一 key 并发时只加载一次）。加载失败返回 None 且不再重试，直到 unload"""
+        model = self._models.get(key)
+        if model is not None:
+            return None if model is self._FAILED else model
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                try:
+                    model = loader()
+                except Exception as e:
+                    logger.warning(f"[模型注册表] {key[0]} 加载失败: {e}")
+                    model = None
+                self._models[key] = self._FAILED if model is None else model
+        return None if model is self._FAILED else model
+
+    def unload(self, names: Optional[Iterable[str]] = None) -> List[Tuple]:
+        """卸载指定名称（clip / face / mtcnn / vgg）的模型，names 为空时全部卸载，返回被卸载的 key"""
+        names = set(names) if names else None
+        with self._lock:
+            keys = [k for k in self._models if names is None or k[0] in names]
+            for key in keys:
+                self._models.pop(key, None)
+        if keys:
+            gc.collect()
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+            logger.info(f"[模型注册表] 已卸载: {[k[0] for k in keys]}")
+        return keys
+
+    def loaded(self) -> List[str]:
+        """当前已成功加载的模型名称"""
+        return [k[0] for k, v in list(self._models.items()) if v is not self._FAILED]
+
+
+_MODEL_REGISTRY = _ModelRegistry()
+
+
+CLIP_BACKENDS = ('torch', 'int8', 'onnx', 'onnx-int8')
+
+
+def _use_cuda(device: str) -> bool:
+    try:
+        import torch
+        return torch.cuda.is_available() and device == 'cuda'
+    except ImportError:
+        return False
+
+
+class _OnnxClipImageEncoder:
+    """ONNX Runtime 上的 CLIP 图像编码器，提供与 CLIPModel 相同的 get_image_features 接口"""
+    
+    def __init__(self, onnx_path: str, config: Dict[str, Any]):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        threads = int(config.get('clip_threads', 0))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.onnx_path = onnx_path
+    
+    def get_image_features(self, pixel_values=None, **_):
+        import torch
+        
+        outputs = self.session.run(None, {'pixel_values': pixel_values.cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
 
 class DeepFeatureExtractor:
-    """深度学习特征提取器"""
+    """深度学习特征提取器（模型懒加载，进程内共享一份）"""
+    
+    MODEL_NAMES = ('clip', 'face', 'vgg')
+    CLIP_BACKENDS = CLIP_BACKENDS
     
     def __init__(self, config: Dict[str, Any] = None):
         self.config = config or {}
         self.device = self.config.get('device', 'cpu')
+        self.clip_model_name = self.config.get('clip_model', 'openai/clip-vit-base-patch32')
+        # CLIP 图像编码器推理后端：torch（默认，全精度）/ int8（PyTorch 动态量化）/ onnx / onnx-int8（ONNX Runtime）
+        self.clip_backend = self.config.get('clip_backend', 'torch')
+        if self.clip_backend not in CLIP_BACKENDS:
+            raise ValueError(f"未知 CLIP 后端: {self.clip_backend}，可选: {CLIP_BACKENDS}")
+        # embedding_store 配置段；enabled: false 时每次都重新推理
+        store_config = self.config.get('embedding_store') or {}
+        self.embedding_store: Optional[EmbeddingStore] = (
+            get_embedding_store(store_config) if store_config.get('enabled', True) else None
+        )
+    
+    # ---- 懒加载的模型 ----
+    
+    @property
+    def _clip_key(self) -> Tuple:
+        return ('clip', self.clip_model_name, self.device, self.clip_backend)
+    
+    @property
+    def loaded_clip_backend(self) -> str:
+        """实际加载的 CLIP 后端：非 torch 后端仅用于 CPU，GPU 上回退为全精度 torch 模型"""
+        if self.clip_backend != 'torch' and _use_cuda(self.device):
+            return 'torch'
+        return self.clip_backend
+    
+    @property
+    def clip_model(self):
+        bundle = _MODEL_REGISTRY.get(self._clip_key, self._load_clip)
+        return bundle[0] if bundle else None
+    
+    @property
+    def clip_processor(self):
+        bundle = _MODEL_REGISTRY.get(self._clip_key, self._load_clip)
+        return bundle[1] if bundle else None
+    
+    @property
+    def face_encoder(self):
+        return _MODEL_REGISTRY.get(('face', self.device), self._load_face_encoder)
+    
+    @property
+    def face_detector(self):
+        return _MODEL_REGISTRY.get(('mtcnn', self.device), self._load_face_detector)
+    
+    @property
+    def vgg_model(self):
+        return _MODEL_REGISTRY.get(('vgg', self.device), self._load_vgg)
+    
+    def warm_up(self, models: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        预加载模型（服务启动后、首个请求前调用），返回加载成功的模型名称
         
-        self.clip_model = None
-        self.clip_preprocess = None
-        self.face_encoder = None
-        self.vgg_model = None
+        Args:
+            models: 要加载的模型（clip / face / vgg），默认全部
+        """
+        ready = []
+        for name in models or self.MODEL_NAMES:
+            if name == 'clip':
+                ok = self.clip_model is not None
+            elif name == 'face':
+                ok = self.face_encoder is not None and self.face_detector is not None
+            elif name == 'vgg':
+                ok = self.vgg_model is not None
+            else:
+                raise ValueError(f"未知模型: {name}")
+            if ok:
+                ready.append(name)
+        return ready
+    
+    @staticmethod
+    def unload(models: Optional[Iterable[str]] = None) -> None:
+        """
+        卸载共享模型、释放内存（所有实例同时生效，下次使用时重新加载）
         
-        self._init_models()
+        Args:
+            models: 要卸载的模型（clip / face / vgg），默认全部
+        """
+        names = set(models) if models else None
+        if names and 'face' in names:
+            names.add('mtcnn')
+        _MODEL_REGISTRY.unload(names)
     
-    def _init_models(self):
-        """初始化所有模型"""
-        self._init_clip()
-        self._init_face_encoder()
-        self._init_vgg()
+    @staticmethod
+    def loaded_models() -> List[str]:
+        """当前进程已加载的模型"""
+        return _MODEL_REGISTRY.loaded()
     
-    def _init_clip(self):
-        """初始化CLIP模型"""
+    def _load_clip(self):
+        """加载CLIP模型，返回 (model, processor)；非 torch 后端时 model 为量化模型或 ONNX Runtime 封装"""
         try:
-            import torch
             from transformers import CLIPProcessor, CLIPModel
             
-            model_name = self.config.get('clip_model', 'openai/clip-vit-base-patch32')
-            logger.info(f"[CLIP] 加载模型: {model_name}")
+            logger.info(f"[CLIP] 加载模型: {self.clip_model_name} (后端: {self.clip_backend})")
+            
+            clip_model = CLIPModel.from_pretrained(self.clip_model_name).eval()
+            clip_processor = CLIPProcessor.from_pretrained(self.clip_model_name)
             
-            self.clip_model = CLIPModel.from_pretrained(model_name)
-            self.clip_processor = CLIPProcessor.from_pretrained(model_name)
+            backend = self.loaded_clip_backend
+            if backend != self.clip_backend:
+                logger.warning(f"[CLIP] {self.clip_backend} 后端仅用于 CPU，GPU 上使用全精度模型")
+            elif backend == 'int8':
+                import torch
+                
+                clip_model = torch.quantization.quantize_dynamic(clip_model, {torch.nn.Linear}, dtype=torch.qint8)
+            elif backend in ('onnx', 'onnx-int8'):
+                clip_model = _OnnxClipImageEncoder(self._export_clip_onnx(clip_model), self.config)
             
-            if torch.cuda.is_available() and self.device == 'cuda':
-                self.clip_model = self.clip_model.to('cuda')
+            if _use_cuda(self.device) and backend == 'torch':
+                clip_model = clip_model.to('cuda')
             
             logger.info("[CLIP] 模型加载成功")
+            return clip_model, clip_processor
         except Exception as e:
             logger.warning(f"[CLIP] 模型加载失败: {e}，将使用简化版本")
-            self.clip_model = None
-            self.clip_processor = None
+            return None
+    
+    def _export_clip_onnx(self, clip_model) -> str:
+        """把 CLIP 图像编码器导出为 ONNX（onnx-int8 再做权重动态量化），已导出时直接复用"""
+        import torch
+        
+        onnx_dir = self.config.get('clip_onnx_dir') or os.path.join(
+            os.path.expanduser('~'), '.cache', 'video_consistency', 'onnx')
+        os.makedirs(onnx_dir, exist_ok=True)
+        base = os.path.join(onnx_dir, self.clip_model_name.replace('/', '__'))
+        float_path = f'{base}.image.onnx'
+        
+        if not os.path.isfile(float_path):
+            class _ImageEncoder(torch.nn.Module):
+                def __init__(self, model):
+                    super().__init__()
+                    self.model = model
+                
+                def forward(self, pixel_values):
+                    return self.model.get_image_features(pixel_values=pixel_values)
+            
+            size = clip_model.config.vision_config.image_size
+            tmp_path = f'{float_path}.{os.getpid()}.tmp'
+            logger.info(f"[CLIP] 导出 ONNX 图像编码器: {float_path}")
+            with torch.no_grad():
+                torch.onnx.export(
+                    _ImageEncoder(clip_model), torch.randn(1, 3, size, size), tmp_path,
+                    input_names=['pixel_values'], output_names=['image_embeds'],
+                    dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+                    opset_version=17
+                )
+            os.replace(tmp_path, float_path)
+        
+        if self.clip_backend != 'onnx-int8':
+            return float_path
+        
+        int8_path = f'{base}.image.int8.onnx'
+        if not os.path.isfile(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            
+            tmp_path = f'{int8_path}.{os.getpid()}.tmp'
+            quantize_dynamic(float_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+        return int8_path
     
-    def _init_face_encoder(self):
-        """初始化人脸编码器"""
+    def _load_face_encoder(self):
+        """加载人脸编码器"""
         try:
-            import torch
             from facenet_pytorch import InceptionResnetV1
             
             logger.info("[FaceEncoder] 加载人脸识别模型")
             
-            self.face_encoder = InceptionResnetV1(pretrained='vggface2').eval()
+            face_encoder = InceptionResnetV1(pretrained='vggface2').eval()
             
-            if torch.cuda.is_available() and self.device == 'cuda':
-                self.face_encoder = self.face_encoder.to('cuda')
+            if _use_cuda(self.device):
+                face_encoder = face_encoder.to('cuda')
             
             logger.info("[FaceEncoder] 模型加载成功")
+            return face_encoder
         except Exception as e:
             logger.warning(f"[FaceEncoder] 模型加载失败: {e}")
-            self.face_encoder = None
+            return None
     
-    def _init_vgg(self):
-        """初始化VGG感知模型"""
+    def _load_face_detector(self):
+        """加载MTCNN人脸检测器（原先每次提取都会新建）"""
+        try:
+            from facenet_pytorch import MTCNN
+            
+            return MTCNN(device=self.device)
+        except Exception as e:
+            logger.warning(f"[FaceEncoder] 人脸检测器加载失败: {e}")
+            return None
+    
+    def _load_vgg(self):
+        """加载VGG感知模型"""
         try:
-            import torch
             import torchvision.models as models
             
             logger.info("[VGG] 加载VGG感知模型")
             
-            vgg = models.vgg19(pretrained=True).features
-            self.vgg_model = vgg.eval()
+            vgg_model = models.vgg19(pretrained=True).features.eval()
             
-            for param in self.vgg_model.parameters():
+            for param in vgg_model.parameters():
                 param.requires_grad = False
             
-            if torch.cuda.is_available() and self.device == 'cuda':
-                self.vgg_model = self.vgg_model.to('cuda')
+            if _use_cuda(self.device):
+                vgg_model = vgg_model.to('cuda')
             
             logger.info("[VGG] 模型加载成功")
+            return vgg_model
         except Exception as e:
             logger.warning(f"[VGG] 模型加载失败: {e}")
-            self.vgg_model = None
+            return None
     
-    def extract_clip_embedding(self, image_path: str) -> Optional[np.ndarray]:
+    # ---- 批量提取（每个骨干网络每批一次前向） ----
+    
+    @property
+    def batch_size(self) -> int:
+        return max(1, int(self.config.get('batch_size', 16)))
+    
+    @staticmethod
+    def _to_pil(image: ImageInput):
+        """路径 / PIL 图像 / numpy 数组（按 OpenCV 约定为 BGR）统一转换为 RGB PIL 图像"""
+        from PIL import Image
+        
+        if isinstance(image, str):
+            return Image.open(image).convert('RGB')
+        if isinstance(image, np.ndarray):
+            if image.ndim == 2:
+                return Image.fromarray(image).convert('RGB')
+            return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return image.convert('RGB')
+    
+    def _batches(self, images: List[ImageInput], batch_size: Optional[int]):
+        size = max(1, int(batch_size or self.batch_size))
+        for start in range(0, len(images), size):
+            yield start, images[start:start + size]
+    
+    def _load_batch(self, images: List[ImageInput], tag: str) -> Tuple[List[int], List[Any]]:
+        """加载一批图像，返回 (成功加载的下标, PIL 图像)；单张失败不影响其余"""
+        indices, pil_images = [], []
+        for i, image in enumerate(images):
+            try:
+                pil_images.append(self._to_pil(image))
+                indices.append(i)
+            except Exception as e:
+                logger.error(f"[{tag}] 图像读取失败: {e}")
+        return indices, pil_images
+    
+    def _through_store(self, model_id: str, images: List[ImageInput],
+                       compute: Callable[[List[ImageInput]], List[Any]]) -> List[Any]:
+        """先查嵌入存储，只对未缓存的图像推理并写回（推理失败的 None 不写入，下次重试）"""
+        store = self.embedding_store
+        if store is None or not images:
+            return compute(images)
+        digests = [store.content_hash(image) for image in images]
+        results = store.get_many(model_id, digests)
+        todo = [i for i, r in enumerate(results) if r is MISS]
+        if todo:
+            computed = compute([images[i] for i in todo])
+            for i, vector in zip(todo, computed):
+                results[i] = vector
+            store.put_many(model_id, [
+                (digests[i], None if vector is _NO_FACE else vector)
+                for i, vector in zip(todo, computed) if vector is not None
+            ])
+        return results
+    
+    def extract_clip_embeddings(self, images: List[ImageInput],
+                                batch_size: Optional[int] = None) -> List[Optional[np.ndarray]]:
         """
-        提取CLIP图像嵌入向量
+        批量提取CLIP图像嵌入向量
         
         Args:
-            image_path: 图像路径
+            images: 图像路径 / PIL 图像 / BGR numpy 数组列表
+            batch_size: 每批图像数，默认取配置 batch_size（16）
             
         Returns:
-            512维的CLIP嵌入向量
+            与输入一一对应的512维归一化嵌入向量列表，失败项为 None
         """
-        if not self.clip_model or not self.clip_processor:
-            return None
+        # 嵌入按实际加载的后端区分（GPU 上回退为全精度时与 torch 后端共用缓存）
+        model_id = f'clip:{self.clip_model_name}'
+        if self.loaded_clip_backend != 'torch':
+            model_id += f':{self.loaded_clip_backend}'
+        return self._through_store(model_id, images,
+                                   lambda todo: self._compute_clip(todo, batch_size))
+    
+    def _compute_clip(self, images: List[ImageInput], batch_size: Optional[int]) -> List[Optional[np.ndarray]]:
+        results: List[Optional[np.ndarray]] = [None] * len(images)
+        clip_model, clip_processor = self.clip_model, self.clip_processor
+        if not clip_model or not clip_processor:
+            return results
+        
+        import torch
+        
+        for start, chunk in self._batches(images, batch_size):
+            indices, pil_images = self._load_batch(chunk, 'CLIP')
+            if not pil_images:
+                continue
+            try:
+                inputs = clip_processor(images=pil_images, return_tensors="pt")
+                if _use_cuda(self.device):
+                    inputs = {k: v.to('cuda') for k, v in inputs.items()}
+                
+                with torch.no_grad():
+                    image_features = clip_model.get_image_features(**inputs)
+                    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+                
+                for i, feature in zip(indices, image_features.cpu().numpy()):
+                    results[start + i] = feature
+            except Exception as e:
+                logger.error(f"[CLIP] 特征提取失败: {e}")
+        return results
+    
+    def extract_face_embeddings(self, images: List[ImageInput],
+                                batch_size: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        """
+        批量提取人脸嵌入向量（每张图取置信度最高的人脸）
         
-        try:
-            from PIL import Image
-            import torch
-            
-            image = Image.open(image_path).convert('RGB')
-            inputs = self.clip_processor(images=image, return_tensors="pt")
-            
-            if torch.cuda.is_available() and self.device == 'cuda':
-                inputs = {k: v.to('cuda') for k, v in inputs.items()}
+        Args:
+            images: 图像路径 / PIL 图像 / BGR numpy 数组列表
+            batch_size: 每批图像数，默认取配置 batch_size（16）
             
-            with torch.no_grad():
-                image_features = self.clip_model.get_image_features(**inputs)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        Returns:
+            与输入一一对应的512维人脸嵌入向量列表，未检测到人脸或失败项为 None
+        """
+        results = self._through_store('face:vggface2', images,
+                                      lambda todo: self._compute_face(todo, batch_size))
+        return [None if r is _NO_FACE else r for r in results]
+    
+    def _compute_face(self, images: List[ImageInput], batch_size: Optional[int]) -> List[Any]:
+        results: List[Optional[np.ndarray]] = [None] * len(images)
+        face_encoder, mtcnn = self.face_encoder, self.face_detector
+        if not face_encoder or not mtcnn:
+            return results
+        
+        import torch
+        
+        for start, chunk in self._batches(images, batch_size):
+            indices, pil_images = self._load_batch(chunk, 'FaceEncoder')
+            if not pil_images:
+                continue
+            try:
+                # MTCNN 只能对同尺寸图像做批量检测，尺寸不一致时逐张检测
+                if len({img.size for img in pil_images}) == 1:
+                    faces = mtcnn(pil_images)
+                else:
+                    faces = [mtcnn(img) for img in pil_images]
+                
+                detected = [(i, face) for i, face in zip(indices, faces) if face is not None]
+                for i, face in zip(indices, faces):
+                    if face is None:
+                        results[start + i] = _NO_FACE
+                        logger.warning(f"[FaceEncoder] 未检测到人脸: 第 {start + i + 1} 张")
+                if not detected:
+                    continue
+                
+                face_batch = torch.stack([face for _, face in detected])
+                if _use_cuda(self.device):
+                    face_batch = face_batch.to('cuda')
+                
+                with torch.no_grad():
+                    embeddings = face_encoder(face_batch).cpu().numpy()
+                
+                for (i, _), embedding in zip(detected, embeddings):
+                    results[start + i] = embedding
+            except Exception as e:
+                logger.error(f"[FaceEncoder] 人脸特征提取失败: {e}")
+        return results
+    
+    def extract_vgg_features_batch(self, images: List[ImageInput], layers: List[int] = None,
+                                   batch_size: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        """
+        批量提取VGG感知特征
+        
+        Args:
+            images: 图像路径 / PIL 图像 / BGR numpy 数组列表
+            layers: 要提取的层索引列表
+            batch_size: 每批图像数，默认取配置 batch_size（16）
             
-            return image_features.cpu().numpy().flatten()
+        Returns:
+            与输入一一对应的VGG特征向量列表，失败项为 None
+        """
+        if layers is None:
+            layers = [4, 9, 18, 27, 36]
+        model_id = f"vgg:vgg19:{','.join(str(layer) for layer in layers)}"
+        return self._through_store(model_id, images,
+                                   lambda todo: self._compute_vgg(todo, layers, batch_size))
+    
+    def _compute_vgg(self, images: List[ImageInput], layers: List[int],
+                     batch_size: Optional[int]) -> List[Optional[np.ndarray]]:
+        results: List[Optional[np.ndarray]] = [None] * len(images)
+        vgg_model = self.vgg_model
+        if not vgg_model:
+            return results
+        
+        import torch
+        from torchvision import transforms
+        
+        transform = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
+                               std=[0.229, 0.224, 0.225])
+        ])
+        
+        for start, chunk in self._batches(images, batch_size):
+            indices, pil_images = self._load_batch(chunk, 'VGG')
+            if not pil_images:
+                continue
+            try:
+                image_tensor = torch.stack([transform(img) for img in pil_images])
+                if _use_cuda(self.device):
+                    image_tensor = image_tensor.to('cuda')
+                
+                features = []
+                with torch.no_grad():
+                    for i, layer in enumerate(vgg_model):
+                        image_tensor = layer(image_tensor)
+                        if i in layers:
+                            features.append(image_tensor.flatten(start_dim=1))
+                
+                combined_features = torch.cat(features, dim=1).cpu().numpy()
+                for i, feature in zip(indices, combined_features):
+                    results[start + i] = feature
+            except Exception as e:
+                logger.error(f"[VGG] 特征提取失败: {e}")
+        return results
+    
+    def extract_all_features_batch(self, images: List[ImageInput],
+                                   batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        批量提取所有深度学习特征（每个骨干网络每批一次前向）
+        
+        Returns:
+            与输入一一对应的特征字典列表
+        """
+        clip = self.extract_clip_embeddings(images, batch_size)
+        face = self.extract_face_embeddings(images, batch_size)
+        vgg = self.extract_vgg_features_batch(images, batch_size=batch_size)
+        return [
+            {'clip_embedding': c, 'face_embedding': f, 'vgg_features': v}
+            for c, f, v in zip(clip, face, vgg)
+        ]
+    
+    # ---- 单张提取（兼容原接口） ----
+    
+    def extract_clip_embedding(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        提取CLIP图像嵌入向量
+        
+        Args:
+            image_path: 图像路径
             
-        except Exception as e:
-            logger.error(f"[CLIP] 特征提取失败: {e}")
-            return None
+        Returns:
+            512维的CLIP嵌入向量
+        """
+        return self.extract_clip_embeddings([image_path])[0]
     
     def extract_face_embedding(self, image_path: str) -> Optional[np.ndarray]:
         """
@@ -135,34 +584,7 @@ class DeepFeatureExtractor:
         Returns:
             512维的人脸嵌入向量
         """
-        if not self.face_encoder:
-            return None
-        
-        try:
-            import torch
-            from PIL import Image
-            from facenet_pytorch import MTCNN
-            
-            mtcnn = MTCNN(device=self.device)
-            image = Image.open(image_path).convert('RGB')
-            
-            face = mtcnn(image)
-            if face is None:
-                logger.warning(f"[FaceEncoder] 未检测到人脸: {image_path}")
-                return None
-            
-            face = face.unsqueeze(0)
-            if torch.cuda.is_available() and self.device == 'cuda':
-                face = face.to('cuda')
-            
-            with torch.no_grad():
-                embedding = self.face_encoder(face)
-            
-            return embedding.cpu().numpy().flatten()
-            
-        except Exception as e:
-            logger.error(f"[FaceEncoder] 人脸特征提取失败: {e}")
-            return None
+        return self.extract_face_embeddings([image_path])[0]
     
     def extract_vgg_features(self, image_path: str, layers: List[int] = None) -> Optional[np.ndarray]:
         """
@@ -175,43 +597,7 @@ class DeepFeatureExtractor:
         Returns:
             VGG特征向量
         """
-        if not self.vgg_model:
-            return None
-        
-        try:
-            import torch
-            from torchvision import transforms
-            from PIL import Image
-            
-            if layers is None:
-                layers = [4, 9, 18, 27, 36]
-            
-            transform = transforms.Compose([
-                transforms.Resize((224, 224)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                                   std=[0.229, 0.224, 0.225])
-            ])
-            
-            image = Image.open(image_path).convert('RGB')
-            image_tensor = transform(image).unsqueeze(0)
-            
-            if torch.cuda.is_available() and self.device == 'cuda':
-                image_tensor = image_tensor.to('cuda')
-            
-            features = []
-            with torch.no_grad():
-                for i, layer in enumerate(self.vgg_model):
-                    image_tensor = layer(image_tensor)
-                    if i in layers:
-                        features.append(image_tensor.flatten())
-            
-            combined_features = torch.cat(features)
-            return combined_features.cpu().numpy()
-            
-        except Exception as e:
-            logger.error(f"[VGG] 特征提取失败: {e}")
-            return None
+        return self.extract_vgg_features_batch([image_path], layers)[0]
     
     def extract_all_features(self, image_path: str) -> Dict[str, Any]:
         """
@@ -223,17 +609,7 @@ class DeepFeatureExtractor:
         Returns:
             包含所有特征的字典
         """
-        features = {
-            'clip_embedding': None,
-            'face_embedding': None,
-            'vgg_features': None
-        }
-        
-        features['clip_embedding'] = self.extract_clip_embedding(image_path)
-        features['face_embedding'] = self.extract_face_embedding(image_path)
-        features['vgg_features'] = self.extract_vgg_features(image_path)
-        
-        return features
+        return self.extract_all_features_batch([image_path])[0]
 
 
 class DeepSimilarityCalculator:
@@ -324,7 +700,7 @@ class DeepSimilarityCalculator:
     
     def calculate_deep_similarity(self, image1_path: str, image2_path: str) -> Dict[str, Any]:
         """
-        计算所有深度学习相似度
+        计算所有深度学习相似度（两张图同批提取，每个骨干网络一次前向）
         
         Args:
             image1_path: 图像1路径
@@ -333,27 +709,55 @@ class DeepSimilarityCalculator:
         Returns:
             包含所有相似度分数的字典
         """
+        feats1, feats2 = self.feature_extractor.extract_all_features_batch([image1_path, image2_path])
+        return self._similarity_from_features(feats1, feats2)
+    
+    def calculate_sequence_deep_similarity(self, image_paths: List[str],
+                                           batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        计算分镜序列中相邻图像的深度学习相似度
+        
+        每张图只提取一次特征（按批前向），N 张图得到 N-1 组结果，
+        结果格式与 calculate_deep_similarity 相同。
+        
+        Args:
+            image_paths: 按顺序排列的图像路径
+            batch_size: 每批图像数，默认取配置 batch_size
+        """
+        if len(image_paths) < 2:
+            return []
+        features = self.feature_extractor.extract_all_features_batch(image_paths, batch_size)
+        return [
+            self._similarity_from_features(features[i], features[i + 1])
+            for i in range(len(features) - 1)
+        ]
+    
+    def _pair_score(self, vec1: Optional[np.ndarray], vec2: Optional[np.ndarray]) -> Optional[float]:
+        if vec1 is None or vec2 is None:
+            return None
+        return (self.calculate_cosine_similarity(vec1, vec2) + 1) / 2
+    
+    def _similarity_from_features(self, feats1: Dict[str, Any], feats2: Dict[str, Any]) -> Dict[str, Any]:
         results = {
-            'clip_similarity': None,
-            'face_similarity': None,
-            'perceptual_similarity': None,
+            'clip_similarity': self._pair_score(feats1['clip_embedding'], feats2['clip_embedding']),
+            'face_similarity': self._pair_score(feats1['face_embedding'], feats2['face_embedding']),
+            'perceptual_similarity': self._pair_score(feats1['vgg_features'], feats2['vgg_features']),
             'overall_deep_similarity': None
         }
         
-        results['clip_similarity'] = self.calculate_clip_similarity(image1_path, image2_path)
-        results['face_similarity'] = self.calculate_face_similarity(image1_path, image2_path)
-        results['perceptual_similarity'] = self.calculate_perceptual_similarity(image1_path, image2_path)
+        if results['clip_similarity'] is None:
+            logger.warning("[CLIP相似度] 无法提取CLIP特征，返回默认值")
+            results['clip_similarity'] = 0.5
+        if results['perceptual_similarity'] is None:
+            logger.warning("[感知相似度] 无法提取VGG特征，返回默认值")
+            results['perceptual_similarity'] = 0.5
         
-        valid_scores = [s for s in [results['clip_similarity'], 
-                                    results['perceptual_similarity']] if s is not None]
+        valid_scores = [results['clip_similarity'], results['perceptual_similarity']]
         
         if results['face_similarity'] is not None:
             valid_scores.append(results['face_similarity'])
         
-        if valid_scores:
-            results['overall_deep_similarity'] = np.mean(valid_scores)
-        else:
-            results['overall_deep_similarity'] = 0.5
+        results['overall_deep_similarity'] = np.mean(valid_scores)
         
         return results
 
@@ -404,6 +808,15 @@ class OpticalFlowAnalyzer:
         
         return flow
     
+    def calculate_optical_flows(self, frames: List[np.ndarray]) -> np.ndarray:
+        """计算相邻帧光流 (N-1, H, W, 2)；已启用进程池时帧经共享内存交给子进程并行计算"""
+        from .process_pool import get_process_pool
+        
+        pool = get_process_pool()
+        if pool is not None and len(frames) - 1 >= pool.min_tasks:
+            return pool.optical_flows(frames)
+        return np.stack([self.calculate_optical_flow(frames[i], frames[i + 1]) for i in range(len(frames) - 1)])
+    
     def calculate_motion_consistency(self, video1_path: str, video2_path: str) -> Dict[str, Any]:
         """
         计算两个视频之间的运动一致性
@@ -425,19 +838,8 @@ class OpticalFlowAnalyzer:
                 'error': '帧数不足'
             }
         
-        flows1 = []
-        flows2 = []
-        
-        for i in range(len(frames1) - 1):
-            flow = self.calculate_optical_flow(frames1[i], frames1[i+1])
-            flows1.append(flow)
-        
-        for i in range(len(frames2) - 1):
-            flow = self.calculate_optical_flow(frames2[i], frames2[i+1])
-            flows2.append(flow)
-        
-        avg_flow1 = np.mean(flows1, axis=0)
-        avg_flow2 = np.mean(flows2, axis=0)
+        avg_flow1 = np.mean(self.calculate_optical_flows(frames1), axis=0)
+        avg_flow2 = np.mean(self.calculate_optical_flows(frames2), axis=0)
         
         flow_diff = np.abs(avg_flow1 - avg_flow2)
         flow_diff_norm = np.linalg.norm(flow_diff) / (flow_diff.size ** 0.5)
@@ -477,8 +879,8 @@ class EnhancedConsistencyChecker:
     def _init_vlm(self):
         """初始化VLM客户端"""
         try:
-            from ..models.vlm_client import VLMClient
-            self.vlm_client = VLMClient(self.config.get('models', {}))
+            from .components import get_components
+            self.vlm_client = get_components(self.config).vlm_client()
             logger.info("[VLM] 客户端初始化成功")
         except Exception as e:
             logger.warning(f"[VLM] 客户端初始化失败: {e}")
@@ -537,25 +939,22 @@ class EnhancedConsistencyChecker:
     
     def _calculate_traditional_scores(self, image1_path: str, image2_path: str) -> Dict[str, float]:
         """计算传统CV分数"""
-        from .similarity import SimilarityCalculator
+        from .components import get_components
         
-        calc = SimilarityCalculator(self.config)
+        calc = get_components(self.config).similarity_calculator()
+        metrics = calc.compare_images(image1_path, image2_path)
         
         return {
-            'ssim': calc.calculate_structural_similarity(image1_path, image2_path),
-            'color_similarity': calc.calculate_overall_visual_similarity(image1_path, image2_path)
+            'ssim': metrics['ssim'],
+            'color_similarity': metrics['overall_visual_similarity']
         }
     
     def _calculate_vlm_scores(self, image1_path: str, image2_path: str) -> Dict[str, Any]:
         """计算VLM分数"""
-        import asyncio
+        from .executor import run_sync
         
         try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                return {'vlm_consistency': 0.8}
-            
-            result = loop.run_until_complete(
+            result = run_sync(
                 self.vlm_client.analyze_keyframe_consistency(image1_path, image2_path)
             )
             
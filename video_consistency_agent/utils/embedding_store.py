@@ -0,0 +1,271 @@
+"""
+嵌入向量持久化存储
+CLIP / 人脸 / VGG 等嵌入按「图像内容哈希 + 模型标识」缓存到磁盘，重复检测、重复训练时直接读取，不再推理。
+
+每个模型一个分片目录：
+- vectors.bin：定长行的向量矩阵，按 np.memmap 只读映射，追加写入
+- index.bin：紧凑索引，每条 40 字节（32 字节 sha256 + int64 行号，行号 -1 表示「已推理但无结果」，如未检测到人脸）
+- meta.json：模型标识、维度、存储精度
+
+VGG 多层特征维度很大，默认以 float16 存储；其余模型使用 float32。
+追加写入在文件锁内进行，多个进程可以共享同一目录。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# get_many 中未缓存的条目
+MISS = object()
+
+_INDEX_DTYPE = np.dtype([('key', 'u1', (32,)), ('row', '<i8')])
+_NO_ROW = -1
+
+
+def _shard_name(model_id: str) -> str:
+    safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in model_id)
+    return f"{safe[:48]}_{hashlib.sha1(model_id.encode('utf-8')).hexdigest()[:8]}"
+
+
+class _Shard:
+    """单个模型的向量文件与索引"""
+
+    def __init__(self, path: str, model_id: str, dtype: np.dtype):
+        self.path = path
+        self.model_id = model_id
+        self.dtype = dtype
+        self.dim: Optional[int] = None
+        self.index: Dict[bytes, int] = {}
+        self._index_size = 0
+        self._rows = 0
+        self._mmap: Optional[np.memmap] = None
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.isfile(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.dim = int(meta['dim'])
+            self.dtype = np.dtype(meta['dtype'])
+        self.refresh()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, 'vectors.bin')
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, 'index.bin')
+
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def refresh(self) -> None:
+        """读取其他进程新追加的索引条目"""
+        if not os.path.isfile(self.index_path):
+            return
+        size = os.path.getsize(self.index_path)
+        usable = size - size % _INDEX_DTYPE.itemsize
+        if usable <= self._index_size:
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_size)
+            records = np.frombuffer(f.read(usable - self._index_size), dtype=_INDEX_DTYPE)
+        for key, row in zip(records['key'], records['row']):
+            self.index[key.tobytes()] = int(row)
+        self._index_size = usable
+
+    def read(self, row: int) -> np.ndarray:
+        if row >= self._rows:
+            # 行数增长后重新映射
+            rows = os.path.getsize(self.vectors_path) // self._row_bytes()
+            self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(rows, self.dim))
+            self._rows = rows
+        return np.array(self._mmap[row], dtype=np.float32)
+
+    def append(self, items: Sequence[Tuple[bytes, Optional[np.ndarray]]]) -> None:
+        if self.dim is None:
+            first = next((v for _, v in items if v is not None), None)
+            if first is not None:
+                self.dim = int(first.size)
+                with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'model_id': self.model_id, 'dim': self.dim, 'dtype': self.dtype.name}, f)
+        valid = []
+        for key, vector in items:
+            if vector is not None and vector.size != self.dim:
+                logger.warning(f"[嵌入存储] {self.model_id} 维度不符 ({vector.size} != {self.dim})，跳过")
+                continue
+            valid.append((key, vector))
+        if not valid:
+            return
+
+        with open(self.vectors_path, 'ab') as data, open(self.index_path, 'ab') as index:
+            if fcntl is not None:
+                fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                # 先写向量再写索引：中途崩溃只会留下无索引的孤立行
+                end = data.seek(0, os.SEEK_END)
+                row = end // self._row_bytes() if self.dim else 0
+                records = np.zeros(len(valid), dtype=_INDEX_DTYPE)
+                for n, (key, vector) in enumerate(valid):
+                    records[n]['key'] = np.frombuffer(key, dtype=np.uint8)
+                    if vector is None:
+                        records[n]['row'] = _NO_ROW
+                    else:
+                        data.write(np.ascontiguousarray(vector.reshape(-1), dtype=self.dtype).tobytes())
+                        records[n]['row'] = row
+                        row += 1
+                data.flush()
+                index.write(records.tobytes())
+                index.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(index, fcntl.LOCK_UN)
+        self.refresh()
+
+
+class EmbeddingStore:
+    """
+    按图像内容哈希缓存嵌入向量（线程安全）
+
+    - content_hash(): 图像路径 / numpy 数组 / PIL 图像 -> 内容哈希
+    - get_many() / put_many(): 按模型标识批量读写；未缓存的条目返回 MISS
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        self.root = config.get('root') or os.getenv('EMBEDDING_STORE_DIR') or os.path.join(
+            os.path.expanduser('~'), '.cache', 'video_consistency', 'embeddings')
+        # 以 float16 存储的模型（按模型标识中 ':' 前的名称匹配）
+        self.float16_models = set(config.get('float16_models', ['vgg']))
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._shards: Dict[str, _Shard] = {}
+        # (路径, 大小, mtime) -> 内容哈希，避免重复读取同一文件；条目数有上限，按最近使用淘汰
+        self.digest_entries = int(config.get('digest_entries', 4096))
+        self._digests: 'OrderedDict[Tuple[str, int, int], bytes]' = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0}
+
+    # ---- 内容哈希 ----
+
+    def content_hash(self, image: Any) -> Optional[bytes]:
+        """图像内容的 sha256；无法读取时返回 None（调用方按未缓存处理）"""
+        try:
+            if isinstance(image, str):
+                return self._file_digest(image)
+            h = hashlib.sha256()
+            if isinstance(image, np.ndarray):
+                h.update(f'{image.shape}{image.dtype}'.encode('utf-8'))
+                h.update(np.ascontiguousarray(image).tobytes())
+            else:
+                # PIL 图像
+                h.update(f'{image.size}{image.mode}'.encode('utf-8'))
+                h.update(image.tobytes())
+            return h.digest()
+        except Exception as e:
+            logger.debug(f"[嵌入存储] 计算内容哈希失败: {e}")
+            return None
+
+    def _file_digest(self, path: str) -> bytes:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        sig = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._digests.get(sig)
+            if cached:
+                self._digests.move_to_end(sig)
+        if cached:
+            return cached
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.digest()
+        with self._lock:
+            self._digests[sig] = digest
+            while len(self._digests) > self.digest_entries:
+                self._digests.popitem(last=False)
+        return digest
+
+    # ---- 读写 ----
+
+    def _shard(self, model_id: str) -> _Shard:
+        shard = self._shards.get(model_id)
+        if shard is None:
+            dtype = np.float16 if model_id.split(':', 1)[0] in self.float16_models else np.float32
+            shard = _Shard(os.path.join(self.root, _shard_name(model_id)), model_id, np.dtype(dtype))
+            self._shards[model_id] = shard
+        return shard
+
+    def get_many(self, model_id: str, digests: Sequence[Optional[bytes]]) -> List[Any]:
+        """
+        批量读取
+
+        Returns:
+            与 digests 一一对应：向量（float32）、None（已推理但无结果）或 MISS（未缓存）
+        """
+        results: List[Any] = [MISS] * len(digests)
+        with self._lock:
+            shard = self._shard(model_id)
+            if any(d is not None and d not in shard.index for d in digests):
+                shard.refresh()
+            for n, digest in enumerate(digests):
+                row = shard.index.get(digest) if digest is not None else None
+                if row is None:
+                    continue
+                try:
+                    results[n] = None if row == _NO_ROW else shard.read(row)
+                except (OSError, ValueError, IndexError) as e:
+                    logger.warning(f"[嵌入存储] 读取失败 {model_id}: {e}")
+            hits = sum(1 for r in results if r is not MISS)
+            self.stats['hits'] += hits
+            self.stats['misses'] += len(digests) - hits
+        return results
+
+    def put_many(self, model_id: str, items: Iterable[Tuple[Optional[bytes], Optional[np.ndarray]]]) -> None:
+        """批量写入 (内容哈希, 向量)；向量为 None 表示「已推理但无结果」"""
+        with self._lock:
+            shard = self._shard(model_id)
+            pending, seen = [], set()
+            for digest, vector in items:
+                if digest is None or digest in shard.index or digest in seen:
+                    continue
+                seen.add(digest)
+                pending.append((digest, None if vector is None else np.asarray(vector)))
+            if not pending:
+                return
+            try:
+                shard.append(pending)
+                self.stats['writes'] += len(pending)
+            except OSError as e:
+                logger.warning(f"[嵌入存储] 写入失败 {model_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中 / 未命中 / 写入计数，及各模型已缓存条目数"""
+        with self._lock:
+            return dict(self.stats, models={mid: len(s.index) for mid, s in self._shards.items()})
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store(config: Dict[str, Any] = None) -> EmbeddingStore:
+    """获取进程级共享嵌入存储；首次调用时的 config（embedding_store 配置段）决定目录与精度"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EmbeddingStore(config)
+    return _store
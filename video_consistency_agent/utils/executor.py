@@ -0,0 +1,84 @@
+"""
+检查器共用的执行器
+异步检查器中的阻塞调用（OpenCV 指标、文件解码、dashscope 同步 SDK、阿里云 SDK）统一提交到
+进程级共享线程池，事件循环上的各维度检查因此可以真正并发。OpenCV / numpy 的计算大多释放 GIL，
+线程池即可让多个指标同时占用多个核。
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# 标记共享线程池的工作线程与 run_sync 线程：其中运行的事件循环不再向共享线程池提交任务
+_thread_state = threading.local()
+
+
+def _mark_private_thread() -> None:
+    _thread_state.private = True
+
+
+def get_thread_executor(config: Dict[str, Any] = None) -> ThreadPoolExecutor:
+    """
+    获取进程级共享线程池；首次调用时的 config（executor 配置段）决定线程数
+
+    配置项：
+        threads: 线程数，默认 min(32, CPU 核数 + 4)
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = config or {}
+                threads = int(config.get('threads') or min(32, (os.cpu_count() or 1) + 4))
+                _executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='vca-worker',
+                                               initializer=_mark_private_thread)
+    return _executor
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    在共享线程池中执行阻塞函数并等待结果（不阻塞事件循环）；与 asyncio.to_thread 一样传递 contextvars
+
+    事件循环本身运行在共享线程池的线程或 run_sync 线程中时（同步接口内部执行的协程），改用该循环自己的
+    默认执行器：池中线程都在等待这类协程时，再向共享线程池提交会相互等待而死锁。
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    executor = None if getattr(_thread_state, 'private', False) else get_thread_executor()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def run_sync(coro: Awaitable) -> Any:
+    """
+    在同步代码中执行协程
+
+    当前线程没有运行中的事件循环时直接 asyncio.run；已在事件循环中（同步接口被异步代码调用）时，
+    在一个独立线程里新建事件循环执行，避免对运行中的循环调用 run_until_complete。
+    不使用共享线程池：协程内部的 run_blocking 也要占用线程，池被等待中的 run_sync 占满时会死锁。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    
+    outcome: Dict[str, Any] = {}
+    context = contextvars.copy_context()
+    
+    def runner() -> None:
+        _mark_private_thread()
+        try:
+            outcome['result'] = context.run(asyncio.run, coro)
+        except BaseException as e:
+            outcome['error'] = e
+    
+    thread = threading.Thread(target=runner, name='vca-run-sync', daemon=True)
+    thread.start()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
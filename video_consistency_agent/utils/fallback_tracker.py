@@ -0,0 +1,34 @@
+"""
+检查结果降级标记
+VLM / LLM 调用失败时客户端返回的模拟结果、检查器异常时的默认分数都不是真实检查结果：
+客户端与检查器在降级时调用 note_fallback()，AnalysisModule 在 track_fallbacks() 中运行各维度检查，
+据此为该维度结果打上 fallback 标记（检查结果记忆不会持久化这类结果）。
+
+标记经 contextvars 传递，run_blocking 提交到线程池的调用同样可见。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+_fallbacks: ContextVar[Optional[List[str]]] = ContextVar('vca_fallbacks', default=None)
+
+
+def note_fallback(source: str) -> None:
+    """记录一次降级（source 为来源，如 'vlm' / 'llm' / 检查器名）；不在 track_fallbacks() 内时忽略"""
+    recorded = _fallbacks.get()
+    if recorded is not None:
+        recorded.append(source)
+
+
+@contextmanager
+def track_fallbacks() -> Iterator[List[str]]:
+    """收集块内（含其中 await 的协程与 run_blocking 调用）发生的降级来源；嵌套使用时同时计入外层"""
+    outer = _fallbacks.get()
+    recorded: List[str] = []
+    token = _fallbacks.set(recorded)
+    try:
+        yield recorded
+    finally:
+        _fallbacks.reset(token)
+        if outer is not None:
+            outer.extend(recorded)
@@ -0,0 +1,146 @@
+"""
+快速 SSIM / MS-SSIM
+在可配置的工作分辨率上用可分离滤波（均值窗口或高斯）计算局部统计量，只求平均 SSIM，不构建完整 SSIM 图。
+
+默认参数（7x7 均值窗口、样本协方差、裁掉边界）与 skimage.metrics.structural_similarity 的默认行为一致；
+gaussian=True 对应 skimage 的 gaussian_weights=True, sigma=1.5, use_sample_covariance=False。
+"""
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Wang et al. 2003 的五个尺度权重
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+
+_K1, _K2 = 0.01, 0.03
+
+
+def to_working_gray(image: np.ndarray, working_size: Optional[int] = None) -> np.ndarray:
+    """BGR / 灰度图转为灰度，长边超过 working_size 时等比缩小（INTER_AREA）"""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if working_size:
+        h, w = image.shape[:2]
+        scale = working_size / max(h, w)
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+    return image
+
+
+def _match_shapes(gray1: np.ndarray, gray2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if gray1.shape != gray2.shape:
+        gray2 = cv2.resize(gray2, (gray1.shape[1], gray1.shape[0]), interpolation=cv2.INTER_AREA)
+    return gray1, gray2
+
+
+def _ssim_components(x: np.ndarray, y: np.ndarray, data_range: float, win_size: int,
+                     gaussian: bool) -> Tuple[float, float]:
+    """返回 (平均 SSIM, 平均对比度-结构项 cs)"""
+    if gaussian:
+        # 与 skimage 一致：sigma=1.5，截断 3.5 sigma -> 11x11
+        win_size = 11
+        blur = lambda img: cv2.GaussianBlur(img, (win_size, win_size), 1.5, borderType=cv2.BORDER_REFLECT)
+        cov_norm = 1.0
+    else:
+        blur = lambda img: cv2.blur(img, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+        n = win_size * win_size
+        cov_norm = n / (n - 1)
+
+    mu_x = blur(x)
+    mu_y = blur(y)
+    xx = blur(x * x)
+    yy = blur(y * y)
+    xy = blur(x * y)
+
+    vx = cov_norm * (xx - mu_x * mu_x)
+    vy = cov_norm * (yy - mu_y * mu_y)
+    vxy = cov_norm * (xy - mu_x * mu_y)
+
+    c1 = (_K1 * data_range) ** 2
+    c2 = (_K2 * data_range) ** 2
+    cs_map = (2 * vxy + c2) / (vx + vy + c2)
+    luminance = (2 * mu_x * mu_y + c1) / (mu_x * mu_x + mu_y * mu_y + c1)
+
+    # 与 skimage 相同，裁掉受边界填充影响的区域后求均值
+    pad = (win_size - 1) // 2
+    if x.shape[0] > 2 * pad and x.shape[1] > 2 * pad:
+        crop = (slice(pad, -pad or None), slice(pad, -pad or None))
+        cs_map, luminance = cs_map[crop], luminance[crop]
+    return float(np.mean(luminance * cs_map, dtype=np.float64)), float(np.mean(cs_map, dtype=np.float64))
+
+
+def ssim(image1: np.ndarray, image2: np.ndarray, working_size: Optional[int] = None,
+         win_size: int = 7, gaussian: bool = False, data_range: float = 255.0) -> float:
+    """
+    平均 SSIM
+
+    Args:
+        image1, image2: BGR 或灰度图（uint8），尺寸不同时 image2 缩放到 image1
+        working_size: 工作分辨率（长边像素），None 表示原尺寸
+        win_size: 均值窗口边长（gaussian=False 时有效）
+        gaussian: 使用 11x11 高斯窗口（sigma=1.5）
+        data_range: 像素取值范围
+    """
+    gray1, gray2 = _match_shapes(to_working_gray(image1, working_size), to_working_gray(image2, working_size))
+    win = min(win_size, *gray1.shape[:2])
+    win -= 1 - win % 2  # 窗口边长须为奇数
+    if win < 3:
+        return 1.0 if np.array_equal(gray1, gray2) else 0.0
+    return _ssim_components(gray1.astype(np.float32), gray2.astype(np.float32), data_range, win, gaussian)[0]
+
+
+def ms_ssim(image1: np.ndarray, image2: np.ndarray, working_size: Optional[int] = None,
+            scales: int = 5, gaussian: bool = True, data_range: float = 255.0) -> float:
+    """
+    多尺度 SSIM（Wang et al. 2003）：前几个尺度取对比度-结构项，最粗尺度取完整 SSIM，按权重几何加权
+
+    图像较小时自动减少尺度数（最粗尺度短边不小于 11 像素）并重新归一化权重。
+    """
+    gray1, gray2 = _match_shapes(to_working_gray(image1, working_size), to_working_gray(image2, working_size))
+    x = gray1.astype(np.float32)
+    y = gray2.astype(np.float32)
+
+    scales = max(1, min(scales, len(MS_SSIM_WEIGHTS)))
+    while scales > 1 and min(x.shape[:2]) / 2 ** (scales - 1) < 11:
+        scales -= 1
+    weights = np.array(MS_SSIM_WEIGHTS[:scales])
+    weights = weights / weights.sum()
+
+    values = []
+    for level in range(scales):
+        ssim_value, cs_value = _ssim_components(x, y, data_range, 7, gaussian)
+        values.append(ssim_value if level == scales - 1 else cs_value)
+        if level < scales - 1:
+            x = cv2.resize(x, (x.shape[1] // 2, x.shape[0] // 2), interpolation=cv2.INTER_AREA)
+            y = cv2.resize(y, (y.shape[1] // 2, y.shape[0] // 2), interpolation=cv2.INTER_AREA)
+
+    # 负的对比度-结构项截断为 0，避免分数次幂出现 NaN
+    values = np.maximum(np.array(values), 0.0)
+    return float(np.prod(values ** weights))
+
+
+def structural_similarity(image1: np.ndarray, image2: np.ndarray, method: str = 'ssim',
+                          working_size: Optional[int] = 512, gaussian: bool = False) -> float:
+    """
+    按配置计算 SSIM（method='ssim'）或 MS-SSIM（method='ms-ssim'）
+
+    Args:
+        working_size: 工作分辨率（长边像素），None 表示原尺寸
+    """
+    if method == 'ms-ssim':
+        return ms_ssim(image1, image2, working_size)
+    if method != 'ssim':
+        raise ValueError(f"未知 SSIM 方法: {method}")
+    return ssim(image1, image2, working_size, gaussian=gaussian)
+
+
+def structural_similarity_from_files(image1_path: str, image2_path: str, method: str = 'ssim',
+                                     working_size: Optional[int] = 512) -> Optional[float]:
+    """从文件读取灰度图后计算；任一图像无法读取时返回 None"""
+    img1 = cv2.imread(image1_path, cv2.IMREAD_GRAYSCALE)
+    img2 = cv2.imread(image2_path, cv2.IMREAD_GRAYSCALE)
+    if img1 is None or img2 is None:
+        return None
+    return structural_similarity(img1, img2, method, working_size)
@@ -0,0 +1,322 @@
+"""
+单次解码的图像对比引擎
+一对图像原先在 calculate_clip_similarity（本地回退）、calculate_structural_similarity、
+calculate_overall_visual_similarity 和 FeatureExtractor.extract_keyframe_features 中各读取一次，
+同一对图像要解码 6 次以上。这里每张图只解码一次，缩小为工作集（灰度图、三通道直方图、边缘图）并缓存，
+一次计算返回全部指标。启用进程池时，未缓存图像的解码与工作集构建在子进程中并行完成。
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from .fast_ssim import ms_ssim, ssim
+from .process_pool import get_process_pool
+
+
+class ImageWorkingSet:
+    """一张图像的解码结果（缩小后的灰度图、归一化 BGR 直方图、边缘图、缩略图向量）"""
+
+    __slots__ = ('path', 'shape', 'gray', 'histograms', 'edges', 'thumbnail')
+
+    def __init__(self, path: str, image: np.ndarray, working_size: int, edge_size: int = 256):
+        self.path = path
+        self.shape = image.shape
+        h, w = image.shape[:2]
+        scale = min(1.0, working_size / max(h, w))
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+        self.gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.histograms = tuple(
+            cv2.normalize(cv2.calcHist([image], [channel], None, [256], [0, 256]), None).flatten()
+            for channel in range(3)
+        )
+        self.edges = cv2.Canny(cv2.resize(self.gray, (edge_size, edge_size)), 100, 200)
+        # 16x16 彩色缩略图（去均值、单位长度），未提供 CLIP 嵌入时作为相似度矩阵的轻量嵌入
+        thumb = cv2.resize(image, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+        thumb -= thumb.mean()
+        norm = np.linalg.norm(thumb)
+        self.thumbnail = thumb / norm if norm > 0 else thumb
+
+
+def _histogram_similarity(hist1: np.ndarray, hist2: np.ndarray) -> float:
+    # 相关性范围是[-1, 1]，转换为[0, 1]
+    return float((cv2.compareHist(hist1, hist2, cv2.HISTCMP_CORREL) + 1) / 2)
+
+
+class ImageComparisonEngine:
+    """
+    图像对比引擎（线程安全）
+
+    工作集按 (路径, 大小, mtime) 做 LRU 缓存，文件被覆盖后自动重新解码。
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        # 工作集长边像素；SSIM 在该尺寸上计算
+        self.working_size = int(config.get('working_size', 512))
+        # ssim（7x7 均值窗口，与 skimage 默认一致）或 ms-ssim
+        self.ssim_method = config.get('ssim_method', 'ssim')
+        self.cache_size = int(config.get('cache_size', 128))
+        self._cache: 'OrderedDict[Tuple[str, int, int], ImageWorkingSet]' = OrderedDict()
+        # 同一对图像的指标（检查器常对同一对图像先后取 SSIM、整体相似度）
+        self._pairs: 'OrderedDict[Tuple, Dict[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'decodes': 0, 'hits': 0, 'pair_hits': 0}
+
+    @staticmethod
+    def _key(image_path: str) -> Tuple[str, int, int]:
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"图像文件不存在: {image_path}")
+        st = os.stat(image_path)
+        return os.path.abspath(image_path), st.st_size, st.st_mtime_ns
+
+    def load(self, image_path: str) -> ImageWorkingSet:
+        """读取（或从缓存取出）一张图像的工作集"""
+        return self.load_many([image_path])[image_path]
+
+    def load_many(self, image_paths: Sequence[str]) -> Dict[str, ImageWorkingSet]:
+        """
+        读取（或从缓存取出）一组图像的工作集，返回 路径 -> 工作集
+
+        未缓存的图像达到进程池的 min_decodes 时，解码与工作集构建在子进程中并行执行，否则在当前线程逐张解码。
+        """
+        keys = {path: self._key(path) for path in dict.fromkeys(image_paths)}
+        working: Dict[str, ImageWorkingSet] = {}
+        with self._lock:
+            for path, key in keys.items():
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.stats['hits'] += 1
+                    working[path] = cached
+        missing = [path for path in keys if path not in working]
+        if not missing:
+            return working
+
+        pool = get_process_pool()
+        if pool is not None and len(missing) >= pool.min_decodes:
+            built = pool.working_sets(missing, self.working_size)
+        else:
+            built = [self._decode(path) for path in missing]
+        for path, item in zip(missing, built):
+            if item is None:
+                raise ValueError(f"无法读取图像: {path}")
+            working[path] = item
+
+        with self._lock:
+            self.stats['decodes'] += len(missing)
+            for path in missing:
+                self._cache[keys[path]] = working[path]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return working
+
+    def _decode(self, image_path: str) -> Optional[ImageWorkingSet]:
+        image = cv2.imread(image_path)
+        return None if image is None else ImageWorkingSet(image_path, image, self.working_size)
+
+    def compare(self, image1_path: str, image2_path: str) -> Dict[str, float]:
+        """
+        一次计算一对图像的全部传统视觉指标
+
+        Returns:
+            ssim: 灰度结构相似度
+            histogram_similarity: 蓝色通道直方图相关性（原本地 CLIP 回退使用）
+            color_similarity: 三通道直方图相关性均值
+            edge_similarity: Canny 边缘 IoU
+            overall_visual_similarity: color * 0.6 + ssim * 0.4
+            local_clip_similarity: ssim * 0.7 + histogram * 0.3
+        """
+        pair_key = (self._key(image1_path), self._key(image2_path))
+        with self._lock:
+            cached = self._pairs.get(pair_key)
+            if cached is not None:
+                self._pairs.move_to_end(pair_key)
+                self.stats['pair_hits'] += 1
+                return dict(cached)
+
+        working = self.load_many([image1_path, image2_path])
+        first, second = working[image1_path], working[image2_path]
+        metrics = self._pair_metrics(first, second, self.structural_similarity(first, second))
+        self._remember(pair_key, metrics)
+        return dict(metrics)
+    
+    def compare_many(self, pairs: Sequence[Tuple[str, str]]) -> List[Dict[str, float]]:
+        """
+        批量对比多对图像（如整个项目的相邻转场），返回与 compare 相同的指标字典列表
+
+        每张图只解码一次；已启用进程池时，未缓存图像的解码与工作集构建、以及足够多的图像对的 SSIM
+        （经共享内存）都在子进程中并行计算。
+        """
+        keys = [(self._key(a), self._key(b)) for a, b in pairs]
+        results: List[Optional[Dict[str, float]]] = [None] * len(pairs)
+        with self._lock:
+            for n, key in enumerate(keys):
+                cached = self._pairs.get(key)
+                if cached is not None:
+                    self._pairs.move_to_end(key)
+                    self.stats['pair_hits'] += 1
+                    results[n] = dict(cached)
+        pending = [n for n, r in enumerate(results) if r is None]
+        if not pending:
+            return results
+        
+        paths = list(dict.fromkeys(p for n in pending for p in pairs[n]))
+        working = self.load_many(paths)
+        index = {path: i for i, path in enumerate(paths)}
+        ssim_scores = self._ssim_many(
+            [working[p] for p in paths],
+            [(index[pairs[n][0]], index[pairs[n][1]]) for n in pending]
+        )
+        for n, ssim_score in zip(pending, ssim_scores):
+            metrics = self._pair_metrics(working[pairs[n][0]], working[pairs[n][1]], ssim_score)
+            self._remember(keys[n], metrics)
+            results[n] = dict(metrics)
+        return results
+    
+    def _pair_metrics(self, first: ImageWorkingSet, second: ImageWorkingSet, ssim_score: float) -> Dict[str, float]:
+        channel_sims = [_histogram_similarity(h1, h2) for h1, h2 in zip(first.histograms, second.histograms)]
+        color_sim = sum(channel_sims) / 3
+        
+        union = np.logical_or(first.edges, second.edges).sum()
+        edge_sim = 1.0 if union == 0 else float(np.logical_and(first.edges, second.edges).sum() / union)
+        
+        return {
+            'ssim': ssim_score,
+            'histogram_similarity': channel_sims[0],
+            'color_similarity': color_sim,
+            'edge_similarity': edge_sim,
+            'overall_visual_similarity': color_sim * 0.6 + ssim_score * 0.4,
+            'local_clip_similarity': ssim_score * 0.7 + channel_sims[0] * 0.3
+        }
+    
+    def _remember(self, pair_key: Tuple, metrics: Dict[str, float]) -> None:
+        with self._lock:
+            self._pairs[pair_key] = metrics
+            while len(self._pairs) > self.cache_size:
+                self._pairs.popitem(last=False)
+    
+    def _ssim_many(self, working: Sequence[ImageWorkingSet], pairs: Sequence[Tuple[int, int]]) -> List[float]:
+        # 图像对足够多且进程池已启用时在子进程中并行计算，否则在当前线程逐对计算
+        pool = get_process_pool()
+        if pool is not None and len(pairs) >= pool.min_tasks:
+            return pool.ssim_pairs([w.gray for w in working], pairs, self.ssim_method)
+        return [self.structural_similarity(working[i], working[j]) for i, j in pairs]
+    
+    def similarity_matrices(self, image_paths: Sequence[str], include_ssim: bool = False,
+                            embeddings: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        一次计算一组图像（如整个分镜的关键帧）两两之间的相似度矩阵，每张图只解码一次
+
+        Args:
+            image_paths: 图像路径列表（N 张）
+            include_ssim: 是否计算 SSIM 矩阵（需逐对计算，N 较大时耗时明显；启用进程池时并行计算）
+            embeddings: (N, D) 嵌入向量（如 CLIP）；不提供时使用缩略图向量
+
+        Returns:
+            histogram: 三通道直方图相关性均值，映射到 [0, 1]（与 color_similarity 一致）
+            embedding: 嵌入余弦相似度，映射到 [0, 1]
+            ssim: SSIM 矩阵（include_ssim=False 时为 None）
+            overall_visual: color * 0.6 + ssim * 0.4（无 SSIM 时为 None）
+            均为 (N, N) 数组，对角线为 1
+        """
+        loaded = self.load_many(image_paths)
+        working = [loaded[path] for path in image_paths]
+        n = len(working)
+
+        # 皮尔逊相关：每个直方图去均值、单位化后，相关矩阵即内积矩阵（等价于 HISTCMP_CORREL）
+        hists = np.stack([np.stack(w.histograms) for w in working]).astype(np.float64)  # (N, 3, 256)
+        hists -= hists.mean(axis=2, keepdims=True)
+        norms = np.linalg.norm(hists, axis=2, keepdims=True)
+        hists = np.divide(hists, norms, out=np.zeros_like(hists), where=norms > 0)
+        channel_corr = np.einsum('icb,jcb->cij', hists, hists)  # (3, N, N)
+        histogram = (channel_corr.mean(axis=0) + 1) / 2
+
+        if embeddings is None:
+            vectors = np.stack([w.thumbnail for w in working]).astype(np.float64)
+        else:
+            vectors = np.asarray(embeddings, dtype=np.float64).reshape(n, -1)
+        vec_norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, vec_norms, out=np.zeros_like(vectors), where=vec_norms > 0)
+        embedding = (np.clip(vectors @ vectors.T, -1.0, 1.0) + 1) / 2
+
+        ssim = overall = None
+        if include_ssim:
+            ssim = np.eye(n)
+            pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+            for (i, j), score in zip(pairs, self._ssim_many(working, pairs)):
+                ssim[i, j] = ssim[j, i] = score
+            overall = histogram * 0.6 + ssim * 0.4
+
+        for matrix in (histogram, embedding):
+            np.fill_diagonal(matrix, 1.0)
+        return {
+            'paths': list(image_paths),
+            'histogram': histogram,
+            'embedding': embedding,
+            'ssim': ssim,
+            'overall_visual': overall
+        }
+
+    def structural_similarity(self, first: ImageWorkingSet, second: ImageWorkingSet) -> float:
+        # 工作集已缩小到 working_size，这里不再缩放
+        if self.ssim_method == 'ms-ssim':
+            return ms_ssim(first.gray, second.gray)
+        return ssim(first.gray, second.gray)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, cached=len(self._cache))
+
+
+def adjacent_scores(matrix: np.ndarray) -> List[float]:
+    """相邻图像 (i, i+1) 的相似度（矩阵第一条副对角线）"""
+    return [float(v) for v in np.diagonal(matrix, offset=1)]
+
+
+def mean_off_diagonal(matrix: np.ndarray, axis: Optional[int] = None):
+    """去掉对角线后的均值；axis=1 时返回每张图与其余图像的平均相似度"""
+    n = matrix.shape[0]
+    if n < 2:
+        return 1.0 if axis is None else np.ones(n)
+    mask = ~np.eye(n, dtype=bool)
+    if axis is None:
+        return float(matrix[mask].mean())
+    return np.where(mask, matrix, 0.0).sum(axis=axis) / (n - 1)
+
+
+def group_mean_matrix(matrix: np.ndarray, groups: Sequence[Sequence[int]]) -> np.ndarray:
+    """
+    按分组（如每个场景的关键帧下标）求块均值，得到 (G, G) 的组间相似度矩阵，对角线为 1
+
+    空分组对应的行列为 NaN
+    """
+    membership = np.zeros((len(groups), matrix.shape[0]))
+    for g, members in enumerate(groups):
+        if members:
+            membership[g, list(members)] = 1.0 / len(members)
+    grouped = membership @ matrix @ membership.T
+    empty = [g for g, members in enumerate(groups) if not members]
+    grouped[empty, :] = np.nan
+    grouped[:, empty] = np.nan
+    np.fill_diagonal(grouped, 1.0)
+    return grouped
+
+
+_engine: Optional[ImageComparisonEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_comparison_engine(config: Dict[str, Any] = None) -> ImageComparisonEngine:
+    """获取进程级共享对比引擎，各检查器的 SimilarityCalculator 共用同一工作集缓存"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ImageComparisonEngine(config)
+    return _engine
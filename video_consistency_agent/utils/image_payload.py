@@ -0,0 +1,102 @@
+"""
+VLM 图像载荷缓存
+关键帧送入多模态模型前统一缩放（长边不超过 max_side）并重新编码为 JPEG，得到 base64 data URL；
+同一张图只缩放编码一次，按 (路径, 大小, mtime) 缓存在内存中，多次检查、多个请求共用，
+上传字节数随之大幅下降。
+"""
+import base64
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePayloadCache:
+    """
+    图像载荷缓存（线程安全）
+
+    配置项：
+        max_side: 编码前长边上限（像素，默认 768；不放大）
+        jpeg_quality: JPEG 质量（默认 85）
+        cache_mb: 缓存的 base64 载荷总量上限（默认 64MB），超出后按最近使用淘汰
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        self.max_side = int(config.get('max_side', 768))
+        self.jpeg_quality = int(config.get('jpeg_quality', 85))
+        self.max_bytes = int(float(config.get('cache_mb', 64)) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._payloads: 'OrderedDict[Tuple[str, int, int], str]' = OrderedDict()
+        self._bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'original_bytes': 0, 'encoded_bytes': 0}
+
+    def data_url(self, image_path: str) -> Optional[str]:
+        """返回缩放、重新编码后的 data:image/jpeg;base64 URL；无法读取时返回 None"""
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+        key = (os.path.abspath(image_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._payloads.get(key)
+            if cached is not None:
+                self._payloads.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached
+
+        payload = self._encode(image_path)
+        if payload is None:
+            return None
+        with self._lock:
+            self.stats['misses'] += 1
+            self.stats['original_bytes'] += st.st_size
+            self.stats['encoded_bytes'] += len(payload)
+            if key not in self._payloads:
+                self._payloads[key] = payload
+                self._bytes += len(payload)
+                while self._bytes > self.max_bytes and len(self._payloads) > 1:
+                    _, evicted = self._payloads.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.stats['evictions'] += 1
+        return payload
+
+    def _encode(self, image_path: str) -> Optional[str]:
+        image = cv2.imread(image_path)
+        if image is None:
+            logger.warning(f"[图像载荷] 无法读取图像: {image_path}")
+            return None
+        h, w = image.shape[:2]
+        scale = self.max_side / max(h, w)
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return None
+        return 'data:image/jpeg;base64,' + base64.b64encode(buffer.tobytes()).decode('ascii')
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            original = self.stats['original_bytes']
+            return dict(self.stats, entries=len(self._payloads), cached_bytes=self._bytes,
+                        compression_ratio=self.stats['encoded_bytes'] / original if original else 0.0)
+
+
+_cache: Optional[ImagePayloadCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_image_payloads(config: Dict[str, Any] = None) -> ImagePayloadCache:
+    """获取进程级共享图像载荷缓存；首次调用时的 config（vlm_payload 配置段）决定尺寸、质量与容量"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ImagePayloadCache(config)
+    return _cache
@@ -1,24 +1,251 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import os
+import json
+import time
 import hashlib
+import shutil
+import threading
+from collections import OrderedDict
 from .video_utils import VideoUtils
 
+# 内容指纹采样：文件头、中、尾各取一块，配合文件大小，避免为大视频计算全文件哈希
+_FINGERPRINT_CHUNK = 256 * 1024
+
+
+def video_fingerprint(video_path: str) -> str:
+    """视频内容指纹（文件大小 + 头/中/尾采样块的 SHA-1），同路径重新生成的视频会得到不同指纹"""
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(video_path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - _FINGERPRINT_CHUNK // 2), max(0, size - _FINGERPRINT_CHUNK)}):
+            f.seek(offset)
+            digest.update(f.read(_FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
 
 class KeyframeManager:
-    """统一的关键帧管理模块，负责关键帧的提取、缓存、复用和传递"""
+    """统一的关键帧管理模块，负责关键帧的提取、缓存、复用和传递
+
+    关键帧缓存按 (视频内容指纹, 关键帧数量) 寻址，LRU + TTL 淘汰；配置 keyframe_cache_dir 时
+    额外写入磁盘层：关键帧文件硬链接（跨文件系统时复制）到缓存目录，不依赖随进程退出删除的临时目录，
+    进程重启后仍可复用（关键帧文件缺失的条目视为未命中）。
+    """
     
     def __init__(self, config: Dict[str, Any]):
 # 初始化关键帧管理模块
         self.config = config
         self.video_utils = VideoUtils()
-        self.keyframe_cache = {}  # 关键帧缓存，键为视频路径+参数的哈希值
+        self.keyframe_cache: 'OrderedDict[str, Tuple[float, List[str]]]' = OrderedDict()  # 缓存键 -> (写入时间, 关键帧)
         self.default_num_keyframes = config.get('num_keyframes', 2)
         self.cache_expiry_time = config.get('cache_expiry_time', 3600)  # 缓存过期时间，单位秒
+        self.cache_max_entries = int(config.get('keyframe_cache_size', 256))
+        self.cache_dir = config.get('keyframe_cache_dir')
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._purge_expired_disk_entries()
+        # (绝对路径, 大小, mtime) -> 内容指纹，避免每次查询都读取视频文件
+        self._fingerprints: 'OrderedDict[Tuple[str, int, int], str]' = OrderedDict()
+        # 绝对路径 -> (内容指纹, 缓存键集合)，用于按视频清除以及视频被覆盖时清理旧条目
+        self._videos: Dict[str, Tuple[str, set]] = {}
+        self._video_of_key: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+    
+    def _fingerprint(self, video_path: str) -> Optional[str]:
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            return None
+        path = os.path.abspath(video_path)
+        stat_key = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            fingerprint = self._fingerprints.get(stat_key)
+            if fingerprint is not None:
+                self._fingerprints.move_to_end(stat_key)
+                return fingerprint
+        try:
+            fingerprint = video_fingerprint(video_path)
+        except OSError:
+            return None
+        with self._lock:
+            # 同一路径的旧指纹（视频已被覆盖）不再有效
+            for key in [k for k in self._fingerprints if k[0] == path]:
+                del self._fingerprints[key]
+            self._fingerprints[stat_key] = fingerprint
+            while len(self._fingerprints) > self.cache_max_entries:
+                self._fingerprints.popitem(last=False)
+        return fingerprint
+    
+    def get_cache_key(self, video_path: str, num_keyframes: int = 2) -> Optional[str]:
+# 生成缓存键（内容指纹 + 参数）；视频不存在时返回 None
+        fingerprint = self._fingerprint(video_path)
+        if fingerprint is None:
+            return None
+        return hashlib.md5(f"{fingerprint}_{num_keyframes}".encode()).hexdigest()
+    
+    def _disk_dir(self, video_path: str) -> Optional[str]:
+        # 磁盘层按视频路径分目录，clear_cache_for_video 可以删除其他进程写入的条目
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, hashlib.md5(os.path.abspath(video_path).encode()).hexdigest())
+    
+    def _disk_path(self, cache_key: str, video_path: str) -> Optional[str]:
+        disk_dir = self._disk_dir(video_path)
+        return os.path.join(disk_dir, f'{cache_key}.json') if disk_dir else None
+    
+    def _persist_frames(self, cache_key: str, video_path: str, keyframes: List[str]) -> List[str]:
+        # 关键帧在临时空间中，进程退出即被删除：磁盘层保存自己的一份（<视频目录>/<缓存键>/）
+        frames_dir = os.path.join(self._disk_dir(video_path), cache_key)
+        tmp_dir = f'{frames_dir}.{os.getpid()}.tmp'
+        persisted = [os.path.join(frames_dir, f'{i:03d}_{os.path.basename(p)}') for i, p in enumerate(keyframes)]
+        if all(os.path.exists(p) for p in persisted):
+            return persisted
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            for src, dst in zip(keyframes, persisted):
+                target = os.path.join(tmp_dir, os.path.basename(dst))
+                try:
+                    os.link(src, target)
+                except OSError:
+                    shutil.copy2(src, target)
+            shutil.rmtree(frames_dir, ignore_errors=True)
+            os.rename(tmp_dir, frames_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return persisted
+    
+    def _purge_expired_disk_entries(self) -> None:
+        # 磁盘层只在查询时校验，启动时顺带清理早已过期的条目与关键帧文件，避免目录无限增长
+        if not self.cache_expiry_time:
+            return
+        cutoff = time.time() - self.cache_expiry_time
+        for root, _, names in os.walk(self.cache_dir, topdown=False):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+            if root != self.cache_dir and not os.listdir(root):
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
     
-    def get_cache_key(self, video_path: str, num_keyframes: int = 2) -> str:
-# 生成缓存键
-        cache_data = f"{video_path}_{num_keyframes}"
-        return hashlib.md5(cache_data.encode()).hexdigest()
+    def _is_fresh(self, created_at: float, keyframes: List[str]) -> bool:
+        # 关键帧所在临时目录可能已被配额淘汰，需确认文件仍在
+        if self.cache_expiry_time and time.time() - created_at > self.cache_expiry_time:
+            return False
+        return bool(keyframes) and all(os.path.exists(p) for p in keyframes)
+    
+    def _lookup(self, cache_key: str, video_path: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self.keyframe_cache.get(cache_key)
+            if entry is not None:
+                if self._is_fresh(*entry):
+                    self.keyframe_cache.move_to_end(cache_key)
+                    self.stats['hits'] += 1
+                    return entry[1]
+                self._drop(cache_key, remove_disk=False)
+                self.stats['expirations'] += 1
+        
+        disk_path = self._disk_path(cache_key, video_path)
+        if disk_path and os.path.exists(disk_path):
+            try:
+                with open(disk_path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+                if self._is_fresh(record['created_at'], record['keyframes']):
+                    with self._lock:
+                        self.stats['disk_hits'] += 1
+                        self._insert(cache_key, record['video_path'], record['fingerprint'],
+                                     record['keyframes'], record['created_at'])
+                    return record['keyframes']
+                os.remove(disk_path)
+                shutil.rmtree(os.path.join(os.path.dirname(disk_path), cache_key), ignore_errors=True)
+                with self._lock:
+                    self.stats['expirations'] += 1
+            except (OSError, ValueError, KeyError):
+                pass
+        
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+    
+    def _insert(self, cache_key: str, video_path: str, fingerprint: str, keyframes: List[str], created_at: float) -> None:
+        path = os.path.abspath(video_path)
+        known = self._videos.get(path)
+        if known is not None and known[0] != fingerprint:
+            # 视频在同一路径被重新生成：旧内容对应的条目全部作废
+            for stale in list(known[1]):
+                self._drop(stale)
+                self.stats['invalidations'] += 1
+            known = None
+        if known is None:
+            known = self._videos[path] = (fingerprint, set())
+        known[1].add(cache_key)
+        self._video_of_key[cache_key] = path
+        previous = self.keyframe_cache.get(cache_key)
+        if previous is not None:
+            self._pin(previous[1], pin=False)
+        self._pin(keyframes)
+        self.keyframe_cache[cache_key] = (created_at, list(keyframes))
+        self.keyframe_cache.move_to_end(cache_key)
+        while len(self.keyframe_cache) > self.cache_max_entries:
+            evicted = next(iter(self.keyframe_cache))
+            self._drop(evicted, remove_disk=False)
+            self.stats['evictions'] += 1
+    
+    def _store(self, cache_key: str, video_path: str, keyframes: List[str]) -> None:
+        fingerprint = self._fingerprint(video_path)
+        if fingerprint is None:
+            return
+        created_at = time.time()
+        with self._lock:
+            self._insert(cache_key, video_path, fingerprint, keyframes, created_at)
+        
+        disk_path = self._disk_path(cache_key, video_path)
+        if disk_path:
+            tmp_path = f'{disk_path}.{os.getpid()}.tmp'
+            try:
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                persisted = self._persist_frames(cache_key, video_path, keyframes)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'video_path': os.path.abspath(video_path), 'fingerprint': fingerprint,
+                               'created_at': created_at, 'keyframes': persisted}, f, ensure_ascii=False)
+                os.replace(tmp_path, disk_path)
+            except OSError:
+                pass
+    
+    def _pin(self, keyframes: List[str], pin: bool = True) -> None:
+        # 缓存条目存活期间固定关键帧所在的临时目录，避免配额 LRU 在检查途中删除仍被引用的帧
+        scratch = self.video_utils.scratch
+        for directory in {os.path.dirname(os.path.abspath(p)) for p in keyframes}:
+            if pin:
+                scratch.pin(directory)
+            else:
+                scratch.unpin(directory)
+    
+    def _drop(self, cache_key: str, remove_disk: bool = True) -> None:
+        # LRU 淘汰只释放内存，磁盘层条目保留到过期；显式清除 / 内容失效时一并删除
+        entry = self.keyframe_cache.pop(cache_key, None)
+        if entry is not None:
+            self._pin(entry[1], pin=False)
+        path = self._video_of_key.pop(cache_key, None)
+        if path is not None and path in self._videos:
+            self._videos[path][1].discard(cache_key)
+            if not self._videos[path][1]:
+                del self._videos[path]
+        disk_path = self._disk_path(cache_key, path) if remove_disk and path else None
+        if disk_path:
+            if os.path.exists(disk_path):
+                try:
+                    os.remove(disk_path)
+                except OSError:
+                    pass
+            shutil.rmtree(os.path.join(os.path.dirname(disk_path), cache_key), ignore_errors=True)
     
     def get_keyframes(self, video_path: str, num_keyframes: Optional[int] = None) -> List[str]:
 # 获取视频的关键帧，优先从缓存中获取
@@ -29,18 +256,23 @@ class KeyframeManager:
         if not os.path.exists(video_path):
             return []
         
-        # 生成缓存键
+        # 生成缓存键（视频被覆盖后指纹变化，不会命中旧关键帧）
         cache_key = self.get_cache_key(video_path, num_keyframes)
+        if cache_key is None:
+            return []
         
-        # 检查缓存中是否存在
-        if cache_key in self.keyframe_cache:
-            return self.keyframe_cache[cache_key]
+        cached = self._lookup(cache_key, video_path)
+        if cached:
+            for p in cached:
+                self.video_utils.scratch.touch(p)
+            return cached
         
         # 提取关键帧
         keyframes = self.video_utils.extract_keyframes(video_path, num_keyframes=num_keyframes)
         
         # 缓存关键帧
-        self.keyframe_cache[cache_key] = keyframes
+        if keyframes:
+            self._store(cache_key, video_path, keyframes)
         
         return keyframes
     
@@ -50,7 +282,8 @@ class KeyframeManager:
             num_keyframes = len(keyframes)
         
         cache_key = self.get_cache_key(video_path, num_keyframes)
-        self.keyframe_cache[cache_key] = keyframes
+        if cache_key is not None and keyframes:
+            self._store(cache_key, video_path, keyframes)
     
     def get_scene_keyframes(self, scene: Dict[str, Any], num_keyframes: Optional[int] = None) -> List[str]:
 # 获取场景的关键帧，优先使用场景中已有的关键帧
@@ -124,24 +357,41 @@ class KeyframeManager:
         return scene_info
     
     def clear_cache(self) -> None:
-        """清除关键帧缓存"""
-        self.keyframe_cache.clear()
+        """清除关键帧缓存（包括磁盘层）"""
+        with self._lock:
+            for _, keyframes in self.keyframe_cache.values():
+                self._pin(keyframes, pin=False)
+            self.keyframe_cache.clear()
+            self._videos.clear()
+            self._video_of_key.clear()
+            self._fingerprints.clear()
+        if self.cache_dir:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            os.makedirs(self.cache_dir, exist_ok=True)
     
     def clear_cache_for_video(self, video_path: str) -> None:
-# 清除指定视频的关键帧缓存
-        # 生成所有可能的缓存键并删除
-        for num_keyframes in range(1, 10):  # 考虑1-9个关键帧的情况
-            cache_key = self.get_cache_key(video_path, num_keyframes)
-            if cache_key in self.keyframe_cache:
-                del self.keyframe_cache[cache_key]
+# 清除指定视频的关键帧缓存（按路径索引，不依赖关键帧数量）
+        path = os.path.abspath(video_path)
+        with self._lock:
+            for cache_key in list(self._videos.get(path, ('', set()))[1]):
+                self._drop(cache_key)
+            for key in [k for k in self._fingerprints if k[0] == path]:
+                del self._fingerprints[key]
+        disk_dir = self._disk_dir(video_path)
+        if disk_dir:
+            shutil.rmtree(disk_dir, ignore_errors=True)
     
     def get_cache_stats(self) -> Dict[str, Any]:
 # 获取缓存统计信息
-        return {
-            'cache_size': len(self.keyframe_cache),
-            'default_num_keyframes': self.default_num_keyframes,
-            'cache_expiry_time': self.cache_expiry_time
-        }
+        with self._lock:
+            return dict(
+                self.stats,
+                cache_size=len(self.keyframe_cache),
+                max_entries=self.cache_max_entries,
+                default_num_keyframes=self.default_num_keyframes,
+                cache_expiry_time=self.cache_expiry_time,
+                disk_tier=bool(self.cache_dir)
+            )
     
     def validate_keyframes(self, keyframes: List[str]) -> List[str]:
 # 验证关键帧是否存在，返回有效的关键帧列表
@@ -0,0 +1,359 @@
+"""
+媒体子进程调度器
+所有 ffmpeg / ffprobe 调用统一经由此处排队执行：按任务类别（probe / extract / transcode）
+分别限制并发，按优先级出队（交互预览优先于批量任务），支持取消、单任务超时与排队/运行耗时统计。
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_CLASS_PROBE = 'probe'
+JOB_CLASS_EXTRACT = 'extract'
+JOB_CLASS_TRANSCODE = 'transcode'
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 50
+PRIORITY_BULK = 100
+
+
+def _default_caps() -> Dict[str, int]:
+    cpu = os.cpu_count() or 4
+    return {
+        JOB_CLASS_PROBE: 8,
+        JOB_CLASS_EXTRACT: max(2, cpu // 2),
+        JOB_CLASS_TRANSCODE: max(1, cpu // 4),
+    }
+
+
+class MediaJobCancelled(RuntimeError):
+    """任务在排队或运行中被取消"""
+
+
+class MediaJob:
+    """一次媒体子进程调用的句柄"""
+
+    def __init__(self, scheduler: 'MediaJobScheduler', job_id: int, cmd: List[str], job_class: str,
+                 priority: int, timeout: Optional[float]):
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.cmd = cmd
+        self.job_class = job_class
+        self.priority = priority
+        self.timeout = timeout
+        self.state = 'queued'  # queued / running / done / failed / cancelled / timeout
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.result: Optional[subprocess.CompletedProcess] = None
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self._done = threading.Event()
+
+    @property
+    def queue_wait(self) -> float:
+        end = self.started_at if self.started_at is not None else (self.finished_at or time.monotonic())
+        return end - self.submitted_at
+
+    @property
+    def run_time(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def cancel(self) -> None:
+        """取消任务：排队中直接出队，运行中终止子进程"""
+        self.scheduler.cancel(self)
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """等待任务完成并返回结果；失败、超时或取消时抛出对应异常"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'等待媒体任务 {self.job_id} 超时')
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _ClassQueue:
+    def __init__(self, cap: int):
+        self.cap = max(1, int(cap))
+        self.heap: List[tuple] = []
+        self.running = 0
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'timed_out': 0,
+            'queue_wait_total': 0.0,
+            'queue_wait_max': 0.0,
+            'run_time_total': 0.0,
+            'run_time_max': 0.0,
+        }
+
+
+class MediaJobScheduler:
+    """按类别限流、按优先级调度的媒体子进程执行器（线程安全）"""
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        caps = self._caps_from_config(config)
+        self.default_timeout = config.get('default_timeout', 600)
+        self._queues = {job_class: _ClassQueue(cap) for job_class, cap in caps.items()}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._active: Dict[int, MediaJob] = {}
+
+    @staticmethod
+    def _caps_from_config(config: Dict[str, Any]) -> Dict[str, int]:
+        # 环境变量优先于配置，未配置的类别按 CPU 核数推算
+        caps = _default_caps()
+        for job_class in caps:
+            env_value = os.getenv(f'MEDIA_SCHEDULER_{job_class.upper()}_SLOTS')
+            if env_value:
+                caps[job_class] = int(env_value)
+            elif config.get(job_class):
+                caps[job_class] = int(config[job_class])
+        return caps
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        """按配置重设各类别并发上限与默认超时（调度器已被无配置的调用方先行创建时使用）"""
+        config = config or {}
+        for job_class, cap in self._caps_from_config(config).items():
+            self.set_cap(job_class, cap)
+        self.default_timeout = config.get('default_timeout', self.default_timeout)
+
+    # ---- 提交与执行 ----
+
+    def create_job(self, cmd: List[str], job_class: str = JOB_CLASS_TRANSCODE,
+                   priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> MediaJob:
+        if job_class not in self._queues:
+            raise ValueError(f'未知的媒体任务类别: {job_class}')
+        job = MediaJob(self, next(self._seq), list(cmd), job_class, priority,
+                       self.default_timeout if timeout is None else timeout)
+        with self._cond:
+            self._queues[job_class].stats['submitted'] += 1
+            self._active[job.job_id] = job
+        return job
+
+    def run(self, cmd: List[str], job_class: str = JOB_CLASS_TRANSCODE, priority: int = PRIORITY_NORMAL,
+            timeout: Optional[float] = None, text: bool = True,
+            stdout_callback: Optional[Callable[[str], None]] = None) -> subprocess.CompletedProcess:
+        """
+        在当前线程排队并执行命令，返回 CompletedProcess（语义与 subprocess.run(capture_output=True) 一致）
+
+        Args:
+            cmd: 命令参数列表
+            job_class: probe / extract / transcode
+            priority: 数值越小越先执行
+            timeout: 运行超时（秒），超时抛出 subprocess.TimeoutExpired
+            text: 是否以文本方式读取输出
+            stdout_callback: 逐行回调 stdout（如 ffmpeg -progress pipe:1），此时结果中 stdout 为空
+        """
+        job = self.create_job(cmd, job_class, priority, timeout)
+        return self._execute(job, text, stdout_callback)
+
+    def submit(self, cmd: List[str], job_class: str = JOB_CLASS_TRANSCODE, priority: int = PRIORITY_NORMAL,
+               timeout: Optional[float] = None, text: bool = True,
+               stdout_callback: Optional[Callable[[str], None]] = None) -> MediaJob:
+        """后台执行，立即返回任务句柄（可 wait / cancel）"""
+        job = self.create_job(cmd, job_class, priority, timeout)
+        thread = threading.Thread(
+            target=self._execute_quietly,
+            args=(job, text, stdout_callback),
+            name=f'media-job-{job.job_id}',
+            daemon=True,
+        )
+        thread.start()
+        return job
+
+    async def run_async(self, cmd: List[str], job_class: str = JOB_CLASS_TRANSCODE,
+                        priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None, text: bool = True,
+                        stdout_callback: Optional[Callable[[str], None]] = None) -> subprocess.CompletedProcess:
+        """协程版本：在线程中排队执行；协程被取消时同步取消底层任务"""
+        job = self.create_job(cmd, job_class, priority, timeout)
+        try:
+            return await asyncio.to_thread(self._execute, job, text, stdout_callback)
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+
+    def cancel(self, job: MediaJob) -> None:
+        with self._cond:
+            if job.done():
+                return
+            job.cancelled = True
+            process = job.process
+            self._cond.notify_all()
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def _execute_quietly(self, job: MediaJob, text: bool, stdout_callback) -> None:
+        try:
+            self._execute(job, text, stdout_callback)
+        except BaseException:
+            # 异常已记录在 job.error 中，由 wait() 抛出
+            pass
+
+    def _execute(self, job: MediaJob, text: bool, stdout_callback) -> subprocess.CompletedProcess:
+        try:
+            self._acquire(job)
+        except MediaJobCancelled as e:
+            self._finish(job, 'cancelled', error=e)
+            raise
+
+        timed_out = threading.Event()
+        process = None
+        try:
+            process = subprocess.Popen(job.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text)
+            with self._cond:
+                job.process = process
+                cancelled = job.cancelled
+            if cancelled:
+                process.kill()
+
+            if stdout_callback is not None:
+                def _kill_on_timeout():
+                    timed_out.set()
+                    process.kill()
+
+                watchdog = threading.Timer(job.timeout, _kill_on_timeout) if job.timeout else None
+                if watchdog:
+                    watchdog.start()
+                try:
+                    for line in process.stdout:
+                        stdout_callback(line)
+                    _, stderr = process.communicate()
+                finally:
+                    if watchdog:
+                        watchdog.cancel()
+                stdout = '' if text else b''
+            else:
+                try:
+                    stdout, stderr = process.communicate(timeout=job.timeout)
+                except subprocess.TimeoutExpired:
+                    timed_out.set()
+                    process.kill()
+                    stdout, stderr = process.communicate()
+        except BaseException as e:
+            # 回调异常等情况下子进程可能仍在运行（且会阻塞在写满的管道上），先终止再释放槽位
+            if process is not None and process.poll() is None:
+                process.kill()
+                process.wait()
+            self._release(job)
+            self._finish(job, 'failed', error=e)
+            raise
+
+        self._release(job)
+        if job.cancelled:
+            error = MediaJobCancelled(f'媒体任务已取消: {job.cmd[0]}')
+            self._finish(job, 'cancelled', error=error)
+            raise error
+        if timed_out.is_set():
+            error = subprocess.TimeoutExpired(job.cmd, job.timeout, output=stdout, stderr=stderr)
+            self._finish(job, 'timeout', error=error)
+            raise error
+
+        result = subprocess.CompletedProcess(job.cmd, process.returncode, stdout, stderr)
+        self._finish(job, 'done' if process.returncode == 0 else 'failed', result=result)
+        return result
+
+    # ---- 槽位管理 ----
+
+    def _acquire(self, job: MediaJob) -> None:
+        queue = self._queues[job.job_class]
+        with self._cond:
+            heapq.heappush(queue.heap, (job.priority, job.job_id, job))
+            while True:
+                if job.cancelled:
+                    queue.heap = [item for item in queue.heap if item[2] is not job]
+                    heapq.heapify(queue.heap)
+                    self._cond.notify_all()
+                    raise MediaJobCancelled(f'媒体任务在排队中被取消: {job.cmd[0]}')
+                if queue.running < queue.cap and queue.heap[0][2] is job:
+                    heapq.heappop(queue.heap)
+                    queue.running += 1
+                    job.state = 'running'
+                    job.started_at = time.monotonic()
+                    return
+                self._cond.wait()
+
+    def _release(self, job: MediaJob) -> None:
+        with self._cond:
+            self._queues[job.job_class].running -= 1
+            self._cond.notify_all()
+
+    def _finish(self, job: MediaJob, state: str, result=None, error: BaseException = None) -> None:
+        with self._cond:
+            job.state = state
+            job.result = result
+            job.error = error
+            job.finished_at = time.monotonic()
+            stats = self._queues[job.job_class].stats
+            key = {'done': 'completed', 'failed': 'failed', 'cancelled': 'cancelled', 'timeout': 'timed_out'}[state]
+            stats[key] += 1
+            stats['queue_wait_total'] += job.queue_wait
+            stats['queue_wait_max'] = max(stats['queue_wait_max'], job.queue_wait)
+            stats['run_time_total'] += job.run_time
+            stats['run_time_max'] = max(stats['run_time_max'], job.run_time)
+            self._active.pop(job.job_id, None)
+        job._done.set()
+        if state != 'done':
+            logger.debug('[媒体调度] 任务 %s (%s) 结束状态: %s', job.job_id, job.job_class, state)
+
+    # ---- 指标 ----
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """每个类别的并发上限、当前排队/运行数、完成情况与排队/运行耗时统计（秒）"""
+        metrics = {}
+        with self._cond:
+            for job_class, queue in self._queues.items():
+                stats = dict(queue.stats)
+                finished = stats['completed'] + stats['failed'] + stats['cancelled'] + stats['timed_out']
+                stats.update({
+                    'cap': queue.cap,
+                    'queued': len(queue.heap),
+                    'running': queue.running,
+                    'queue_wait_avg': stats['queue_wait_total'] / finished if finished else 0.0,
+                    'run_time_avg': stats['run_time_total'] / finished if finished else 0.0,
+                })
+                metrics[job_class] = stats
+        return metrics
+
+    def set_cap(self, job_class: str, cap: int) -> None:
+        with self._cond:
+            self._queues[job_class].cap = max(1, int(cap))
+            self._cond.notify_all()
+
+
+_scheduler: Optional[MediaJobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_media_scheduler(config: Dict[str, Any] = None) -> MediaJobScheduler:
+    """
+    获取进程级共享调度器
+
+    不带 config 的调用（VideoUtils、FFmpegService 等）只取用已有调度器，没有时按默认上限创建；
+    传入 config（media_scheduler 配置段）时，即使调度器已被先行创建，也按该配置重设并发上限与默认超时。
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = MediaJobScheduler(config)
+        elif config:
+            _scheduler.configure(config)
+            logger.info('[媒体调度] 已按配置重设并发上限: %s',
+                        {job_class: queue.cap for job_class, queue in _scheduler._queues.items()})
+    return _scheduler
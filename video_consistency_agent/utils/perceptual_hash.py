@@ -0,0 +1,253 @@
+"""
+感知哈希预筛
+每张图像计算一个 64 位感知哈希（pHash 或 dHash），按汉明距离把图像对分为
+near_duplicate（近重复）/ different（明显不同）/ ambiguous（不确定）三类，
+只有 ambiguous 的图像对才需要调用 CLIP、VLM、SSIM 等昂贵指标。
+
+哈希按 (路径, 大小, mtime) 存入 SQLite 小索引，跨检查、跨进程复用，支持整批查询。
+"""
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE = 'near_duplicate'
+DIFFERENT = 'different'
+AMBIGUOUS = 'ambiguous'
+
+HASH_BITS = 64
+
+
+def dhash(image: np.ndarray, size: int = 8) -> int:
+    """差值哈希：缩放到 (size+1) x size 灰度图，比较水平相邻像素"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    return _bits_to_int((small[:, 1:] > small[:, :-1]).ravel())
+
+
+def phash(image: np.ndarray, size: int = 8, highfreq_factor: int = 4) -> int:
+    """DCT 感知哈希：32x32 灰度图做 DCT，取左上 8x8 低频系数与其中位数比较"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    n = size * highfreq_factor
+    small = cv2.resize(gray, (n, n), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:size, :size]
+    return _bits_to_int((low > np.median(low)).ravel())
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), 'big')
+
+
+def hamming(hash1: int, hash2: int) -> int:
+    return bin(hash1 ^ hash2).count('1')
+
+
+_HASH_FUNCS = {'phash': phash, 'dhash': dhash}
+
+
+class PerceptualHashIndex:
+    """
+    感知哈希索引（线程安全）
+
+    配置项：
+        method: phash（默认）/ dhash
+        near_duplicate_max: 汉明距离不超过该值视为近重复（默认 6）
+        different_min: 汉明距离不小于该值视为明显不同（默认 26）
+        index_file: SQLite 索引文件，默认 ~/.cache/video_consistency/perceptual_hash.db；设为 '' 时只在内存中缓存
+        memory_entries: 内存缓存的哈希条目上限（默认 4096），超出后按最近使用淘汰（索引文件中的条目不受影响）
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        self.method = config.get('method', 'phash')
+        if self.method not in _HASH_FUNCS:
+            raise ValueError(f"未知感知哈希方法: {self.method}")
+        self.near_duplicate_max = int(config.get('near_duplicate_max', 6))
+        self.different_min = int(config.get('different_min', 26))
+        index_file = config.get('index_file')
+        if index_file is None:
+            index_file = os.path.join(os.path.expanduser('~'), '.cache', 'video_consistency', 'perceptual_hash.db')
+        self._lock = threading.Lock()
+        self.memory_entries = int(config.get('memory_entries', 4096))
+        self._memory: 'OrderedDict[Tuple[str, int, int], int]' = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if index_file:
+            try:
+                os.makedirs(os.path.dirname(index_file) or '.', exist_ok=True)
+                self._db = sqlite3.connect(index_file, timeout=10, check_same_thread=False)
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS image_hashes ('
+                    'path TEXT, size INTEGER, mtime_ns INTEGER, method TEXT, hash TEXT, '
+                    'PRIMARY KEY (path, method))'
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[感知哈希] 索引文件不可用，仅使用内存缓存: {e}")
+                self._db = None
+        self.stats = {'computed': 0, 'memory_hits': 0, 'index_hits': 0, NEAR_DUPLICATE: 0, DIFFERENT: 0, AMBIGUOUS: 0}
+
+    # ---- 哈希 ----
+
+    def hashes(self, image_paths: Sequence[str]) -> List[Optional[int]]:
+        """批量获取哈希（先查内存、再整批查索引，最后只计算缺失项并一次写回）；无法读取的图像为 None"""
+        keys: List[Optional[Tuple[str, int, int]]] = []
+        for path in image_paths:
+            try:
+                st = os.stat(path)
+                keys.append((os.path.abspath(path), st.st_size, st.st_mtime_ns))
+            except OSError:
+                keys.append(None)
+
+        results: List[Optional[int]] = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for n, key in enumerate(keys):
+                if key is None:
+                    continue
+                cached = self._memory.get(key)
+                if cached is not None:
+                    self._memory.move_to_end(key)
+                    results[n] = cached
+                    self.stats['memory_hits'] += 1
+                else:
+                    missing.append(n)
+            if missing and self._db is not None:
+                found = self._lookup([keys[n] for n in missing])
+                still_missing = []
+                for n in missing:
+                    value = found.get(keys[n])
+                    if value is None:
+                        still_missing.append(n)
+                    else:
+                        results[n] = self._memory[keys[n]] = value
+                        self.stats['index_hits'] += 1
+                missing = still_missing
+                self._trim_memory()
+
+        computed = []
+        for n in missing:
+            image = cv2.imread(keys[n][0])
+            if image is None:
+                continue
+            results[n] = _HASH_FUNCS[self.method](image)
+            computed.append((keys[n], results[n]))
+
+        if computed:
+            with self._lock:
+                self.stats['computed'] += len(computed)
+                for key, value in computed:
+                    self._memory[key] = value
+                self._trim_memory()
+                self._store(computed)
+        return results
+
+    def _trim_memory(self) -> None:
+        # 调用方持有 self._lock
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[Tuple[str, int, int]]) -> Dict[Tuple[str, int, int], int]:
+        found = {}
+        try:
+            # SQLite 单条语句变量数有限，分块查询
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT path, size, mtime_ns, hash FROM image_hashes WHERE method = ? "
+                    f"AND path IN ({','.join('?' * len(chunk))})",
+                    [self.method] + [k[0] for k in chunk]
+                ).fetchall()
+                for path, size, mtime_ns, value in rows:
+                    found[(path, size, mtime_ns)] = int(value, 16)
+        except sqlite3.Error as e:
+            logger.warning(f"[感知哈希] 查询索引失败: {e}")
+        return found
+
+    def _store(self, items: List[Tuple[Tuple[str, int, int], int]]) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO image_hashes (path, size, mtime_ns, method, hash) VALUES (?, ?, ?, ?, ?)',
+                [(key[0], key[1], key[2], self.method, f'{value:016x}') for key, value in items]
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[感知哈希] 写入索引失败: {e}")
+
+    # ---- 距离与分类 ----
+
+    def _classify_distance(self, distance: int) -> str:
+        if distance <= self.near_duplicate_max:
+            return NEAR_DUPLICATE
+        if distance >= self.different_min:
+            return DIFFERENT
+        return AMBIGUOUS
+
+    def classify(self, image1_path: str, image2_path: str) -> Dict[str, Any]:
+        """
+        判断一对图像
+
+        Returns:
+            {'verdict': near_duplicate / different / ambiguous, 'distance': 汉明距离,
+             'similarity': 1 - distance / 64}；任一图像无法读取时 verdict 为 ambiguous、distance 为 None
+        """
+        hash1, hash2 = self.hashes([image1_path, image2_path])
+        if hash1 is None or hash2 is None:
+            return {'verdict': AMBIGUOUS, 'distance': None, 'similarity': None}
+        distance = hamming(hash1, hash2)
+        verdict = self._classify_distance(distance)
+        with self._lock:
+            self.stats[verdict] += 1
+        return {'verdict': verdict, 'distance': distance, 'similarity': 1.0 - distance / HASH_BITS}
+
+    def classify_sequence(self, image_paths: Sequence[str]) -> str:
+        """
+        判断一组按顺序排列的图像：相邻对全部近重复为 near_duplicate，
+        任一相邻对明显不同为 different，否则为 ambiguous
+        """
+        if len(image_paths) < 2:
+            return AMBIGUOUS
+        verdicts = [self.classify(a, b)['verdict'] for a, b in zip(image_paths, image_paths[1:])]
+        if all(v == NEAR_DUPLICATE for v in verdicts):
+            return NEAR_DUPLICATE
+        if any(v == DIFFERENT for v in verdicts):
+            return DIFFERENT
+        return AMBIGUOUS
+
+    def distance_matrix(self, image_paths: Sequence[str]) -> np.ndarray:
+        """整批计算两两汉明距离（N x N，int）；无法读取的图像对应行列为 -1"""
+        values = self.hashes(image_paths)
+        valid = np.array([v is not None for v in values])
+        packed = np.array([v or 0 for v in values], dtype=np.uint64)
+        xor = packed[:, None] ^ packed[None, :]
+        distances = np.unpackbits(xor.view(np.uint8).reshape(len(values), len(values), 8), axis=2).sum(axis=2)
+        distances = distances.astype(np.int64)
+        distances[~valid, :] = -1
+        distances[:, ~valid] = -1
+        return distances
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, cached=len(self._memory))
+
+
+_index: Optional[PerceptualHashIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_hash_index(config: Dict[str, Any] = None) -> PerceptualHashIndex:
+    """获取进程级共享感知哈希索引；首次调用时的 config（perceptual_hash 配置段）决定方法、阈值与索引文件"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PerceptualHashIndex(config)
+    return _index
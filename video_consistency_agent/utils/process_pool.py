@@ -0,0 +1,257 @@
+"""
+CPU 密集指标的进程池后端
+SSIM、Farneback 光流等纯计算指标在调用线程中执行时受 GIL 与 Python 开销限制，只能占用一个核。
+这里把解码后的帧放进共享内存（multiprocessing.shared_memory），子进程按名称挂载为 numpy 视图，
+只有句柄（名称、形状、dtype）经过 pickle；光流等大输出同样写回共享内存。
+图像解码与对比工作集构建（缩放、直方图、Canny）同样在子进程中完成，只有缩小后的工作集传回。
+
+默认关闭：由 ConsistencyAgent 按 process_pool 配置段初始化，未初始化时各调用方回退到进程内计算。
+"""
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameHandle(NamedTuple):
+    """共享内存中一帧的句柄（唯一需要 pickle 传给子进程的内容）"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class SharedFrames:
+    """
+    一组放入共享内存的帧，作为上下文管理器使用，退出时释放（unlink）
+
+    with SharedFrames(frames) as shared:
+        pool.map(..., shared.handles)
+    """
+
+    def __init__(self, frames: Sequence[np.ndarray] = (), outputs: Sequence[Tuple[Tuple[int, ...], str]] = ()):
+        self._blocks: List[SharedMemory] = []
+        self.handles: List[FrameHandle] = [self._share(np.ascontiguousarray(f)) for f in frames]
+        # 子进程写入的输出缓冲区（形状, dtype）
+        self.output_handles: List[FrameHandle] = [self._allocate(shape, dtype) for shape, dtype in outputs]
+
+    def _allocate(self, shape: Tuple[int, ...], dtype: str) -> FrameHandle:
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        block = SharedMemory(create=True, size=nbytes)
+        self._blocks.append(block)
+        return FrameHandle(block.name, tuple(shape), np.dtype(dtype).str)
+
+    def _share(self, frame: np.ndarray) -> FrameHandle:
+        handle = self._allocate(frame.shape, frame.dtype.str)
+        np.ndarray(frame.shape, frame.dtype, buffer=self._blocks[-1].buf)[...] = frame
+        return handle
+
+    def output(self, index: int) -> np.ndarray:
+        """读取第 index 个输出缓冲区（返回副本，释放后仍可用）"""
+        handle = self.output_handles[index]
+        block = self._blocks[len(self.handles) + index]
+        return np.ndarray(handle.shape, np.dtype(handle.dtype), buffer=block.buf).copy()
+
+    def close(self) -> None:
+        for block in self._blocks:
+            try:
+                block.close()
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+    def __enter__(self) -> 'SharedFrames':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@contextmanager
+def attach(handle: FrameHandle) -> Iterator[np.ndarray]:
+    """子进程中按句柄挂载共享帧（零拷贝视图），退出时只关闭不释放"""
+    # forkserver / spawn 子进程与父进程共用同一个资源跟踪器，挂载时的重复登记不会导致提前释放，
+    # 释放（unlink）统一由创建方 SharedFrames 负责
+    block = SharedMemory(name=handle.name)
+    try:
+        yield np.ndarray(handle.shape, np.dtype(handle.dtype), buffer=block.buf)
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # 调用方仍持有视图：映射随视图回收释放
+            logger.debug(f"[进程池] 共享帧 {handle.name} 仍被引用，延迟关闭")
+
+
+# ---- 子进程任务（模块级函数，可被 pickle） ----
+
+def _ssim_pairs_task(handles: Sequence[FrameHandle], pairs: Sequence[Tuple[int, int]], method: str) -> List[float]:
+    from .fast_ssim import ms_ssim, ssim
+
+    func = ms_ssim if method == 'ms-ssim' else ssim
+    with ExitStack() as stack:
+        frames = {i: stack.enter_context(attach(handles[i])) for i in sorted({i for pair in pairs for i in pair})}
+        scores = [float(func(frames[i], frames[j])) for i, j in pairs]
+        # 视图须在关闭共享内存之前释放
+        frames.clear()
+    return scores
+
+
+def _working_sets_task(paths: Sequence[str], working_size: int) -> List[Any]:
+    import cv2
+    from .image_comparison import ImageWorkingSet
+
+    working = []
+    for path in paths:
+        image = cv2.imread(path)
+        working.append(None if image is None else ImageWorkingSet(path, image, working_size))
+    return working
+
+
+def _farneback_task(first: FrameHandle, second: FrameHandle, output: FrameHandle, index: int) -> None:
+    import cv2
+
+    with ExitStack() as stack:
+        frame1 = stack.enter_context(attach(first))
+        frame2 = stack.enter_context(attach(second))
+        out = stack.enter_context(attach(output))
+        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY) if frame1.ndim == 3 else frame1
+        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY) if frame2.ndim == 3 else frame2
+        out[index] = cv2.calcOpticalFlowFarneback(
+            gray1, gray2, None,
+            pyr_scale=0.5,
+            levels=3,
+            winsize=15,
+            iterations=3,
+            poly_n=5,
+            poly_sigma=1.2,
+            flags=0
+        )
+        del frame1, frame2, out, gray1, gray2
+
+
+class MetricProcessPool:
+    """
+    指标进程池
+
+    配置项：
+        enabled: 是否启用（默认 false）
+        workers: 子进程数，默认 CPU 核数
+        start_method: 子进程启动方式，默认 forkserver（不可用时 spawn）；避免 fork 继承线程池与模型状态
+        min_tasks: 少于该数量的图像对直接在进程内计算（默认 4），避免小任务的进程间开销
+        min_decodes: 少于该数量的待解码图像直接在进程内解码（默认 2）
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        self.workers = int(config.get('workers') or os.cpu_count() or 1)
+        self.min_tasks = int(config.get('min_tasks', 4))
+        self.min_decodes = int(config.get('min_decodes', 2))
+        start_method = config.get('start_method', 'forkserver')
+        try:
+            context = get_context(start_method)
+        except ValueError:
+            context = get_context('spawn')
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self._lock = threading.Lock()
+        self.stats = {'tasks': 0, 'pairs': 0, 'flows': 0, 'decodes': 0}
+        logger.info(f"[进程池] 已启动，子进程数 {self.workers}，启动方式 {context.get_start_method()}")
+
+    def _chunks(self, items: Sequence[Any]) -> List[Sequence[Any]]:
+        # 每个子进程约 4 个分块：既均衡负载，又摊薄每个任务的挂载与调度开销
+        size = max(1, math.ceil(len(items) / (self.workers * 4)))
+        return [items[start:start + size] for start in range(0, len(items), size)]
+
+    def ssim_pairs(self, frames: Sequence[np.ndarray], pairs: Sequence[Tuple[int, int]],
+                   method: str = 'ssim') -> List[float]:
+        """
+        并行计算多对灰度帧的 SSIM / MS-SSIM
+
+        Args:
+            frames: 灰度帧（已缩放到工作分辨率，计算时不再缩放）
+            pairs: (i, j) 下标对
+        """
+        pairs = [tuple(p) for p in pairs]
+        if not pairs:
+            return []
+        chunks = self._chunks(pairs)
+        with SharedFrames(frames) as shared:
+            futures = [self._executor.submit(_ssim_pairs_task, shared.handles, chunk, method) for chunk in chunks]
+            results = [score for future in futures for score in future.result()]
+        with self._lock:
+            self.stats['tasks'] += len(chunks)
+            self.stats['pairs'] += len(pairs)
+        return results
+
+    def working_sets(self, paths: Sequence[str], working_size: int) -> List[Any]:
+        """
+        并行解码图像并构建对比工作集（ImageWorkingSet），结果经 pickle 传回（工作集已缩小，远小于原图）
+
+        Returns:
+            与 paths 等长的列表，无法读取的图像为 None
+        """
+        paths = list(paths)
+        if not paths:
+            return []
+        chunks = self._chunks(paths)
+        futures = [self._executor.submit(_working_sets_task, chunk, working_size) for chunk in chunks]
+        results = [working for future in futures for working in future.result()]
+        with self._lock:
+            self.stats['tasks'] += len(chunks)
+            self.stats['decodes'] += len(paths)
+        return results
+
+    def optical_flows(self, frames: Sequence[np.ndarray]) -> np.ndarray:
+        """并行计算相邻帧的 Farneback 光流，返回 (N-1, H, W, 2) float32；结果经共享内存写回"""
+        if len(frames) < 2:
+            return np.zeros((0,) + frames[0].shape[:2] + (2,), np.float32) if frames else np.zeros((0, 0, 0, 2), np.float32)
+        h, w = frames[0].shape[:2]
+        count = len(frames) - 1
+        with SharedFrames(frames, outputs=[((count, h, w, 2), 'float32')]) as shared:
+            out = shared.output_handles[0]
+            futures = [
+                self._executor.submit(_farneback_task, shared.handles[i], shared.handles[i + 1], out, i)
+                for i in range(count)
+            ]
+            for future in futures:
+                future.result()
+            flows = shared.output(0)
+        with self._lock:
+            self.stats['tasks'] += count
+            self.stats['flows'] += count
+        return flows
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, workers=self.workers)
+
+
+_pool: Optional[MetricProcessPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(config: Dict[str, Any] = None) -> Optional[MetricProcessPool]:
+    """
+    获取进程级指标进程池
+
+    传入 config（process_pool 配置段）且 enabled 时首次调用创建进程池；不传 config 时只返回已有的进程池，
+    未启用时返回 None，调用方回退到进程内计算。
+    """
+    global _pool
+    if _pool is None and config and config.get('enabled'):
+        with _pool_lock:
+            if _pool is None:
+                _pool = MetricProcessPool(config)
+    return _pool
@@ -0,0 +1,355 @@
+"""
+媒体临时空间管理
+关键帧、音频、拼接清单等临时文件统一分配在受管目录中：每个任务独立子目录、
+上下文管理自动清理、全局磁盘配额 + LRU 淘汰；小文件（单帧图片等）优先放在内存盘（/dev/shm）。
+
+占用按目录增量统计：每个目录在写入完成后（下一次分配时或 job 结束时）只遍历一次，
+分配路径上不再遍历全部目录；淘汰的目录在锁外删除。
+"""
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TIER_RAM = 'ram'
+TIER_DISK = 'disk'
+
+_PROC_DIR_PREFIX = 'proc_'
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class ScratchDir:
+    """一个任务的临时目录"""
+
+    def __init__(self, path: str, tier: str, prefix: str):
+        self.path = path
+        self.tier = tier
+        self.prefix = prefix
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.pins = 0
+        # 已统计的占用（字节）；measured 为 False 表示目录可能仍在写入，下一次分配时统计
+        self.size = 0
+        self.measured = False
+
+    def file(self, name: str) -> str:
+        """目录内文件路径"""
+        return os.path.join(self.path, name)
+
+    def __repr__(self) -> str:
+        return f'ScratchDir({self.path!r}, tier={self.tier})'
+
+
+class ScratchSpaceManager:
+    """
+    进程级临时空间管理器（线程安全）
+
+    - allocate(): 分配目录，调用方持有返回的文件路径，用完 release()；未释放的目录在超出配额时按 LRU 淘汰
+    - job(): 上下文管理，块结束自动删除（keep=True 时转为可淘汰目录）
+    - 使用中（job 上下文内）或被 pin() 固定的目录不会被淘汰；调用方在 job 结束后仍持有文件路径时
+      （例如关键帧缓存），应 pin() 目录并在不再引用时 unpin()
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self._lock = threading.RLock()
+        self.config: Dict[str, Any] = {}
+        self.disk_root: Optional[str] = None
+        self.ram_root: Optional[str] = None
+        # configure() 切换根目录前的旧根目录：其中仍受管理的目录照常淘汰，进程退出时一并删除
+        self._retired_roots: List[str] = []
+        self._apply(config or {})
+
+        self._dirs: Dict[str, ScratchDir] = {}
+        self._used = {TIER_DISK: 0, TIER_RAM: 0}
+        self._unmeasured: List[ScratchDir] = []
+        self.stats = {'allocated': 0, 'released': 0, 'evicted': 0, 'evicted_bytes': 0}
+        atexit.register(self.cleanup_all)
+
+    def _apply(self, config: Dict[str, Any]) -> None:
+        """按配置设置配额与根目录（根目录变化时新建，旧根目录留待退出时删除）"""
+        self.config = dict(config)
+        self.disk_quota = int(float(config.get('quota_mb', 2048)) * 1024 * 1024)
+        self.ram_quota = int(float(config.get('ram_quota_mb', 256)) * 1024 * 1024)
+        base = config.get('root') or os.getenv('SCRATCH_DIR') or os.path.join(tempfile.gettempdir(), 'video_consistency')
+        disk_root = os.path.join(os.path.abspath(base), f'{_PROC_DIR_PREFIX}{os.getpid()}')
+        if disk_root != self.disk_root:
+            if self.disk_root:
+                self._retired_roots.append(self.disk_root)
+            self.disk_root = self._init_root(base)
+
+        ram_root = None
+        ram_base = config.get('ram_dir', '/dev/shm')
+        if ram_base and self.ram_quota > 0 and os.path.isdir(ram_base) and os.access(ram_base, os.W_OK):
+            ram_root = os.path.join(os.path.abspath(ram_base), 'video_consistency', f'{_PROC_DIR_PREFIX}{os.getpid()}')
+            if ram_root != self.ram_root:
+                try:
+                    ram_root = self._init_root(os.path.join(ram_base, 'video_consistency'))
+                except OSError as e:
+                    logger.warning('[临时空间] 内存盘不可用，全部使用磁盘: %s', e)
+                    ram_root = None
+        if ram_root != self.ram_root and self.ram_root:
+            self._retired_roots.append(self.ram_root)
+        self.ram_root = ram_root
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        """
+        按配置重设根目录与配额（管理器已被无配置的调用方先行创建时使用）
+
+        已分配的目录保留在原位置并继续计入配额；新配额更小时立即按 LRU 淘汰。
+        """
+        config = config or {}
+        with self._lock:
+            if config == self.config:
+                return
+            self._apply(config)
+            victims = self._enforce_quota()
+        self._remove(victims)
+        logger.info('[临时空间] 已按配置重设: 磁盘 %s (%.0f MB)，内存盘 %s (%.0f MB)', self.disk_root,
+                    self.disk_quota / 1024 / 1024, self.ram_root, self.ram_quota / 1024 / 1024)
+
+    def _init_root(self, base: str) -> str:
+        """创建本进程的根目录，并清理已退出进程遗留的目录"""
+        base = os.path.abspath(base)
+        os.makedirs(base, exist_ok=True)
+        for name in os.listdir(base):
+            if not name.startswith(_PROC_DIR_PREFIX):
+                continue
+            try:
+                pid = int(name[len(_PROC_DIR_PREFIX):])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _pid_alive(pid):
+                shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+        root = os.path.join(base, f'{_PROC_DIR_PREFIX}{os.getpid()}')
+        os.makedirs(root, exist_ok=True)
+        return root
+
+    # ---- 分配与释放 ----
+
+    def allocate(self, prefix: str = 'job', small: bool = False) -> ScratchDir:
+        """
+        分配一个任务目录
+
+        Args:
+            prefix: 目录名前缀（便于排查）
+            small: 是否只存放小文件（单帧图片、清单文件），是则优先使用内存盘
+        """
+        # 之前分配、已写入完成的目录各统计一次（锁外遍历）
+        with self._lock:
+            pending, self._unmeasured = self._unmeasured, []
+        for scratch in pending:
+            self._measure(scratch)
+
+        with self._lock:
+            tier = TIER_DISK
+            root = self.disk_root
+            if small and self.ram_root and self._used[TIER_RAM] < self.ram_quota:
+                tier, root = TIER_RAM, self.ram_root
+            path = os.path.join(root, f'{prefix}_{uuid.uuid4().hex[:12]}')
+            os.makedirs(path)
+            scratch = ScratchDir(path, tier, prefix)
+            self._dirs[path] = scratch
+            self._unmeasured.append(scratch)
+            self.stats['allocated'] += 1
+            victims = self._enforce_quota(exclude=scratch)
+        self._remove(victims)
+        return scratch
+
+    def release(self, path: str) -> None:
+        """删除 path 所在的任务目录（path 可以是目录本身或其中的文件）"""
+        with self._lock:
+            scratch = self._find(path)
+            if scratch is None:
+                return
+            self._forget(scratch)
+            self.stats['released'] += 1
+        shutil.rmtree(scratch.path, ignore_errors=True)
+
+    def measure(self, path: str) -> int:
+        """重新统计 path 所在目录的占用（调用方向已分配目录追加大量文件后使用），返回字节数"""
+        with self._lock:
+            scratch = self._find(path)
+        if scratch is None:
+            return 0
+        self._measure(scratch)
+        with self._lock:
+            victims = self._enforce_quota()
+        self._remove(victims)
+        return scratch.size
+
+    def pin(self, path: str) -> bool:
+        """固定 path 所在目录，unpin() 之前不会被配额淘汰；目录不受管理（已释放或淘汰）时返回 False"""
+        with self._lock:
+            scratch = self._find(path)
+            if scratch is None:
+                return False
+            scratch.pins += 1
+            scratch.last_access = time.time()
+            return True
+
+    def unpin(self, path: str) -> None:
+        """解除一次 pin()"""
+        with self._lock:
+            scratch = self._find(path)
+            if scratch is not None and scratch.pins > 0:
+                scratch.pins -= 1
+                scratch.last_access = time.time()
+
+    def touch(self, path: str) -> None:
+        """标记最近使用，降低被 LRU 淘汰的优先级"""
+        with self._lock:
+            scratch = self._find(path)
+            if scratch is not None:
+                scratch.last_access = time.time()
+
+    def is_alive(self, path: str) -> bool:
+        """path 所在目录是否仍然存在（未被释放或淘汰）"""
+        with self._lock:
+            return self._find(path) is not None and os.path.exists(path)
+
+    @contextmanager
+    def job(self, prefix: str = 'job', small: bool = False, keep: bool = False) -> Iterator[ScratchDir]:
+        """
+        上下文管理的任务目录：块内不会被淘汰，结束时删除
+
+        Args:
+            keep: 结束时保留目录（交由配额 LRU 淘汰或调用方 release；继续引用其中文件的调用方需先 pin()）
+        """
+        scratch = self.allocate(prefix, small)
+        with self._lock:
+            scratch.pins += 1
+        try:
+            yield scratch
+        except BaseException:
+            keep = False
+            raise
+        finally:
+            with self._lock:
+                scratch.pins -= 1
+                scratch.last_access = time.time()
+            if keep:
+                self.measure(scratch.path)
+            else:
+                self.release(scratch.path)
+
+    def _find(self, path: str) -> Optional[ScratchDir]:
+        path = os.path.abspath(path)
+        while path and path not in self._dirs:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+        return self._dirs.get(path)
+
+    # ---- 配额 ----
+
+    def _measure(self, scratch: ScratchDir) -> None:
+        size = _dir_size(scratch.path)
+        with self._lock:
+            if self._dirs.get(scratch.path) is scratch:
+                self._used[scratch.tier] += size - scratch.size
+            scratch.size = size
+            scratch.measured = True
+
+    def _forget(self, scratch: ScratchDir) -> None:
+        # 调用方持有 self._lock
+        if self._dirs.pop(scratch.path, None) is scratch:
+            self._used[scratch.tier] -= scratch.size
+        if not scratch.measured and scratch in self._unmeasured:
+            self._unmeasured.remove(scratch)
+
+    def _enforce_quota(self, exclude: Optional[ScratchDir] = None) -> List[ScratchDir]:
+        """按 LRU 选出需淘汰的目录并移出登记（调用方持有 self._lock），返回值交给 _remove() 在锁外删除"""
+        victims: List[ScratchDir] = []
+        for tier, quota in ((TIER_DISK, self.disk_quota), (TIER_RAM, self.ram_quota)):
+            if self._used[tier] <= quota:
+                continue
+            candidates = sorted(
+                (d for d in self._dirs.values() if d.tier == tier and d.pins == 0 and d is not exclude),
+                key=lambda d: d.last_access,
+            )
+            for scratch in candidates:
+                if self._used[tier] <= quota:
+                    break
+                self._forget(scratch)
+                victims.append(scratch)
+                self.stats['evicted'] += 1
+                self.stats['evicted_bytes'] += scratch.size
+                logger.info('[临时空间] 超出%s配额，淘汰 %s (%.1f MB)', tier, scratch.path, scratch.size / 1024 / 1024)
+        return victims
+
+    @staticmethod
+    def _remove(victims: List[ScratchDir]) -> None:
+        for scratch in victims:
+            shutil.rmtree(scratch.path, ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各层目录数、占用与配额（字节）及分配/释放/淘汰计数"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.stats)
+            for tier, quota in ((TIER_DISK, self.disk_quota), (TIER_RAM, self.ram_quota)):
+                stats[tier] = {
+                    'dirs': sum(1 for d in self._dirs.values() if d.tier == tier),
+                    'used_bytes': self._used[tier],
+                    'quota_bytes': quota if tier == TIER_DISK or self.ram_root else 0,
+                }
+            return stats
+
+    def cleanup_all(self) -> None:
+        """删除本进程的全部临时目录（进程退出时自动调用）"""
+        with self._lock:
+            self._dirs.clear()
+            self._unmeasured.clear()
+            self._used = {TIER_DISK: 0, TIER_RAM: 0}
+            roots = [self.disk_root, self.ram_root] + self._retired_roots
+        for root in roots:
+            if root:
+                shutil.rmtree(root, ignore_errors=True)
+
+
+_scratch: Optional[ScratchSpaceManager] = None
+_scratch_lock = threading.Lock()
+
+
+def get_scratch_space(config: Dict[str, Any] = None) -> ScratchSpaceManager:
+    """
+    获取进程级共享临时空间
+
+    不带 config 的调用（VideoUtils、视频分析服务等）只取用已有管理器，没有时按默认目录与配额创建；
+    传入 config（scratch_space 配置段）时，即使管理器已被先行创建，也按该配置重设根目录与配额。
+    """
+    global _scratch
+    with _scratch_lock:
+        if _scratch is None:
+            _scratch = ScratchSpaceManager(config)
+        elif config:
+            _scratch.configure(config)
+    return _scratch
@@ -1,8 +1,15 @@
+import asyncio
 import cv2
 import numpy as np
 import os
-import asyncio
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from .image_comparison import get_comparison_engine
+from .perceptual_hash import NEAR_DUPLICATE, get_hash_index
+from .executor import run_blocking, run_sync
+from .fallback_tracker import track_fallbacks
 
 # 尝试导入阿里云图像相似度API模块，如果失败则继续使用本地实现
 try:
@@ -14,11 +21,20 @@ except ImportError:
     ALIBABA_CLOUD_AVAILABLE = False
 
 class SimilarityCalculator:
-    def __init__(self, config: Dict[str, Any] = None):
-# 初始化相似度计算器
+    def __init__(self, config: Dict[str, Any] = None, vlm_client=None):
+# 初始化相似度计算器（vlm_client 由共享组件注册表传入时不再单独构建）
         self.config = config or {}
         self.aliyun_client = None
-        self.vlm_client = None
+        self.vlm_client = vlm_client
+        # 传统视觉指标共用的单次解码引擎（进程级共享工作集缓存）
+        self.comparison_engine = get_comparison_engine(self.config.get('image_comparison'))
+        # 感知哈希预筛：近重复的图像对不再请求 VLM / 阿里云，直接使用本地指标；其余图像对照常计算
+        hash_config = self.config.get('perceptual_hash') or {}
+        self.hash_index = get_hash_index(hash_config) if hash_config.get('enabled', True) else None
+        # VLM 图像对相似度（按双方 (路径, 大小, mtime) 缓存）：序列检查的批量预取与之后的逐对检查共用；降级结果不缓存
+        self._vlm_scores: 'OrderedDict[Tuple, float]' = OrderedDict()
+        self._vlm_scores_lock = threading.Lock()
+        self.vlm_cache_size = int(self.config.get('vlm_similarity_cache_size', 1024))
         
         # 初始化客户端
         self._init_clients()
@@ -26,7 +42,8 @@ class SimilarityCalculator:
     def _init_clients(self):
         """初始化所有客户端"""
         # 初始化VLM客户端（优先使用）
-        self._init_vlm_client()
+        if self.vlm_client is None:
+            self._init_vlm_client()
         # 初始化阿里云图像相似度API客户端（备选）
         self._init_aliyun_client()
     
@@ -69,40 +86,121 @@ class SimilarityCalculator:
             print(f"[错误] 初始化阿里云客户端失败: {e}")
     
     def calculate_clip_similarity(self, image1_path: str, image2_path: str) -> float:
-# 使用CLIP模型计算图像相似度
+# 使用CLIP模型计算图像相似度（同步接口；异步检查器请使用 calculate_clip_similarity_async）
         # 检查文件是否存在
         if not os.path.exists(image1_path) or not os.path.exists(image2_path):
             raise FileNotFoundError("图像文件不存在")
         
+        if self._prefilter(image1_path, image2_path):
+            return self.comparison_engine.compare(image1_path, image2_path)['local_clip_similarity']
+        
         # 优先使用VLM客户端计算图像相似度
         if self.vlm_client:
-            try:
-                vlm_model_name = self.config.get('models', {}).get('vlm_model', 'qwen3-vl')
-                print(f"[VLM API] 使用{vlm_model_name}计算图像相似度: {image1_path} vs {image2_path}")
-                
-                # 运行异步VLM方法
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # 如果事件循环已经在运行，使用create_task
-                    result = loop.run_until_complete(
-                        self.vlm_client.analyze_keyframe_consistency(image1_path, image2_path)
-                    )
-                else:
-                    # 否则直接运行
-                    result = loop.run_until_complete(
-                        self.vlm_client.analyze_keyframe_consistency(image1_path, image2_path)
-                    )
-                
-                # 提取相似度分数
-                similarity = result.get('consistency_analysis', {}).get('overall_consistency', 0.0)
-                print(f"[VLM API] 相似度分数: {similarity}")
-                
+            similarity = run_sync(self._vlm_similarity(image1_path, image2_path))
+            if similarity is not None:
                 return similarity
-            except Exception as e:
-                print(f"[错误] VLM图像相似度计算失败: {e}")
-                # 回退到其他方法
         
-        # 其次使用阿里云图像相似度API
+        return self._fallback_clip_similarity(image1_path, image2_path)
+    
+    async def calculate_clip_similarity_async(self, image1_path: str, image2_path: str) -> float:
+# 异步计算图像相似度：VLM 请求直接 await，预筛、阿里云 SDK 与本地计算放到共享线程池，不阻塞事件循环
+        if not os.path.exists(image1_path) or not os.path.exists(image2_path):
+            raise FileNotFoundError("图像文件不存在")
+        
+        if await run_blocking(self._prefilter, image1_path, image2_path):
+            return (await self.compare_images_async(image1_path, image2_path))['local_clip_similarity']
+        
+        if self.vlm_client:
+            similarity = await self._vlm_similarity(image1_path, image2_path)
+            if similarity is not None:
+                return similarity
+        
+        return await run_blocking(self._fallback_clip_similarity, image1_path, image2_path)
+    
+    async def calculate_clip_similarity_many_async(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+# 批量计算多对图像的相似度：近重复的图像对使用本地指标，已缓存的直接返回，其余去重后经
+# analyze_keyframe_consistency_batch 合并为少量多模态请求（每个请求 max_pairs_per_request 对）
+        pairs = [tuple(pair) for pair in pairs]
+        for image1_path, image2_path in pairs:
+            if not os.path.exists(image1_path) or not os.path.exists(image2_path):
+                raise FileNotFoundError("图像文件不存在")
+        
+        unique = list(dict.fromkeys(pairs))
+        scores: Dict[Tuple[str, str], float] = {}
+        near_duplicates = await asyncio.gather(*(run_blocking(self._prefilter, *pair) for pair in unique))
+        pending = []
+        for pair, near_duplicate in zip(unique, near_duplicates):
+            if near_duplicate:
+                scores[pair] = (await self.compare_images_async(*pair))['local_clip_similarity']
+                continue
+            cached = self._cached_vlm_score(*pair)
+            if cached is not None:
+                scores[pair] = cached
+            else:
+                pending.append(pair)
+        
+        if pending and self.vlm_client:
+            with track_fallbacks() as fallbacks:
+                results = await self.vlm_client.analyze_keyframe_consistency_batch(pending)
+            for pair, result in zip(pending, results):
+                scores[pair] = result.get('consistency_analysis', {}).get('overall_consistency', 0.0)
+                if not fallbacks:
+                    self._store_vlm_score(pair, scores[pair])
+        
+        for pair in unique:
+            if pair not in scores:
+                scores[pair] = await run_blocking(self._fallback_clip_similarity, *pair)
+        return [scores[pair] for pair in pairs]
+    
+    def _vlm_key(self, image1_path: str, image2_path: str) -> Optional[Tuple]:
+        try:
+            return tuple((os.path.abspath(p), st.st_size, st.st_mtime_ns)
+                         for p, st in ((p, os.stat(p)) for p in (image1_path, image2_path)))
+        except OSError:
+            return None
+    
+    def _cached_vlm_score(self, image1_path: str, image2_path: str) -> Optional[float]:
+        key = self._vlm_key(image1_path, image2_path)
+        with self._vlm_scores_lock:
+            score = self._vlm_scores.get(key) if key is not None else None
+            if score is not None:
+                self._vlm_scores.move_to_end(key)
+            return score
+    
+    def _store_vlm_score(self, pair: Tuple[str, str], score: float) -> None:
+        key = self._vlm_key(*pair)
+        if key is None:
+            return
+        with self._vlm_scores_lock:
+            self._vlm_scores[key] = score
+            while len(self._vlm_scores) > self.vlm_cache_size:
+                self._vlm_scores.popitem(last=False)
+    
+    async def _vlm_similarity(self, image1_path: str, image2_path: str):
+# 使用VLM计算图像相似度，失败时返回 None 以便回退
+        cached = self._cached_vlm_score(image1_path, image2_path)
+        if cached is not None:
+            return cached
+        try:
+            vlm_model_name = self.config.get('models', {}).get('vlm_model', 'qwen3-vl')
+            print(f"[VLM API] 使用{vlm_model_name}计算图像相似度: {image1_path} vs {image2_path}")
+            
+            with track_fallbacks() as fallbacks:
+                result = await self.vlm_client.analyze_keyframe_consistency(image1_path, image2_path)
+            
+            # 提取相似度分数
+            similarity = result.get('consistency_analysis', {}).get('overall_consistency', 0.0)
+            print(f"[VLM API] 相似度分数: {similarity}")
+            if not fallbacks:
+                self._store_vlm_score((image1_path, image2_path), similarity)
+            
+            return similarity
+        except Exception as e:
+            print(f"[错误] VLM图像相似度计算失败: {e}")
+            return None
+    
+    def _fallback_clip_similarity(self, image1_path: str, image2_path: str) -> float:
+# VLM 不可用时的相似度：阿里云图像相似度API，其次本地计算
         if ALIBABA_CLOUD_AVAILABLE and self.aliyun_client:
             try:
                 print(f"[阿里云API] 计算图像相似度: {image1_path} vs {image2_path}")
@@ -129,35 +227,22 @@ class SimilarityCalculator:
         
         print(f"[本地计算] 计算图像相似度: {image1_path} vs {image2_path}")
         
-        # 本地实现：读取图像
-        image1 = cv2.imread(image1_path)
-        image2 = cv2.imread(image2_path)
-        
-        if image1 is None or image2 is None:
-            raise ValueError("无法读取图像")
-        
-        # 转换为灰度图
-        gray1 = cv2.cvtColor(image1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
-        
-        # 调整大小以提高计算速度
-        gray1 = cv2.resize(gray1, (128, 128))
-        gray2 = cv2.resize(gray2, (128, 128))
-        
-        # 使用结构相似度作为近似
-        ssim_score = self.calculate_structural_similarity(image1_path, image2_path)
-        
-        # 模拟CLIP相似度，结合SSIM和直方图相似度
-        hist_score = self.calculate_histogram_similarity(
-            cv2.calcHist([image1], [0], None, [256], [0, 256]),
-            cv2.calcHist([image2], [0], None, [256], [0, 256])
-        )
-        
-        # 加权平均
-        result = (ssim_score * 0.7 + hist_score * 0.3)
+        # 本地实现：结合SSIM和直方图相似度模拟CLIP相似度（单次解码）
+        result = self.comparison_engine.compare(image1_path, image2_path)['local_clip_similarity']
         print(f"[本地计算] 相似度分数: {result}")
         return result
     
+    def _prefilter(self, image1_path: str, image2_path: str) -> bool:
+# 感知哈希预筛：图像对为近重复时返回 True（调用方改用本地指标，不请求远程模型）
+        # 哈希距离只用于判定，不作为任何指标的分数；明显不同的图像对同样需要完整计算
+        if self.hash_index is None:
+            return False
+        verdict = self.hash_index.classify(image1_path, image2_path)
+        if verdict['verdict'] != NEAR_DUPLICATE:
+            return False
+        print(f"[pHash预筛] 近重复（汉明距离 {verdict['distance']}），跳过远程相似度计算: {image1_path} vs {image2_path}")
+        return True
+    
     def calculate_histogram_similarity(self, hist1: np.ndarray, hist2: np.ndarray) -> float:
 # 计算直方图相似度
         # 确保直方图是一维的
@@ -174,31 +259,27 @@ class SimilarityCalculator:
     
     def calculate_structural_similarity(self, image1_path: str, image2_path: str) -> float:
 # 计算结构相似度
-        from skimage.metrics import structural_similarity as ssim
-        
-        # 检查文件是否存在
-        if not os.path.exists(image1_path) or not os.path.exists(image2_path):
-            raise FileNotFoundError("图像文件不存在")
-        
-        # 读取图像
-        image1 = cv2.imread(image1_path)
-        image2 = cv2.imread(image2_path)
-        
-        if image1 is None or image2 is None:
-            raise ValueError("无法读取图像")
-        
-        # 转换为灰度图
-        gray1 = cv2.cvtColor(image1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(image2, cv2.COLOR_BGR2GRAY)
-        
-        # 调整图像大小以匹配
-        if gray1.shape != gray2.shape:
-            gray2 = cv2.resize(gray2, gray1.shape[::-1])
-        
-        # 计算SSIM
-        ssim_score, _ = ssim(gray1, gray2, full=True)
-        
-        return ssim_score
+        return self.comparison_engine.compare(image1_path, image2_path)['ssim']
+    
+    def compare_images(self, image1_path: str, image2_path: str) -> Dict[str, float]:
+# 一次计算全部传统视觉指标（ssim / 颜色 / 边缘 / 整体视觉相似度等），每张图只解码一次
+        return self.comparison_engine.compare(image1_path, image2_path)
+    
+    async def compare_images_async(self, image1_path: str, image2_path: str) -> Dict[str, float]:
+# compare_images 的异步版本（在共享线程池中解码、计算）
+        return await run_blocking(self.compare_images, image1_path, image2_path)
+    
+    def calculate_similarity_matrices(self, image_paths: List[str], include_ssim: bool = False) -> Dict[str, Any]:
+# 一次计算一组关键帧两两之间的相似度矩阵（直方图相关性、嵌入余弦、可选 SSIM），每张图只解码、提取一次
+        embeddings = None
+        if self.config.get('use_clip_embeddings'):
+            # 配置开启且 CLIP 可用时用 CLIP 嵌入，否则使用缩略图向量
+            from .deep_feature_extractor import DeepFeatureExtractor
+            
+            clip = DeepFeatureExtractor(self.config.get('deep_features', {})).extract_clip_embeddings(image_paths)
+            if all(e is not None for e in clip):
+                embeddings = np.stack(clip)
+        return self.comparison_engine.similarity_matrices(image_paths, include_ssim, embeddings)
     
     def calculate_color_similarity(self, features1: Dict[str, Any], features2: Dict[str, Any]) -> float:
 # 计算颜色相似度
@@ -220,21 +301,9 @@ class SimilarityCalculator:
         return (sim_b + sim_g + sim_r) / 3
     
     def calculate_overall_visual_similarity(self, image1_path: str, image2_path: str) -> float:
-# 计算整体视觉相似度
-        from .feature_extractor import FeatureExtractor
-        
-        extractor = FeatureExtractor()
-        
-        # 提取特征
-        features1 = extractor.extract_keyframe_features(image1_path)
-        features2 = extractor.extract_keyframe_features(image2_path)
-        
-        # 计算颜色相似度
-        color_sim = self.calculate_color_similarity(features1, features2)
-        
-        # 计算结构相似度
-        ssim_score = self.calculate_structural_similarity(image1_path, image2_path)
-        
-        # 加权平均
-        return (color_sim * 0.6 + ssim_score * 0.4)
-
+# 计算整体视觉相似度（颜色 * 0.6 + SSIM * 0.4）
+        return self.comparison_engine.compare(image1_path, image2_path)['overall_visual_similarity']
+    
+    async def calculate_overall_visual_similarity_async(self, image1_path: str, image2_path: str) -> float:
+# calculate_overall_visual_similarity 的异步版本（在共享线程池中计算）
+        return await run_blocking(self.calculate_overall_visual_similarity, image1_path, image2_path)
@@ -1,14 +1,22 @@
 import os
-import subprocess
-import tempfile
 from typing import List, Dict, Any
 import cv2
 import numpy as np
 
+from .media_scheduler import get_media_scheduler, JOB_CLASS_EXTRACT, PRIORITY_NORMAL
+from .scratch_space import get_scratch_space
+
 class VideoUtils:
-    def __init__(self):
-        """初始化视频处理工具"""
-        pass
+    def __init__(self, priority: int = PRIORITY_NORMAL):
+        """初始化视频处理工具
+        
+        Args:
+            priority: ffmpeg 任务在媒体调度器中的优先级（越小越优先）
+        """
+        self.priority = priority
+        self.scheduler = get_media_scheduler()
+        # 帧与音频输出目录由受管临时空间分配（配额 + LRU 淘汰），用完可调用 release_temp_file 提前释放
+        self.scratch = get_scratch_space()
     
     def extract_keyframes(self, video_path: str, num_keyframes: int = 2) -> List[str]:
         """提取视频关键帧
@@ -28,7 +36,7 @@ class VideoUtils:
         duration = video_info['duration']
         
         keyframe_paths = []
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = self.scratch.allocate('keyframes', small=True).path
         
         try:
             # 计算关键帧提取时间点
@@ -107,7 +115,7 @@ class VideoUtils:
         duration = video_info['duration']
         
         # 创建临时文件
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = self.scratch.allocate('last_frame', small=True).path
         last_frame_path = os.path.join(temp_dir, "last_frame.jpg")
         
         try:
@@ -142,8 +150,8 @@ class VideoUtils:
             output_path
         ]
         
-        # 执行FFmpeg命令
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # 经媒体调度器执行FFmpeg命令
+        result = self.scheduler.run(cmd, JOB_CLASS_EXTRACT, priority=self.priority, timeout=120)
         
         if result.returncode != 0:
             raise RuntimeError(f"FFmpeg命令执行失败: {result.stderr}")
@@ -154,9 +162,15 @@ class VideoUtils:
         Args:
             temp_dir: 临时目录路径
         """
-        import shutil
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        self.scratch.release(temp_dir)
+    
+    def release_temp_file(self, path: str) -> None:
+        """释放本工具返回的帧/音频文件所在的临时目录
+        
+        Args:
+            path: extract_keyframes / get_last_frame / get_first_frame / extract_audio 返回的路径
+        """
+        self.scratch.release(path)
     
     def extract_audio(self, video_path: str) -> str:
         """提取视频中的音频
@@ -170,8 +184,8 @@ class VideoUtils:
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"视频文件不存在: {video_path}")
         
-        # 创建临时文件
-        temp_dir = tempfile.mkdtemp()
+        # 创建临时文件（音频体积较大，放在磁盘层）
+        temp_dir = self.scratch.allocate('audio').path
         audio_path = os.path.join(temp_dir, "audio.wav")
         
         try:
@@ -187,8 +201,8 @@ class VideoUtils:
                 audio_path
             ]
             
-            # 执行FFmpeg命令
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # 经媒体调度器执行FFmpeg命令
+            result = self.scheduler.run(cmd, JOB_CLASS_EXTRACT, priority=self.priority, timeout=600)
             
             if result.returncode != 0:
                 raise RuntimeError(f"FFmpeg命令执行失败: {result.stderr}")
@@ -212,7 +226,7 @@ class VideoUtils:
             第一帧图像路径
         """
         # 创建临时文件
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = self.scratch.allocate('first_frame', small=True).path
         first_frame_path = os.path.join(temp_dir, "first_frame.jpg")
         
         try: